@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки mail_generator.py на локальной заглушке Mail.tm (fake_mailtm.py).
+
+Измеряет скорость массового создания аккаунтов, задержку опроса ящика,
+задержку обнаружения нового письма (SSE и опрос) и получения кода через
+wait_for_code, стоимость добавления и чтения хранилища на 10k–1M
+аккаунтов и скорость экспорта. Результат — JSON; --compare печатает
+изменения относительно прошлого прогона.
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json --compare before.json
+    python benchmark.py --store-sizes 10000,100000,1000000 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import mail_generator as mg  # noqa: E402
+
+STORE_CHUNK = 10000             # аккаунтов на пакет генерации в бенчмарке хранилища
+
+
+# ─────────────────────────── Утилиты ───────────────────────────
+
+def summarize(samples):
+    """Сводка по замерам в секундах: n, mean/p50/p95/max в миллисекундах."""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pct(0.50) * 1000, 3),
+        "p95_ms": round(pct(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def start_fake(args):
+    """Запуск заглушки в отдельном процессе. Возвращает (процесс, URL)."""
+    cmd = [sys.executable, os.path.join(HERE, "fake_mailtm.py"), "--port", "0",
+           "--latency", str(args.latency), "--jitter", str(args.jitter),
+           "--error-rate", str(args.error_rate), "--seed", "1"]
+    if args.rate_limit:
+        cmd += ["--rate-limit", str(args.rate_limit)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    url = proc.stdout.readline().strip()
+    if not url:
+        proc.kill()
+        raise RuntimeError("заглушка Mail.tm не запустилась")
+    return proc, url
+
+
+def new_inbox(domain):
+    """Новый аккаунт на заглушке: (account, token).
+
+    При внедрённых ошибках создание может не удаться — пробуем новые адреса.
+    """
+    for _ in range(10):
+        address = f"{mg.generate_random_username()}@{domain}"
+        password = mg.generate_random_password()
+        account = mg.create_account(address, password)
+        token = account and mg.get_token(address, password)
+        if token:
+            return dict(account, password=password), token
+    raise RuntimeError("не удалось создать ящик на заглушке")
+
+
+def deliver(base_url, address, subject="bench", text="bench"):
+    mg.requests.post(f"{base_url}/_deliver", timeout=10,
+                     json={"address": address, "subject": subject, "text": text})
+
+
+def ensure_no_subscribers(base_url, timeout=2.0):
+    """Проверка, что раунд не оставил на заглушке открытых SSE-подписок.
+
+    Висящие подписки и их потоки опроса конкурировали бы с замерами
+    следующих раундов.
+    """
+    deadline = time.monotonic() + timeout
+    while mg.requests.get(f"{base_url}/_stats", timeout=10).json()["subscribers"]:
+        if time.monotonic() > deadline:
+            raise RuntimeError("на заглушке остались SSE-подписки")
+        time.sleep(0.05)
+
+
+# ─────────────────────────── Сеть ───────────────────────────
+
+def bench_bulk_create(count, workers, domain):
+    started = time.perf_counter()
+    created = sum(1 for _, data in mg.create_accounts_bulk(count, domain, workers) if data)
+    elapsed = time.perf_counter() - started
+    return {
+        "count": count,
+        "workers": workers,
+        "created": created,
+        "seconds": round(elapsed, 3),
+        "accounts_per_sec": round(created / elapsed, 1),
+    }
+
+
+def bench_inbox_poll(base_url, domain, rounds, messages):
+    account, token = new_inbox(domain)
+    for i in range(messages):
+        deliver(base_url, account["address"], f"message {i}")
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        mg.get_messages(token)
+        samples.append(time.perf_counter() - started)
+    return dict(summarize(samples), messages=messages)
+
+
+def bench_detection(base_url, domain, rounds, mode, poll_interval):
+    """Задержка от доставки письма до его выдачи watch_inbox."""
+    account, token = new_inbox(domain)
+    if mode == "stream":
+        mercure_url = f"{base_url}/.well-known/mercure"
+    else:
+        mercure_url = f"{base_url}/no-mercure"      # 404 → опрос
+    streaming = threading.Event()
+    arrived = {}
+    ready = threading.Condition()
+
+    def on_status(state):
+        if state == "stream":
+            streaming.set()
+
+    stop = mg.WatchStop()
+
+    def watch():
+        watcher = mg.watch_inbox(token, account["id"], set(), mercure_url=mercure_url,
+                                 poll_interval=poll_interval, on_status=on_status,
+                                 stop=stop)
+        try:
+            for msg in watcher:
+                with ready:
+                    arrived[msg.get("subject")] = time.perf_counter()
+                    ready.notify_all()
+        finally:
+            watcher.close()
+
+    thread = threading.Thread(target=watch, daemon=True)
+    thread.start()
+    try:
+        if mode == "stream" and not streaming.wait(10):
+            return {"mode": mode, "error": "поток SSE не открылся"}
+        time.sleep(0.2)
+
+        samples = []
+        for i in range(rounds):
+            subject = f"detect {i}"
+            started = time.perf_counter()
+            deliver(base_url, account["address"], subject)
+            with ready:
+                if not ready.wait_for(lambda: subject in arrived,
+                                      timeout=poll_interval * 3 + 10):
+                    continue
+            samples.append(arrived[subject] - started)
+    finally:
+        stop.set()
+        thread.join()
+    ensure_no_subscribers(base_url)
+    return dict(summarize(samples), mode=mode, poll_interval=poll_interval)
+
+
+def bench_code(base_url, domain, rounds, in_body):
+    """Задержка от доставки письма до результата wait_for_code.
+
+    in_body=True — код далеко в тексте, его нет в intro: нужен запрос тела.
+    """
+    account, _ = new_inbox(domain)
+    mg.add_account({"id": account["id"], "address": account["address"],
+                    "password": account["password"], "created_at": ""})
+    samples = []
+    for i in range(rounds):
+        code = f"{100000 + i}"
+        text = ("Lorem ipsum dolor sit amet. " * 20 if in_body else "") + f"Your code: {code}"
+        box = {}
+
+        def waiter():
+            box["found"] = mg.wait_for_code(account["address"], "otp:6", timeout=10,
+                                            mercure_url=f"{base_url}/.well-known/mercure")
+            box["at"] = time.perf_counter()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.3)                 # подписка на поток
+        started = time.perf_counter()
+        deliver(base_url, account["address"], "Verification", text)
+        thread.join()
+        ensure_no_subscribers(base_url)
+        found = box.get("found")
+        if found and found["code"] == code:
+            samples.append(box["at"] - started)
+    return dict(summarize(samples), source="body" if in_body else "intro")
+
+
+# ─────────────────────────── Хранилище и экспорт ───────────────────────────
+
+def bench_store(size):
+    """Добавление, обход, индекс и экспорт на хранилище из size аккаунтов."""
+    workdir = tempfile.mkdtemp(prefix="mailtm-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    mg._store = mg.AccountStore(mg.ACCOUNTS_FILE, mg.ACCOUNTS_JOURNAL)
+    mg._index = None
+    try:
+        result = {"size": size}
+        add_time = 0.0
+        created_at = datetime.now().isoformat()
+        remaining = size
+        while remaining:
+            n = min(STORE_CHUNK, remaining)
+            records = [
+                {"id": f"{i:024x}", "address": f"{user}@fake.test",
+                 "password": password, "created_at": created_at}
+                for i, user, password in zip(
+                    range(size - remaining, size - remaining + n),
+                    mg.generate_usernames(n), mg.generate_passwords(n),
+                )
+            ]
+            started = time.perf_counter()
+            for record in records:
+                mg.add_account(record)
+            add_time += time.perf_counter() - started
+            remaining -= n
+        result["add_us"] = round(add_time / size * 1e6, 2)
+        result["adds_per_sec"] = round(size / add_time)
+
+        started = time.perf_counter()
+        mg._store.compact_bytes = 0         # свернуть независимо от размера журнала
+        mg._store.compact()
+        result["compact_sec"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        count = sum(1 for _ in mg.iter_accounts())
+        result["iter_sec"] = round(time.perf_counter() - started, 3)
+        assert count == size, (count, size)
+
+        started = time.perf_counter()
+        index = mg.get_index()
+        result["index_build_sec"] = round(time.perf_counter() - started, 3)
+        probe = next(iter(mg.iter_accounts()))["address"]
+        samples = []
+        for page in range(0, min(200, size // mg.ACCOUNTS_PAGE_SIZE)):
+            started = time.perf_counter()
+            index.page(page * (size // mg.ACCOUNTS_PAGE_SIZE // 200 or 1))
+            samples.append(time.perf_counter() - started)
+        result["list_page"] = summarize(samples)
+        samples = []
+        for _ in range(200):
+            started = time.perf_counter()
+            index.get(probe)
+            samples.append(time.perf_counter() - started)
+        result["lookup"] = summarize(samples)
+
+        exports = {}
+        for fmt, compress in (("txt", False), ("csv", False), ("jsonl", False), ("jsonl", True)):
+            path = f"export.{fmt}" + (".gz" if compress else "")
+            started = time.perf_counter()
+            mg.export_accounts(path, fmt, compress=compress)
+            elapsed = time.perf_counter() - started
+            exports[path] = {
+                "seconds": round(elapsed, 3),
+                "records_per_sec": round(size / elapsed),
+                "mb_per_sec": round(os.path.getsize(path) / elapsed / 1e6, 1),
+            }
+        result["export"] = exports
+        return result
+    finally:
+        if mg._index is not None:
+            mg._index.close()
+            mg._index = None
+        mg._store.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ─────────────────────────── Сравнение ───────────────────────────
+
+# Сравниваются только замеры (параметры прогона вроде count пропускаются);
+# у *_per_sec больше — лучше, у остальных лучше меньше
+MEASUREMENT_SUFFIXES = ("_ms", "_sec", "_us", "seconds")
+
+
+def _flatten(obj, prefix=""):
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from _flatten(value, f"{prefix}{key}.")
+    elif isinstance(obj, list):
+        for item in obj:
+            label = None
+            if isinstance(item, dict):
+                label = item.get("size", item.get("mode", item.get("source")))
+            yield from _flatten(item, f"{prefix}{label}.")
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        yield prefix[:-1], obj
+
+
+def compare(old, new):
+    """Строки «метрика: было → стало (изменение)» для общих метрик."""
+    before = dict(_flatten(old.get("results", {})))
+    lines = []
+    for name, value in _flatten(new.get("results", {})):
+        if not name.endswith(MEASUREMENT_SUFFIXES) or not before.get(name):
+            continue
+        ratio = value / before[name]
+        better = ratio > 1 if name.endswith("per_sec") else ratio < 1
+        mark = "+" if better else "-" if ratio != 1 else " "
+        lines.append(f"{mark} {name}: {before[name]} → {value} ({(ratio - 1) * 100:+.1f}%)")
+    return lines
+
+
+# ─────────────────────────── Точка входа ───────────────────────────
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки mail_generator на заглушке Mail.tm.")
+    parser.add_argument("--output", "-o", default="-", help="файл JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", metavar="JSON", help="сравнить с прошлым результатом")
+    parser.add_argument("--only", help="через запятую: create,poll,detect,code,store")
+    parser.add_argument("--create", type=int, default=200, help="аккаунтов для bulk create")
+    parser.add_argument("--workers", type=int, default=mg.BULK_WORKERS)
+    parser.add_argument("--rounds", type=int, default=50, help="замеров опроса и обнаружения")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--store-sizes", default="10000,100000",
+                        help="размеры хранилища через запятую (например 10000,1000000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка заглушки, сек")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="лимит запросов/сек у заглушки и клиента (0 — без лимита)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    only = set(args.only.split(",")) if args.only else {"create", "poll", "detect", "code", "store"}
+
+    mg.UI_STREAM = sys.stderr
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="mailtm-bench-")
+    cwd = os.getcwd()
+    proc = None
+    try:
+        if only & {"create", "poll", "detect", "code"}:
+            proc, url = start_fake(args)
+            # Хранилище и кэши — во временном каталоге, а не в рабочем
+            os.chdir(workdir)
+            mg._store = mg.AccountStore(mg.ACCOUNTS_FILE, mg.ACCOUNTS_JOURNAL)
+            mg.token_cache.persist = False
+            mg.client = mg.MailTmClient(url, rate_limit=args.rate_limit or None)
+            domain = mg.get_available_domains()[0]
+            if "create" in only:
+                results["bulk_create"] = bench_bulk_create(args.create, args.workers, domain)
+            if "poll" in only:
+                results["inbox_poll"] = bench_inbox_poll(url, domain, args.rounds, 30)
+            if "detect" in only:
+                results["detection"] = [
+                    bench_detection(url, domain, args.rounds, "stream", args.poll_interval),
+                    bench_detection(url, domain, max(5, args.rounds // 5), "polling",
+                                    args.poll_interval),
+                ]
+            if "code" in only:
+                rounds = max(5, args.rounds // 5)
+                results["code"] = [
+                    bench_code(url, domain, rounds, in_body=False),
+                    bench_code(url, domain, rounds, in_body=True),
+                ]
+            mg._store.close()
+            os.chdir(cwd)
+        if "store" in only:
+            results["store"] = [bench_store(int(n)) for n in args.store_sizes.split(",")]
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            for line in compare(json.load(f), report):
+                print(line, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Mail.tm API для тестов и бенчмарков.
+
+Реализует эндпоинты, которыми пользуется mail_generator.py: /domains,
+/accounts, /token, /me, /messages, /messages/{id} (и вложения), удаление
+писем и аккаунтов, а также Mercure-подписку /.well-known/mercure.
+Задержку, rate limit и ошибки можно настроить.
+
+Письма доставляются вызовом FakeMailTm.deliver() или запросом
+POST /_deliver {"address", "subject", "text", "from"}. GET /_stats
+возвращает число запросов и активных SSE-подписок.
+
+    python fake_mailtm.py --port 8025 --latency 0.05 --rate-limit 8
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import queue
+import random
+import secrets
+import select
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# ─────────────────────────── Конфигурация ───────────────────────────
+DEFAULT_DOMAINS = ("fake.test",)
+PAGE_SIZE = 30                  # писем на страницу (как в Mail.tm)
+TOKEN_TTL = 3600                # секунд жизни выдаваемого JWT
+SSE_HEARTBEAT = 15              # секунд между комментариями-пингами SSE
+SSE_DISCONNECT_CHECK = 0.1      # секунд между проверками, не ушёл ли подписчик
+ERROR_STATUSES = (500, 502, 503)
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+# ─────────────────────────── Состояние ───────────────────────────
+
+class FakeMailTm:
+    """Состояние и HTTP-сервер заглушки.
+
+    latency/jitter — задержка каждого ответа (сек), rate_limit — запросов
+    в секунду (сверх лимита — 429 с Retry-After), error_rate — доля ответов
+    500/502/503 без обработки запроса, drop_rate — доля запросов, которые
+    обрабатываются, но остаются без ответа (разрыв соединения).
+    """
+
+    def __init__(self, domains=DEFAULT_DOMAINS, latency=0.0, jitter=0.0,
+                 rate_limit=None, error_rate=0.0, drop_rate=0.0,
+                 token_ttl=TOKEN_TTL, seed=None):
+        self.domains = list(domains)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.token_ttl = token_ttl
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._accounts = {}         # id -> account
+        self._by_address = {}       # address -> id
+        self._tokens = {}           # token -> (account id, exp)
+        self._messages = {}         # account id -> [message] (новые в конце)
+        self._message_index = {}    # message id -> message
+        self._blobs = {}            # (message id, attachment id) -> bytes
+        self._subscribers = {}      # account id -> [queue.Queue]
+        self._bucket_tokens = 1.0
+        self._bucket_updated = time.monotonic()
+        self.requests = 0
+        self.server = None
+
+    # ── Запуск ──
+
+    def start(self, host="127.0.0.1", port=0):
+        """Запуск сервера в фоновом потоке. Возвращает базовый URL."""
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.server = _Server((host, port), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def mercure_url(self):
+        return f"{self.base_url}/.well-known/mercure"
+
+    def stop(self):
+        """Остановка сервера и закрытие SSE-подписок."""
+        with self._lock:
+            for queues in self._subscribers.values():
+                for q in queues:
+                    q.put(None)
+            self._subscribers.clear()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    # ── Ограничения ──
+
+    def _retry_after(self):
+        """0, если запрос укладывается в rate limit, иначе пауза в секундах."""
+        if not self.rate_limit:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._bucket_tokens = min(
+                1.0, self._bucket_tokens + (now - self._bucket_updated) * self.rate_limit
+            )
+            self._bucket_updated = now
+            if self._bucket_tokens >= 1:
+                self._bucket_tokens -= 1
+                return 0
+            return (1 - self._bucket_tokens) / self.rate_limit
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+
+    def _roll(self, rate):
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    # ── Аккаунты и токены ──
+
+    def create_account(self, address, password):
+        local, _, domain = address.partition("@")
+        if not local or domain not in self.domains:
+            return 422, {"detail": "address: This value is not valid."}
+        with self._lock:
+            if address in self._by_address:
+                return 422, {"detail": "address: This value is already used."}
+            account = {
+                "@context": "/contexts/Account",
+                "@id": None,
+                "@type": "Account",
+                "id": secrets.token_hex(12),
+                "address": address,
+                "quota": 40000000,
+                "used": 0,
+                "isDisabled": False,
+                "isDeleted": False,
+                "createdAt": _now_iso(),
+                "updatedAt": _now_iso(),
+            }
+            account["@id"] = f"/accounts/{account['id']}"
+            self._accounts[account["id"]] = dict(account, password=password)
+            self._by_address[address] = account["id"]
+            self._messages[account["id"]] = []
+        return 201, account
+
+    def issue_token(self, address, password):
+        with self._lock:
+            account = self._accounts.get(self._by_address.get(address))
+            if not account or account["password"] != password:
+                return None
+            exp = int(time.time() + self.token_ttl)
+            payload = {"iat": int(time.time()), "exp": exp,
+                       "username": address, "id": account["id"]}
+            token = ".".join((
+                _b64(b'{"typ":"JWT","alg":"none"}'),
+                _b64(json.dumps(payload).encode()),
+                _b64(secrets.token_bytes(16)),
+            ))
+            self._tokens[token] = (account["id"], exp)
+            return account["id"], token
+
+    def _account_for(self, token):
+        with self._lock:
+            entry = self._tokens.get(token)
+            if not entry or entry[1] < time.time():
+                return None
+            return self._accounts.get(entry[0])
+
+    def account_view(self, account):
+        return {k: v for k, v in account.items() if k != "password"}
+
+    def delete_account(self, account_id):
+        with self._lock:
+            account = self._accounts.pop(account_id, None)
+            if account is None:
+                return False
+            self._by_address.pop(account["address"], None)
+            for msg in self._messages.pop(account_id, []):
+                self._message_index.pop(msg["id"], None)
+            self._tokens = {t: e for t, e in self._tokens.items() if e[0] != account_id}
+            for q in self._subscribers.pop(account_id, []):
+                q.put(None)
+            return True
+
+    # ── Письма ──
+
+    def deliver(self, address, subject="Test", text="", sender="sender@example.com",
+                html=None, attachments=()):
+        """Доставка письма в ящик. attachments — пары (filename, bytes).
+
+        Возвращает краткие данные письма или None, если ящика нет.
+        """
+        with self._lock:
+            account_id = self._by_address.get(address)
+            if account_id is None:
+                return None
+            msg_id = secrets.token_hex(12)
+            atts = []
+            for n, (filename, data) in enumerate(attachments, 1):
+                att_id = f"ATTACH{n:06d}"
+                self._blobs[(msg_id, att_id)] = data
+                atts.append({
+                    "id": att_id,
+                    "filename": filename,
+                    "contentType": "application/octet-stream",
+                    "disposition": "attachment",
+                    "transferEncoding": "base64",
+                    "related": False,
+                    "size": len(data),
+                    "downloadUrl": f"/messages/{msg_id}/attachment/{att_id}",
+                })
+            message = {
+                "@id": f"/messages/{msg_id}",
+                "@type": "Message",
+                "id": msg_id,
+                "accountId": f"/accounts/{account_id}",
+                "msgid": f"<{msg_id}@fake.test>",
+                "from": {"address": sender, "name": sender.split("@")[0]},
+                "to": [{"address": address, "name": ""}],
+                "subject": subject,
+                "intro": " ".join(text.split())[:120],
+                "seen": False,
+                "isDeleted": False,
+                "hasAttachments": bool(atts),
+                "size": len(text) + sum(a["size"] for a in atts),
+                "downloadUrl": f"/messages/{msg_id}/download",
+                "createdAt": _now_iso(),
+                "updatedAt": _now_iso(),
+                "text": text,
+                "html": [html] if html else [],
+                "attachments": atts,
+            }
+            self._messages[account_id].append(message)
+            self._message_index[msg_id] = message
+            self._accounts[account_id]["used"] += message["size"]
+            summary = self._summary(message)
+            for q in self._subscribers.get(account_id, []):
+                q.put((msg_id, summary))
+        return summary
+
+    @staticmethod
+    def _summary(message):
+        return {k: v for k, v in message.items() if k not in ("text", "html", "attachments")}
+
+    def list_messages(self, account_id, page):
+        with self._lock:
+            messages = self._messages.get(account_id, [])
+            newest_first = messages[::-1]
+            start = (page - 1) * PAGE_SIZE
+            members = [self._summary(m) for m in newest_first[start:start + PAGE_SIZE]]
+            return {
+                "hydra:member": members,
+                "hydra:totalItems": len(messages),
+            }
+
+    def get_message(self, account_id, message_id):
+        with self._lock:
+            message = self._message_index.get(message_id)
+            if not message or message["accountId"] != f"/accounts/{account_id}":
+                return None
+            return dict(message)
+
+    def delete_message(self, account_id, message_id):
+        with self._lock:
+            message = self._message_index.get(message_id)
+            if not message or message["accountId"] != f"/accounts/{account_id}":
+                return False
+            del self._message_index[message_id]
+            self._messages[account_id].remove(message)
+            return True
+
+    def attachment(self, account_id, message_id, att_id):
+        if not self.get_message(account_id, message_id):
+            return None
+        return self._blobs.get((message_id, att_id))
+
+    # ── Mercure ──
+
+    def subscribe(self, account_id):
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(account_id, []).append(q)
+        return q
+
+    def unsubscribe(self, account_id, q):
+        with self._lock:
+            queues = self._subscribers.get(account_id, [])
+            if q in queues:
+                queues.remove(q)
+
+    def subscriber_count(self):
+        """Число открытых SSE-подписок."""
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+
+# ─────────────────────────── HTTP ───────────────────────────
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл keep-alive соединение или оборвал запрос — не ошибка
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, obj=None, headers=None, body=None, content_type=None):
+        if body is None:
+            body = b"" if obj is None else json.dumps(obj).encode("utf-8")
+            content_type = content_type or "application/ld+json; charset=utf-8"
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        if not self._raw_body:
+            return {}
+        try:
+            data = json.loads(self._raw_body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _token(self):
+        auth = self.headers.get("Authorization", "")
+        return auth[7:] if auth.startswith("Bearer ") else None
+
+    def _dispatch(self, method):
+        fake = self.fake
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip("/") or "/"
+        query = parse_qs(parts.query)
+        # Тело читается до любых проверок: ответ 429 или ошибка без чтения
+        # оставили бы его в keep-alive соединении началом следующего запроса
+        length = int(self.headers.get("Content-Length") or 0)
+        self._raw_body = self.rfile.read(length) if length else b""
+        # Служебные запросы — без задержек, лимитов и ошибок
+        if path == "/_deliver" and method == "POST":
+            return self._deliver()
+        if path == "/_stats" and method == "GET":
+            return self._send(200, {"requests": fake.requests,
+                                    "subscribers": fake.subscriber_count()})
+        if path == "/.well-known/mercure" and method == "GET":
+            return self._mercure(query)
+
+        fake.requests += 1
+        fake._delay()
+        retry_after = fake._retry_after()
+        if retry_after:
+            return self._send(429, {"detail": "Too Many Requests"},
+                              headers={"Retry-After": str(max(1, round(retry_after)))})
+        if fake._roll(fake.error_rate):
+            status = fake._random.choice(ERROR_STATUSES)
+            return self._send(status, {"detail": "injected error"})
+        drop = fake._roll(fake.drop_rate)
+        status, obj, headers, body = self._route(method, path, query)
+        if drop:
+            # Запрос обработан, но ответ «потерян»
+            self.close_connection = True
+            return
+        if body is not None:
+            return self._send(status, headers=headers, body=body,
+                              content_type="application/octet-stream")
+        return self._send(status, obj, headers=headers)
+
+    def _route(self, method, path, query):
+        fake = self.fake
+        segments = path.strip("/").split("/")
+
+        if method == "GET" and path == "/domains":
+            members = [{"@type": "Domain", "id": hashlib.md5(d.encode()).hexdigest()[:24],
+                        "domain": d, "isActive": True, "isPrivate": False}
+                       for d in fake.domains]
+            return 200, {"hydra:member": members, "hydra:totalItems": len(members)}, None, None
+
+        if method == "POST" and path in ("/accounts", "/token"):
+            data = self._body()
+            if not data or not data.get("address") or not data.get("password"):
+                return 400, {"detail": "address and password are required"}, None, None
+            if path == "/accounts":
+                status, obj = fake.create_account(data["address"], data["password"])
+                return status, obj, None, None
+            issued = fake.issue_token(data["address"], data["password"])
+            if not issued:
+                return 401, {"code": 401, "message": "Invalid credentials."}, None, None
+            account_id, token = issued
+            return 200, {"id": account_id, "token": token}, None, None
+
+        account = fake._account_for(self._token())
+        if account is None:
+            return 401, {"code": 401, "message": "JWT Token not found"}, None, None
+        account_id = account["id"]
+
+        if method == "GET" and path == "/me":
+            return 200, fake.account_view(account), None, None
+        if segments[0] == "accounts" and len(segments) == 2:
+            if segments[1] != account_id:
+                return 403, {"detail": "Access Denied."}, None, None
+            if method == "GET":
+                return 200, fake.account_view(account), None, None
+            if method == "DELETE":
+                fake.delete_account(account_id)
+                return 204, None, None, None
+        if segments[0] == "messages":
+            if method == "GET" and len(segments) == 1:
+                try:
+                    page = max(1, int(query.get("page", ["1"])[0]))
+                except ValueError:
+                    page = 1
+                return 200, fake.list_messages(account_id, page), None, None
+            if len(segments) == 2:
+                if method == "GET":
+                    message = fake.get_message(account_id, segments[1])
+                    if message:
+                        return 200, message, None, None
+                elif method == "DELETE":
+                    if fake.delete_message(account_id, segments[1]):
+                        return 204, None, None, None
+                return 404, {"detail": "Not Found"}, None, None
+            if method == "GET" and len(segments) == 4 and segments[2] == "attachment":
+                data = fake.attachment(account_id, segments[1], segments[3])
+                if data is not None:
+                    return 200, None, None, data
+                return 404, {"detail": "Not Found"}, None, None
+        return 404, {"detail": "Not Found"}, None, None
+
+    def _deliver(self):
+        data = self._body()
+        if not data or not data.get("address"):
+            return self._send(400, {"detail": "address is required"})
+        summary = self.fake.deliver(
+            data["address"], data.get("subject", "Test"), data.get("text", ""),
+            data.get("from", "sender@example.com"), data.get("html"),
+        )
+        if summary is None:
+            return self._send(404, {"detail": "Not Found"})
+        return self._send(201, summary)
+
+    def _mercure(self, query):
+        account = self.fake._account_for(self._token())
+        topic = (query.get("topic") or [""])[0]
+        if account is None or topic != f"/accounts/{account['id']}":
+            return self._send(401, {"detail": "Unauthorized"})
+        q = self.fake.subscribe(account["id"])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(b":ok\n\n")
+            self.wfile.flush()
+            last_write = time.monotonic()
+            while True:
+                try:
+                    item = q.get(timeout=SSE_DISCONNECT_CHECK)
+                except queue.Empty:
+                    # Ушедшего клиента видно сразу, а не на следующем пинге:
+                    # иначе подписка висит до SSE_HEARTBEAT секунд
+                    if self._client_gone():
+                        return
+                    if time.monotonic() - last_write >= SSE_HEARTBEAT:
+                        self.wfile.write(b":\n\n")
+                        self.wfile.flush()
+                        last_write = time.monotonic()
+                    continue
+                if item is None:
+                    return
+                event_id, payload = item
+                self.wfile.write(
+                    f"id: {event_id}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+                )
+                self.wfile.flush()
+                last_write = time.monotonic()
+        except OSError:
+            pass
+        finally:
+            self.fake.unsubscribe(account["id"], q)
+
+    def _client_gone(self):
+        """Клиент закрыл соединение: сокет читается, но данных нет."""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+# ─────────────────────────── Точка входа ───────────────────────────
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная замена Mail.tm API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025, help="0 — свободный порт")
+    parser.add_argument("--domain", action="append", dest="domains",
+                        help=f"домен (можно несколько, по умолчанию {DEFAULT_DOMAINS[0]})")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, сек")
+    parser.add_argument("--rate-limit", type=float, help="запросов в секунду (иначе без лимита)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 5xx")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="доля обработанных запросов без ответа")
+    parser.add_argument("--token-ttl", type=int, default=TOKEN_TTL, help="жизнь JWT, сек")
+    parser.add_argument("--seed", type=int, help="зерно генератора ошибок")
+    args = parser.parse_args(argv)
+
+    fake = FakeMailTm(
+        domains=args.domains or DEFAULT_DOMAINS, latency=args.latency,
+        jitter=args.jitter, rate_limit=args.rate_limit, error_rate=args.error_rate,
+        drop_rate=args.drop_rate, token_ttl=args.token_ttl, seed=args.seed,
+    )
+    # Первая строка stdout — адрес сервера (читается бенчмарком)
+    print(fake.start(args.host, args.port), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
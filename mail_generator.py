@@ -17,19 +17,115 @@
 Powered by Mail.tm API — https://docs.mail.tm
 """
 
-import requests
 import json
 import string
 import random
+import secrets
+import hashlib
+import math
 import time
 import os
 import sys
-from datetime import datetime
+import atexit
+import threading
+import base64
+import heapq
+import itertools
+import importlib
+import re
+import email.utils
+import contextlib
+import fnmatch
+import io
+import csv
+import gzip
+import shutil
+import tempfile
+from datetime import timedelta
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import datetime, timezone
+from html import unescape as html_unescape
+
+
+class _LazyModule:
+    """Модуль, импортируемый при первом обращении (быстрый старт CLI)."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+requests = _LazyModule("requests")
+urllib3 = _LazyModule("urllib3")
+asyncio = _LazyModule("asyncio")
+ssl = _LazyModule("ssl")
+sqlite3 = _LazyModule("sqlite3")
 
 # ─────────────────────────── Конфигурация ───────────────────────────
 API_BASE = "https://api.mail.tm"
 ACCOUNTS_FILE = "generated_accounts.json"
+ACCOUNTS_JOURNAL = "generated_accounts.jsonl"
+QUARANTINE_FILE = "quarantined_accounts.jsonl"  # мёртвые аккаунты после проверки
+ACCOUNTS_FSYNC_EVERY = 32       # fsync журнала раз в N добавлений
+ACCOUNTS_COMPACT_BYTES = 4 << 20  # свёртка журнала в снимок после N байт
+ACCOUNTS_INDEX_FILE = "generated_accounts.idx.db"
+ACCOUNTS_PAGE_SIZE = 20         # аккаунтов на страницу в списках и выборе
 HEADERS = {"Content-Type": "application/json"}
+API_TIMEOUT = 10                # секунд на запрос
+API_POOL_SIZE = 16              # keep-alive соединений в пуле
+API_RATE_LIMIT = 8              # запросов в секунду (лимит Mail.tm)
+API_RETRIES = 4                 # попыток на запрос (с первой)
+API_RETRY_BASE = 0.5            # базовая пауза перед повтором, сек
+API_RETRY_CAP = 30              # максимальная пауза перед повтором, сек
+CIRCUIT_THRESHOLD = 5           # неудач подряд до размыкания цепи
+CIRCUIT_RESET_TIMEOUT = 30      # секунд до пробного запроса
+SHARD_FAILURE_THRESHOLD = 3     # ошибок подряд, после которых API считается нездоровым
+SHARD_COOLDOWN = 30             # секунд, на которые нездоровый API исключается
+DOMAIN_STRATEGY = "round-robin"  # выбор домена: round-robin или weighted
+BULK_WORKERS = 8                # потоков при массовой генерации/удалении
+EXPORT_BUFFER_SIZE = 1 << 20    # буфер записи экспорта (байт)
+EXPORT_FIELDS = ("address", "password", "id", "created_at")
+ASYNC_MAX_CONCURRENCY = 256     # одновременных запросов в async-клиенте
+TOKENS_FILE = "generated_tokens.json"
+TOKEN_CACHE_PERSIST = True      # сохранять токены между запусками
+TOKEN_REFRESH_MARGIN = 60       # обновлять токен за N секунд до истечения
+TOKEN_DEFAULT_TTL = 600         # срок жизни токена без поля exp
+MERCURE_URL = "https://mercure.mail.tm/.well-known/mercure"
+POLL_INTERVAL = 5               # секунд между опросами, если поток SSE недоступен
+SSE_READ_TIMEOUT = 60           # секунд тишины до переподключения к SSE
+SSE_BACKOFF_MIN = 1             # начальная пауза перед переподключением
+SSE_BACKOFF_MAX = 60            # максимальная пауза перед переподключением
+WATCH_WORKERS = 8               # потоков опроса в мульти-мониторинге
+WATCH_MIN_INTERVAL = 2          # интервал опроса недавно активного ящика
+WATCH_MAX_INTERVAL = 60         # интервал опроса давно молчащего ящика
+WATCH_ACTIVE_WINDOW = 300       # «недавно активный» — письмо за N секунд
+MIRROR_FILE = "messages_mirror.db"
+MIRROR_FULL_SYNC_INTERVAL = 300  # полная сверка зеркала с сервером раз в N секунд
+DOMAINS_FILE = "domains_cache.json"
+DOMAINS_TTL = 3600              # секунд до фонового обновления списка доменов
+ATTACHMENTS_DIR = "attachments"
+ATTACHMENTS_MANIFEST = "manifest.db"
+DOWNLOAD_CHUNK_SIZE = 64 << 10  # байт на чтение при загрузке вложений
+DOWNLOAD_WORKERS = 8            # потоков загрузки вложений
+CODE_DEFAULT_RULES = ("otp",)   # правила wait_for_code по умолчанию
+CODE_TIMEOUT = 120              # секунд ожидания письма с кодом
+CODE_INTRO_MAX = 100            # intro такой длины могло быть обрезано сервером
+POOL_SIZE = 20                  # готовых ящиков в пуле
+POOL_ENDPOINT = "127.0.0.1:8026"  # адрес демона пула (или unix:/путь/к/сокету)
+POOL_LEASE_TTL = 600            # секунд до принудительного возврата ящика
+POOL_MAX_WAIT = 60              # максимальное ожидание свободного ящика, сек
+POOL_WORKERS = 4                # потоков пополнения пула
+POOL_JANITOR_INTERVAL = 1       # секунд между проходами уборщика пула
+POOL_LEASES_FILE = "pool_leases.jsonl"  # журнал выдач пула (переживает аварийный выход)
+METRICS_DUMP_INTERVAL = 15      # секунд между записями метрик в файл
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
 # ─────────────────────────── Цвета терминала ───────────────────────────
 class Colors:
@@ -45,10 +141,25 @@ class Colors:
 
 C = Colors()
 
+# Поток для служебных сообщений print_*; в пакетном режиме — stderr,
+# чтобы stdout оставался чистым JSON.
+UI_STREAM = None
+
+
+def disable_colors():
+    """Отключение ANSI-цветов (вывод не в терминал)."""
+    for name in vars(Colors):
+        if name.isupper():
+            setattr(C, name, "")
+
 # ─────────────────────────── Утилиты ───────────────────────────
 
 def clear_screen():
-    os.system("cls" if os.name == "nt" else "clear")
+    if os.name == "nt":
+        os.system("cls")
+    else:
+        sys.stdout.write("\033[2J\033[H")
+        sys.stdout.flush()
 
 
 def print_banner():
@@ -70,77 +181,1526 @@ def print_banner():
 
 
 def print_separator():
-    print(f"{C.DIM}{'─' * 62}{C.RESET}")
+    print(f"{C.DIM}{'─' * 62}{C.RESET}", file=UI_STREAM)
 
 
 def print_success(msg):
-    print(f"  {C.GREEN}✅ {msg}{C.RESET}")
+    print(f"  {C.GREEN}✅ {msg}{C.RESET}", file=UI_STREAM)
 
 
 def print_error(msg):
-    print(f"  {C.RED}❌ {msg}{C.RESET}")
+    print(f"  {C.RED}❌ {msg}{C.RESET}", file=UI_STREAM)
 
 
 def print_info(msg):
-    print(f"  {C.CYAN}ℹ️  {msg}{C.RESET}")
+    print(f"  {C.CYAN}ℹ️  {msg}{C.RESET}", file=UI_STREAM)
 
 
 def print_warning(msg):
-    print(f"  {C.YELLOW}⚠️  {msg}{C.RESET}")
+    print(f"  {C.YELLOW}⚠️  {msg}{C.RESET}", file=UI_STREAM)
+
+
+USERNAME_CHARS = string.ascii_lowercase + string.digits
+PASSWORD_SPECIALS = "!@#$%&*"
+PASSWORD_CHARS = string.ascii_letters + string.digits + PASSWORD_SPECIALS
 
 
 def generate_random_username(length=10):
     """Генерация случайного имени пользователя."""
-    chars = string.ascii_lowercase + string.digits
-    return "".join(random.choice(chars) for _ in range(length))
+    return "".join(secrets.choice(USERNAME_CHARS) for _ in range(length))
 
 
 def generate_random_password(length=16):
     """Генерация случайного пароля."""
-    chars = string.ascii_letters + string.digits + "!@#$%&*"
     password = [
-        random.choice(string.ascii_uppercase),
-        random.choice(string.ascii_lowercase),
-        random.choice(string.digits),
-        random.choice("!@#$%&*"),
+        secrets.choice(string.ascii_uppercase),
+        secrets.choice(string.ascii_lowercase),
+        secrets.choice(string.digits),
+        secrets.choice(PASSWORD_SPECIALS),
     ]
-    password += [random.choice(chars) for _ in range(length - 4)]
-    random.shuffle(password)
+    password += [secrets.choice(PASSWORD_CHARS) for _ in range(length - 4)]
+    secrets.SystemRandom().shuffle(password)
     return "".join(password)
 
 
 # ─────────────────────────── Хранилище аккаунтов ───────────────────────────
+#
+# Хранилище = снимок (ACCOUNTS_FILE, JSON-массив) + журнал (ACCOUNTS_JOURNAL,
+# JSONL). Новые аккаунты дописываются в журнал одной строкой — O(1) вместо
+# полной перезаписи файла. Когда журнал разрастается, он сворачивается в снимок.
+# Снимок пишется по одной записи на строку, оставаясь валидным JSON, поэтому
+# старые файлы generated_accounts.json читаются без миграции и переписываются
+# в новом виде при первом сворачивании.
+#
+# Несколько процессов могут писать одновременно: запись в журнал — один
+# системный вызов write() в режиме O_APPEND под разделяемой блокировкой
+# (процессы не мешают друг другу), а свёртка и перезапись снимка — под
+# эксклюзивной блокировкой, с атомарной заменой файла через os.replace().
+# Журнал при свёртке обнуляется на месте, поэтому открытые в других
+# процессах дескрипторы остаются действительными.
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class StoreError(Exception):
+    """Файл хранилища повреждён и не может быть прочитан."""
+
+
+class _FileLock:
+    """Межпроцессная блокировка на отдельном файле (flock / msvcrt).
+
+    Повторный захват в том же потоке лишь увеличивает счётчик; запрос
+    эксклюзивной блокировки поверх разделяемой повышает её.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+
+    def _lock(self, exclusive):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        elif not self._depth:
+            # msvcrt не умеет разделяемых блокировок — всегда эксклюзивная
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+
+    def acquire(self, exclusive):
+        if not self._depth or (exclusive and not self._exclusive):
+            self._lock(exclusive)
+            self._exclusive = self._exclusive or exclusive
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth:
+            return
+        self._exclusive = False
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+
+class AccountStore:
+    """Хранилище аккаунтов: снимок + журнал добавлений."""
+
+    def __init__(self, snapshot_path, journal_path,
+                 fsync_every=ACCOUNTS_FSYNC_EVERY,
+                 compact_bytes=ACCOUNTS_COMPACT_BYTES):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.fsync_every = fsync_every
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._file_lock = _FileLock(f"{snapshot_path}.lock")
+        self._journal_fd = None
+        self._unsynced = 0
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        """Блокировка потоков процесса + межпроцессная блокировка файла."""
+        with self._lock:
+            self._file_lock.acquire(exclusive)
+            try:
+                yield
+            finally:
+                self._file_lock.release()
+
+    # ── Чтение ──
+
+    @staticmethod
+    def _open(path):
+        try:
+            return open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _copy(path):
+        """Копия файла во временном файле рядом с ним (None, если файла нет)."""
+        try:
+            src = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        tmp = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with src:
+                shutil.copyfileobj(src, tmp)
+            tmp.seek(0)
+        except BaseException:
+            tmp.close()
+            raise
+        return io.TextIOWrapper(tmp, encoding="utf-8")
+
+    def _iter_snapshot(self, f=None):
+        """Записи снимка по одной, без чтения файла целиком.
+
+        Снимок в формате «одна запись на строку» читается построчно; старый
+        JSON-массив (indent=2 или в одну строку, включая "[]") — целиком через
+        json.load. Записи, не являющиеся объектами, пропускаются. Повреждённый
+        снимок вызывает StoreError, а не молча превращается в пустой список.
+        f — уже открытый снимок или его копия.
+        """
+        if f is None:
+            f = self._open(self.snapshot_path)
+            if f is None:
+                return
+        with f:
+            yielded = False
+            for line in f:
+                line = line.strip().rstrip(",")
+                if line in ("", "[", "]"):
+                    continue
+                if not yielded and line.startswith("["):
+                    yield from self._read_array(f)
+                    return
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    if yielded:
+                        raise StoreError(f"{self.snapshot_path}: повреждённая запись")
+                    yield from self._read_array(f)
+                    return
+                if isinstance(record, dict):
+                    yielded = True
+                    yield record
+
+    def _read_array(self, f):
+        """Снимок старого формата: JSON-массив целиком."""
+        f.seek(0)
+        try:
+            records = json.load(f)
+        except json.JSONDecodeError as e:
+            raise StoreError(f"{self.snapshot_path}: {e}") from e
+        if not isinstance(records, list):
+            raise StoreError(f"{self.snapshot_path}: ожидался список аккаунтов")
+        return [record for record in records if isinstance(record, dict)]
+
+    def _iter_journal(self, f=None):
+        if f is None:
+            f = self._open(self.journal_path)
+            if f is None:
+                return
+        with f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная запись после аварийного завершения
+                    continue
+                if isinstance(record, dict):
+                    yield record
+
+    def _read_snapshot(self):
+        return list(self._iter_snapshot())
+
+    def _read_journal(self):
+        return list(self._iter_journal())
+
+    def iter(self):
+        """Обход аккаунтов по состоянию на момент вызова.
+
+        Под разделяемой блокировкой фиксируется содержимое файлов: снимок
+        остаётся открытым (его заменяют целиком через os.replace), а журнал,
+        который свёртка обнуляет на месте, копируется во временный файл.
+        Записи читаются из них по одной и уже без блокировки: память не
+        зависит от размера хранилища, а вызывающий может сколь угодно долго
+        работать с каждым аккаунтом, не задерживая запись других процессов.
+        """
+        with self._locked(exclusive=False):
+            # С msvcrt открытый снимок не дал бы другим процессам заменить
+            # его — там снимок тоже копируется
+            snapshot = (self._open if fcntl else self._copy)(self.snapshot_path)
+            try:
+                journal = self._copy(self.journal_path)
+            except BaseException:
+                if snapshot:
+                    snapshot.close()
+                raise
+        with contextlib.ExitStack() as files:
+            for f in (snapshot, journal):
+                if f:
+                    files.enter_context(f)
+            if snapshot:
+                yield from self._iter_snapshot(snapshot)
+            if journal:
+                yield from self._iter_journal(journal)
+
+    def load(self):
+        """Полный список аккаунтов: снимок + журнал."""
+        with self._locked(exclusive=False):
+            return self._load_unlocked()
+
+    def _load_unlocked(self):
+        accounts = self._read_snapshot()
+        accounts.extend(self._read_journal())
+        return accounts
+
+    # ── Запись ──
+
+    def _journal_fileno(self):
+        if self._journal_fd is None:
+            self._journal_fd = os.open(
+                self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+            )
+        return self._journal_fd
+
+    def _sync(self):
+        if self._journal_fd is not None and self._unsynced:
+            os.fsync(self._journal_fd)
+            self._unsynced = 0
+
+    def _write_snapshot(self, accounts):
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for i, acc in enumerate(accounts):
+                f.write(json.dumps(acc, ensure_ascii=False))
+                f.write(",\n" if i < len(accounts) - 1 else "\n")
+            f.write("]\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _truncate_journal(self):
+        # Обнуление на месте: чужие O_APPEND-дескрипторы продолжат писать
+        # в тот же файл, уже с начала.
+        if os.path.exists(self.journal_path):
+            os.truncate(self.journal_path, 0)
+        self._unsynced = 0
+
+    def add(self, account_data):
+        """Добавление аккаунта одной строкой в журнал."""
+        line = (json.dumps(account_data, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked(exclusive=False):
+            fd = self._journal_fileno()
+            os.write(fd, line)
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+            size = os.fstat(fd).st_size
+        if size >= self.compact_bytes:
+            self.compact()
+
+    def save(self, accounts):
+        """Полная перезапись хранилища.
+
+        Записи, добавленные другими процессами после чтения accounts, будут
+        потеряны — для правок на основе текущего содержимого используйте update().
+        """
+        with self._locked(exclusive=True):
+            self._write_snapshot(accounts)
+            self._truncate_journal()
+
+    def update(self, func):
+        """Атомарная правка: func(accounts) -> новый список, под эксклюзивной блокировкой."""
+        with self._locked(exclusive=True):
+            self._sync()
+            accounts = func(self._load_unlocked())
+            self._write_snapshot(accounts)
+            self._truncate_journal()
+            return accounts
+
+    def compact(self):
+        """Свёртка журнала в снимок."""
+        with self._locked(exclusive=True):
+            # Пока ждали блокировку, журнал мог свернуть другой процесс
+            try:
+                if os.path.getsize(self.journal_path) < self.compact_bytes:
+                    return
+            except OSError:
+                return
+            self._sync()
+            self._write_snapshot(self._load_unlocked())
+            self._truncate_journal()
+
+    def close(self):
+        """Сброс журнала на диск и закрытие файла."""
+        with self._lock:
+            if self._journal_fd is not None:
+                self._sync()
+                os.close(self._journal_fd)
+                self._journal_fd = None
+
+
+_store = AccountStore(ACCOUNTS_FILE, ACCOUNTS_JOURNAL)
+atexit.register(_store.close)
+
 
 def load_accounts():
     """Загрузка сохранённых аккаунтов из файла."""
-    if os.path.exists(ACCOUNTS_FILE):
-        try:
-            with open(ACCOUNTS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return []
-    return []
+    try:
+        return _store.load()
+    except StoreError as e:
+        print_error(f"Хранилище повреждено: {e}")
+        return []
+
+
+def iter_accounts():
+    """Обход сохранённых аккаунтов (блокировка хранилища не удерживается)."""
+    return _store.iter()
 
 
 def save_accounts(accounts):
     """Сохранение аккаунтов в файл."""
-    with open(ACCOUNTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(accounts, f, indent=2, ensure_ascii=False)
+    _store.save(accounts)
 
 
 def add_account(account_data):
     """Добавление нового аккаунта в хранилище."""
-    accounts = load_accounts()
-    accounts.append(account_data)
-    save_accounts(accounts)
+    _store.add(account_data)
+
+
+# ─────────────────────────── Индекс аккаунтов ───────────────────────────
+#
+# SQLite-индекс поверх хранилища: поиск по адресу и id, префиксу и диапазону
+# дат, постраничный список. Индекс догоняет журнал с сохранённого смещения
+# и перестраивается целиком, только если изменился снимок (свёртка,
+# удаление аккаунтов).
+
+class AccountIndex:
+    """Индекс хранилища аккаунтов по address, id и created_at."""
+
+    def __init__(self, store, path=ACCOUNTS_INDEX_FILE):
+        self.store = store
+        self.path = path
+        self._lock = threading.Lock()
+        self._page_keys = {}  # (size, page) -> ключ последней записи перед страницей
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'accounts_by_date'"
+        ).fetchone():
+            # Индекс старой схемы: created_at мог быть NULL — перестраиваем
+            self._db.execute("DROP INDEX accounts_by_date")
+            self._db.execute("DELETE FROM meta WHERE key = 'snapshot'")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS accounts (
+                address    TEXT PRIMARY KEY,
+                id         TEXT,
+                created_at TEXT,
+                data       TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS accounts_by_id ON accounts (id);
+            CREATE INDEX IF NOT EXISTS accounts_by_created ON accounts (created_at, address);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._db.commit()
+
+    def _meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    def _snapshot_signature(self):
+        try:
+            st = os.stat(self.store.snapshot_path)
+        except OSError:
+            return "none"
+        return f"{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    def _insert(self, records):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO accounts (address, id, created_at, data) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                (acc["address"], acc.get("id"), acc.get("created_at") or "",
+                 json.dumps(acc, ensure_ascii=False))
+                for acc in records
+            ),
+        )
+
+    def _read_journal_from(self, offset):
+        """Новые записи журнала после offset и смещение конца последней целой строки."""
+        records = []
+        try:
+            f = open(self.store.journal_path, "rb")
+        except OSError:
+            return records, offset
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # запись ещё дописывается
+                offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records, offset
+
+    def refresh(self):
+        """Синхронизация индекса с хранилищем."""
+        with self._lock, self.store._locked(exclusive=False):
+            self._catch_up()
+
+    def _catch_up(self):
+        # Вызывается под self._lock и блокировкой хранилища
+        signature = self._snapshot_signature()
+        offset = int(self._meta("journal_offset", 0))
+        try:
+            journal_size = os.path.getsize(self.store.journal_path)
+        except OSError:
+            journal_size = 0
+        if signature != self._meta("snapshot") or journal_size < offset:
+            self._db.execute("DELETE FROM accounts")
+            self._insert(self.store._iter_snapshot())
+            self._set_meta("snapshot", signature)
+            self._page_keys.clear()
+            offset = 0
+        records, offset = self._read_journal_from(offset)
+        if records:
+            self._page_keys.clear()
+        self._insert(records)
+        self._set_meta("journal_offset", offset)
+        self._db.commit()
+
+    def remove(self, addresses):
+        """Удаление аккаунтов из хранилища и индекса без полной перестройки.
+
+        Индекс догоняет журнал под той же эксклюзивной блокировкой, под
+        которой переписывается снимок, поэтому добавления других процессов
+        между синхронизацией и перезаписью не теряются.
+        """
+        with self._lock, self.store._locked(exclusive=True):
+            self._catch_up()
+            self.store.update(lambda accounts: [
+                acc for acc in accounts if acc["address"] not in addresses
+            ])
+            self._db.executemany(
+                "DELETE FROM accounts WHERE address = ?", ((a,) for a in addresses)
+            )
+            self._set_meta("snapshot", self._snapshot_signature())
+            self._set_meta("journal_offset", 0)
+            self._db.commit()
+            self._page_keys.clear()
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, address):
+        """Аккаунт по адресу или None."""
+        rows = self._rows("SELECT data FROM accounts WHERE address = ?", (address,))
+        return rows[0] if rows else None
+
+    def get_by_id(self, account_id):
+        rows = self._rows("SELECT data FROM accounts WHERE id = ?", (account_id,))
+        return rows[0] if rows else None
+
+    def prefix(self, prefix, limit=ACCOUNTS_PAGE_SIZE):
+        """Аккаунты, чей адрес начинается с prefix."""
+        return self._rows(
+            "SELECT data FROM accounts WHERE address >= ? AND address < ? "
+            "ORDER BY address LIMIT ?",
+            (prefix, prefix + "\uffff", limit),
+        )
+
+    def created_between(self, start=None, end=None, limit=None):
+        """Аккаунты, созданные в [start, end) (datetime или ISO-строки)."""
+        start = start.isoformat() if isinstance(start, datetime) else (start or "")
+        end = end.isoformat() if isinstance(end, datetime) else (end or "\uffff")
+        return self._rows(
+            "SELECT data FROM accounts WHERE created_at >= ? AND created_at < ? "
+            "ORDER BY created_at LIMIT ?",
+            (start, end, -1 if limit is None else limit),
+        )
+
+    def page_after(self, after=None, size=ACCOUNTS_PAGE_SIZE):
+        """size аккаунтов в порядке создания после ключа after.
+
+        after — (created_at, address) последней записи предыдущей страницы
+        или None для первой. Запрос идёт по индексу (created_at, address),
+        без сортировки и OFFSET, поэтому стоимость не зависит ни от размера
+        хранилища, ни от номера страницы.
+        """
+        if after is None:
+            return self._rows(
+                "SELECT data FROM accounts ORDER BY created_at, address LIMIT ?",
+                (size,),
+            )
+        return self._rows(
+            "SELECT data FROM accounts WHERE (created_at, address) > (?, ?) "
+            "ORDER BY created_at, address LIMIT ?",
+            (*after, size),
+        )
+
+    def _page_key(self, page, size):
+        # Ключ записи перед страницей: из кэша соседних страниц или одним
+        # проходом по индексу (без чтения самих записей)
+        if page == 0:
+            return None
+        key = self._page_keys.get((size, page))
+        if key is None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT created_at, address FROM accounts "
+                    "ORDER BY created_at, address LIMIT 1 OFFSET ?",
+                    (page * size - 1,),
+                ).fetchone()
+            key = tuple(row) if row else ("\uffff", "")
+        return key
+
+    def page(self, page, size=ACCOUNTS_PAGE_SIZE):
+        """Страница аккаунтов (с нуля) в порядке создания.
+
+        Границы страниц запоминаются, так что переход на соседнюю страницу —
+        keyset-запрос page_after.
+        """
+        rows = self.page_after(self._page_key(page, size), size)
+        if rows:
+            last = rows[-1]
+            self._page_keys[(size, page + 1)] = (last.get("created_at") or "",
+                                                 last["address"])
+        return rows
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_index = None
+
+
+def get_index():
+    """Индекс хранилища, синхронизированный с текущим состоянием файлов."""
+    global _index
+    if _index is None:
+        _index = AccountIndex(_store)
+        atexit.register(_index.close)
+    _index.refresh()
+    return _index
+
+
+def find_account(address):
+    """Поиск аккаунта в хранилище по адресу."""
+    return get_index().get(address)
+
+
+# ─────────────────────────── Генерация учётных данных ───────────────────────────
+#
+# Пакетная генерация: один вызов os.urandom на тысячи символов и перевод
+# байтов в алфавит через bytes.translate (в C). Байты, дающие смещение
+# распределения (>= кратного длине алфавита), отбрасываются — выборка
+# равномерная. Имена сверяются с фильтром Блума по адресам хранилища, так
+# что повторы не доходят до API и не тратят rate limit на ответ 422.
+
+class _BloomSlice:
+    """Срез фильтра Блума фиксированной ёмкости."""
+
+    def __init__(self, capacity, error_rate):
+        ln2 = math.log(2)
+        self.capacity = capacity
+        self.count = 0
+        self.size = int(-capacity * math.log(error_rate) / (ln2 * ln2)) + 1
+        self.hashes = max(1, int(round(self.size / capacity * ln2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def add(self, h1, h2):
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % self.size
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def contains(self, h1, h2):
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % self.size
+            if not self._bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class BloomFilter:
+    """Масштабируемый фильтр Блума: «возможно есть» / «точно нет».
+
+    Когда в текущий срез добавлено capacity элементов, заводится новый —
+    вдвое больше и с вдвое меньшей долей ложных срабатываний. Общая доля
+    остаётся в пределах 2 × error_rate при любом числе элементов, поэтому
+    фильтр не насыщается, сколько бы адресов ни было выдано.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.error_rate = error_rate / 2
+        self._slices = [_BloomSlice(max(capacity, 1024), self.error_rate)]
+
+    @staticmethod
+    def _hashes(item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        return (int.from_bytes(digest[:8], "little"),
+                int.from_bytes(digest[8:], "little") | 1)
+
+    def add(self, item):
+        current = self._slices[-1]
+        if current.count >= current.capacity:
+            self.error_rate /= 2
+            current = _BloomSlice(current.capacity * 2, self.error_rate)
+            self._slices.append(current)
+        current.add(*self._hashes(item))
+
+    def __contains__(self, item):
+        h1, h2 = self._hashes(item)
+        return any(piece.contains(h1, h2) for piece in self._slices)
+
+
+def _translation(alphabet):
+    """Таблица байт → символ алфавита и набор отбрасываемых байтов."""
+    k = len(alphabet)
+    limit = 256 - 256 % k
+    table = bytes(ord(alphabet[b % k]) if b < limit else 0 for b in range(256))
+    return table, bytes(range(limit, 256))
+
+
+_USERNAME_TABLE = _translation(USERNAME_CHARS)
+_PASSWORD_TABLE = _translation(PASSWORD_CHARS)
+_PASSWORD_CLASSES = (
+    frozenset(string.ascii_uppercase), frozenset(string.ascii_lowercase),
+    frozenset(string.digits), frozenset(PASSWORD_SPECIALS),
+)
+
+
+def _random_text(table, count):
+    """count случайных символов алфавита из пакета байтов os.urandom."""
+    chars, drop = table
+    out = b""
+    while len(out) < count:
+        need = count - len(out)
+        out += os.urandom(need + need // 4 + 16).translate(chars, drop)
+    return out[:count].decode("ascii")
+
+
+def generate_usernames(count, length=10):
+    """Пакет случайных имён пользователей."""
+    text = _random_text(_USERNAME_TABLE, count * length)
+    return [text[i:i + length] for i in range(0, len(text), length)]
+
+
+def generate_passwords(count, length=16):
+    """Пакет паролей, в каждом — все четыре класса символов.
+
+    Пароли без какого-либо класса отбрасываются и генерируются заново,
+    поэтому распределение равномерно по всем допустимым паролям.
+    """
+    passwords = []
+    while len(passwords) < count:
+        need = count - len(passwords)
+        text = _random_text(_PASSWORD_TABLE, need * length)
+        for i in range(0, len(text), length):
+            candidate = text[i:i + length]
+            chars = set(candidate)
+            if all(chars & cls for cls in _PASSWORD_CLASSES):
+                passwords.append(candidate)
+    return passwords[:count]
+
+
+class CredentialGenerator:
+    """Потокобезопасный источник пар (address, password) без повторов адресов.
+
+    Кандидаты генерируются пакетами по batch_size; адреса, которые уже есть
+    в хранилище или были выданы раньше (по фильтру Блума), пропускаются.
+    expected — сколько адресов предполагается выдать: фильтр сразу
+    получает нужную ёмкость, а при превышении растёт сам.
+    """
+
+    def __init__(self, batch_size=1024, known_addresses=None, expected=0):
+        self.batch_size = batch_size
+        self.expected = expected
+        self._lock = threading.Lock()
+        self._pending = []
+        self._filter = None
+        self._known = known_addresses
+        self.skipped = 0
+
+    def _bloom(self):
+        if self._filter is None:
+            known = self._known
+            if known is None:
+                known = [acc["address"] for acc in iter_accounts()]
+            self._filter = BloomFilter(len(known) + self.expected)
+            for address in known:
+                self._filter.add(address)
+        return self._filter
+
+    def next(self, domain):
+        """Новая пара (address, password) для домена."""
+        with self._lock:
+            bloom = self._bloom()
+            while True:
+                if not self._pending:
+                    self._pending = list(zip(
+                        generate_usernames(self.batch_size),
+                        generate_passwords(self.batch_size),
+                    ))
+                username, password = self._pending.pop()
+                address = f"{username}@{domain}"
+                if address in bloom:
+                    self.skipped += 1
+                    continue
+                bloom.add(address)
+                return address, password
+
+
+def bench_credentials(count=100000):
+    """Микро-бенчмарк: пакетная генерация против посимвольных функций."""
+    started = time.perf_counter()
+    for _ in range(count):
+        generate_random_username()
+        generate_random_password()
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    generate_usernames(count)
+    generate_passwords(count)
+    batch = time.perf_counter() - started
+
+    return {
+        "count": count,
+        "per_call_sec": round(single, 4),
+        "batch_sec": round(batch, 4),
+        "per_call_per_sec": round(count / single),
+        "batch_per_sec": round(count / batch),
+        "speedup": round(single / batch, 1),
+    }
+
+
+# ─────────────────────────── Метрики ───────────────────────────
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    """Счётчики и гистограммы в памяти с выводом в формате Prometheus.
+
+    Метрика объявляется через declare(), значения копятся по наборам меток
+    (labels — кортеж пар). Значения меток приводятся к строкам: статус 200 и
+    status="error" — метки одной метрики. Все методы потокобезопасны.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta = {}         # name -> (type, help)
+        self._counters = {}     # (name, labels) -> value
+        self._histograms = {}   # (name, labels) -> [counts..., sum, count]
+
+    def declare(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def set(self, name, value, **labels):
+        """Установка значения (для метрик типа gauge)."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = value
+
+    def value(self, name, **labels):
+        """Текущее значение счётчика (0, если не было событий)."""
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus (version 0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        lines = []
+        seen = set()
+
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, help_text = self._meta.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_prom_labels(labels)} {value:g}")
+        for (name, labels), hist in histograms:
+            header(name)
+            for bound, count in zip(self.buckets, hist):
+                le = labels + (("le", f"{bound:g}"),)
+                lines.append(f"{name}_bucket{_prom_labels(le)} {count}")
+            lines.append(f"{name}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+            lines.append(f"{name}_sum{_prom_labels(labels)} {hist[-2]:.6f}")
+            lines.append(f"{name}_count{_prom_labels(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Атомарная запись метрик в файл (для textfile-коллектора)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+metrics.declare("mailtm_requests_total", "counter",
+                "HTTP-запросы к API по эндпоинту и статусу (error — сбой сети)")
+metrics.declare("mailtm_request_duration_seconds", "histogram",
+                "Длительность одной попытки запроса к API")
+metrics.declare("mailtm_retries_total", "counter",
+                "Повторы запросов по причине")
+metrics.declare("mailtm_circuit_open_total", "counter",
+                "Запросы, отклонённые разомкнутым circuit breaker")
+metrics.declare("mailtm_ratelimit_wait_seconds_total", "counter",
+                "Суммарное ожидание в rate limiter")
+metrics.declare("mailtm_ratelimit_acquire_total", "counter",
+                "Получения токена rate limiter")
+metrics.declare("mailtm_cache_requests_total", "counter",
+                "Обращения к кэшам (hit, stale, miss)")
+metrics.declare("mailtm_shard_requests_total", "counter",
+                "Запросы через шардированный клиент по API и исходу")
+metrics.declare("mailtm_shard_healthy", "gauge",
+                "Здоровье API в шардированном клиенте (1 — здоров)")
+metrics.declare("mailtm_purge_messages_total", "counter",
+                "Письма, удалённые очисткой ящиков, по результату")
+metrics.declare("mailtm_sweep_accounts_total", "counter",
+                "Проверенные аккаунты по результату (ok, dead, error)")
+metrics.declare("mailtm_pool_leases_total", "counter",
+                "Запросы аренды ящиков из пула (ok, empty)")
+metrics.declare("mailtm_pool_lease_wait_seconds", "histogram",
+                "Ожидание свободного ящика при аренде")
+metrics.declare("mailtm_pool_inboxes", "gauge",
+                "Ящики пула по состоянию")
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """HTTP-сервер метрик в фоновом потоке (GET /metrics). Возвращает сервер."""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump_metrics_periodically(path, interval=METRICS_DUMP_INTERVAL):
+    """Запись метрик в файл каждые interval секунд и при выходе."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            with contextlib.suppress(OSError):
+                metrics.dump(path)
+
+    def final():
+        stop.set()
+        with contextlib.suppress(OSError):
+            metrics.dump(path)
+
+    threading.Thread(target=loop, daemon=True).start()
+    atexit.register(final)
+    return stop
+
+
+# ─────────────────────────── HTTP-клиент ───────────────────────────
+
+class TokenBucket:
+    """Потокобезопасный token bucket: не более rate запросов в секунду."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Ожидание свободного токена. Возвращает время ожидания в секундах."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+                if self._tokens >= 1 and now >= self._paused_until:
+                    self._tokens -= 1
+                    return waited
+                delay = max((1 - self._tokens) / self.rate, self._paused_until - now)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """Приостановка выдачи токенов всем потокам (ответ 429 с Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# ─────────────────────────── Повторы и circuit breaker ───────────────────────────
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+_ID_SEGMENT = re.compile(r"/[0-9a-f]{16,}|/\d+")
+
+
+def endpoint_key(method, path):
+    """Ключ эндпоинта без id: 'GET /messages/{id}'."""
+    path = path.split("?", 1)[0]
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def parse_retry_after(value):
+    """Retry-After в секундах (число или HTTP-дата) либо None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def request_not_sent(exc):
+    """Ошибка возникла до отправки запроса: соединение не установлено.
+
+    Таймаут соединения или отказ в нём (в т.ч. ошибка DNS). Обрыв уже
+    установленного соединения сюда не относится — сервер мог успеть
+    обработать запрос.
+    """
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def backoff_delay(attempt, base=API_RETRY_BASE, cap=API_RETRY_CAP):
+    """Экспоненциальная пауза с полным джиттером (attempt с 1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Circuit breaker одного эндпоинта.
+
+    После threshold подряд неудач (сеть, 5xx) цепь размыкается на
+    reset_timeout секунд: запросы не отправляются. Затем пропускается один
+    пробный запрос — его успех замыкает цепь, неудача снова размыкает. Если
+    проба так и не завершилась (исключение вне учёта), через reset_timeout
+    пропускается следующая.
+    """
+
+    def __init__(self, threshold=CIRCUIT_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self._opened_at = 0.0       # время размыкания или последней пробы
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+def _circuit_open_response(url, endpoint):
+    """Локальный ответ 503 вместо запроса к эндпоинту с разомкнутой цепью."""
+    resp = requests.models.Response()
+    resp.status_code = 503
+    resp.reason = "Circuit Open"
+    resp.url = url
+    resp._content = json.dumps({"detail": f"circuit open: {endpoint}"}).encode()
+    return resp
+
+
+class MailTmClient:
+    """HTTP-клиент Mail.tm с общим keep-alive пулом соединений."""
+
+    def __init__(self, base_url=API_BASE, pool_size=API_POOL_SIZE,
+                 timeout=API_TIMEOUT, headers=None, rate_limit=API_RATE_LIMIT,
+                 refresh_on_401=True, retries=API_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.refresh_on_401 = refresh_on_401
+        self.retries = retries
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.pool_size = pool_size
+        self.extra_headers = headers
+        self._session = None
+        self.adapter = None
+
+    @property
+    def session(self):
+        """requests.Session создаётся при первом запросе."""
+        if self._session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            if self.extra_headers:
+                session.headers.update(self.extra_headers)
+            self.adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_size, pool_maxsize=self.pool_size
+            )
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self._session = session
+        return self._session
+
+    def request(self, method, path, token=None, idempotent=None, **kwargs):
+        """Запрос к API через общую сессию с повторами и circuit breaker.
+
+        idempotent — можно ли безопасно повторить запрос после неоднозначной
+        ошибки (таймаут чтения, обрыв, 5xx). По умолчанию — для всех методов,
+        кроме POST. Неидемпотентный запрос повторяется только если сервер его
+        точно не обработал: 429 или ошибка установки соединения (таймаут
+        соединения, отказ в нём — см. request_not_sent). 429 с Retry-After
+        больше API_RETRY_CAP не повторяется и возвращается вызывающему.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        kwargs.setdefault("timeout", self.timeout)
+        if idempotent is None:
+            idempotent = method != "POST"
+        url = f"{self.base_url}{path}"
+        endpoint = endpoint_key(method, path)
+        resp = self._send_with_retries(method, url, endpoint, headers, kwargs, idempotent)
+        if resp.status_code == 401 and token and self.refresh_on_401:
+            # Токен истёк или отозван — обновляем через кэш и повторяем
+            new_token = token_cache.refresh(token)
+            if new_token:
+                headers["Authorization"] = f"Bearer {new_token}"
+                resp = self._send_with_retries(
+                    method, url, endpoint, headers, kwargs, idempotent
+                )
+        return resp
+
+    def breaker(self, endpoint):
+        """Circuit breaker эндпоинта (создаётся при первом обращении)."""
+        with self._breakers_lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker()
+            return breaker
+
+    def _send_with_retries(self, method, url, endpoint, headers, kwargs, idempotent):
+        breaker = self.breaker(endpoint)
+        for attempt in range(1, self.retries + 1):
+            last = attempt == self.retries
+            if not breaker.allow():
+                metrics.inc("mailtm_circuit_open_total", endpoint=endpoint)
+                return _circuit_open_response(url, endpoint)
+            try:
+                resp = self._send(method, url, endpoint, headers, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                # Соединение не установлено — запрос не ушёл; остальное неоднозначно
+                safe = idempotent or request_not_sent(e)
+                if last or not safe:
+                    raise
+                metrics.inc("mailtm_retries_total", endpoint=endpoint, reason="network")
+                time.sleep(backoff_delay(attempt))
+                continue
+            except requests.RequestException:
+                breaker.record_failure()
+                raise
+
+            status = resp.status_code
+            if status == 429:
+                # Лимит: сервер запрос не обработал — повтор безопасен всегда.
+                # Пауза общая для всех потоков, чтобы не добивать лимит. Для
+                # circuit breaker это ответ живого сервера, то есть успех.
+                breaker.record_success()
+                delay = parse_retry_after(resp.headers.get("Retry-After"))
+                # Слишком долгая пауза заморозила бы общий лимит для всех
+                # потоков — такой 429 возвращается как есть
+                if last or (delay is not None and delay > API_RETRY_CAP):
+                    return resp
+                delay = backoff_delay(attempt) if delay is None else delay
+                if self.rate_limiter:
+                    self.rate_limiter.pause(delay)
+                metrics.inc("mailtm_retries_total", endpoint=endpoint, reason="429")
+                resp.close()
+                time.sleep(delay)
+                continue
+            if status >= 500:
+                breaker.record_failure()
+                if idempotent and status in RETRY_STATUSES and not last:
+                    metrics.inc("mailtm_retries_total", endpoint=endpoint, reason=str(status))
+                    resp.close()
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                return resp
+            breaker.record_success()
+            return resp
+
+    def open_stream(self, url, token=None, headers=None, params=None):
+        """Потоковый GET (SSE) через общую сессию, без rate limit API."""
+        headers = dict(headers or {})
+        headers["Accept"] = "text/event-stream"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return self.session.get(
+            url, headers=headers, params=params, stream=True,
+            timeout=(self.timeout, SSE_READ_TIMEOUT),
+        )
+
+    def _send(self, method, url, endpoint, headers, kwargs):
+        if self.rate_limiter:
+            waited = self.rate_limiter.acquire()
+            metrics.inc("mailtm_ratelimit_acquire_total")
+            if waited:
+                metrics.inc("mailtm_ratelimit_wait_seconds_total", waited)
+        started = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, headers=headers, **kwargs)
+        except requests.RequestException:
+            metrics.inc("mailtm_requests_total", endpoint=endpoint, status="error")
+            raise
+        finally:
+            metrics.observe("mailtm_request_duration_seconds",
+                            time.perf_counter() - started, endpoint=endpoint)
+        metrics.inc("mailtm_requests_total", endpoint=endpoint, status=resp.status_code)
+        return resp
+
+    def get(self, path, token=None, **kwargs):
+        return self.request("GET", path, token=token, **kwargs)
+
+    def post(self, path, token=None, **kwargs):
+        return self.request("POST", path, token=token, **kwargs)
+
+    def delete(self, path, token=None, **kwargs):
+        return self.request("DELETE", path, token=token, **kwargs)
+
+    def pool_stats(self):
+        """Статистика пула: запросы, новые соединения и доля переиспользования."""
+        pools = self.adapter.poolmanager.pools if self.adapter else {}
+        total_requests = 0
+        total_connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+        hit_rate = 0.0
+        if total_requests:
+            hit_rate = 1 - total_connections / total_requests
+        return {
+            "requests": total_requests,
+            "connections": total_connections,
+            "hit_rate": hit_rate,
+        }
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+client = MailTmClient()
+
+
+# ─────────────────────────── Шардирование ───────────────────────────
+#
+# Несколько совместимых API (зеркала Mail.tm или сервисы с тем же API):
+# у каждого свой клиент — rate limit, пул соединений, circuit breaker — и
+# счётчик здоровья. Аккаунт живёт на том API, который обслуживает его домен,
+# поэтому запросы маршрутизируются по домену адреса: из тела запроса, из
+# кэша токенов или из поля username в JWT. Домен, который обслуживают
+# несколько API, распределяется между ними по весам (smooth weighted
+# round-robin), с пропуском нездоровых.
+
+class _WeightedRoundRobin:
+    """Smooth weighted round-robin: элементы чередуются пропорционально весам."""
+
+    def __init__(self, weights):
+        self._weights = dict(weights)
+        self._current = dict.fromkeys(self._weights, 0)
+        self._lock = threading.Lock()
+
+    def next(self, allowed=None):
+        with self._lock:
+            items = [k for k in self._weights if allowed is None or k in allowed]
+            if not items:
+                return None
+            total = 0
+            for key in items:
+                self._current[key] += self._weights[key]
+                total += self._weights[key]
+            best = max(items, key=self._current.__getitem__)
+            self._current[best] -= total
+            return best
+
+
+class ApiShard:
+    """Один API-эндпоинт пула: свой клиент, вес и состояние здоровья."""
+
+    def __init__(self, base_url, rate_limit=API_RATE_LIMIT, weight=None):
+        self.client = MailTmClient(base_url, rate_limit=rate_limit)
+        self.base_url = self.client.base_url
+        self.weight = weight or rate_limit or 1
+        self.domains = None         # None — список ещё не загружен
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def record(self, ok):
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self.failures = 0
+                return
+            self.errors += 1
+            self.failures += 1
+            if self.failures >= SHARD_FAILURE_THRESHOLD:
+                self.unhealthy_until = time.monotonic() + SHARD_COOLDOWN
+                self.failures = 0
+        metrics.set("mailtm_shard_healthy", int(self.healthy()), shard=self.base_url)
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "domains": sorted(self.domains or ()),
+        }
+
+
+class ShardedClient:
+    """Клиент поверх нескольких API с тем же интерфейсом, что у MailTmClient."""
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        self.base_url = self.shards[0].base_url
+        self._by_url = {shard.base_url: shard for shard in self.shards}
+        self._rr = _WeightedRoundRobin({s.base_url: s.weight for s in self.shards})
+        self._domains_lock = threading.Lock()
+
+    @classmethod
+    def from_specs(cls, specs, rate_limit=API_RATE_LIMIT):
+        """Клиент из описаний 'URL' или 'URL=RATE' (RATE — запросов в секунду)."""
+        shards = []
+        for spec in specs:
+            url, _, rate = spec.partition("=")
+            shards.append(ApiShard(url, rate_limit=float(rate) if rate else rate_limit))
+        return cls(shards)
+
+    # ── Домены ──
+
+    def load_domains(self, force=False):
+        """Загрузка активных доменов каждого API. Возвращает общий список."""
+        with self._domains_lock:
+            for shard in self.shards:
+                if shard.domains is not None and not force:
+                    continue
+                try:
+                    resp = shard.client.get("/domains")
+                    resp.raise_for_status()
+                    members = resp.json().get("hydra:member", [])
+                    shard.domains = {m["domain"] for m in members if m.get("isActive")}
+                    shard.record(True)
+                except (requests.RequestException, ValueError) as e:
+                    # Повторная попытка — при следующем обновлении кэша доменов
+                    shard.domains = set()
+                    shard.record(False)
+                    print_warning(f"{shard.base_url}: домены недоступны ({e})")
+            domains = []
+            for shard in self.shards:
+                for domain in sorted(shard.domains or ()):
+                    if domain not in domains:
+                        domains.append(domain)
+            return domains
+
+    def shards_for(self, domain):
+        """API, обслуживающие домен."""
+        if any(shard.domains is None for shard in self.shards):
+            self.load_domains()
+        return [s for s in self.shards if s.domains and domain in s.domains]
+
+    def domain_weights(self, domains):
+        """Веса доменов пропорционально суммарному лимиту их API."""
+        return {d: sum(s.weight for s in self.shards_for(d)) or 1 for d in domains}
+
+    # ── Маршрутизация ──
+
+    def _address_for(self, token, payload):
+        if isinstance(payload, dict) and payload.get("address"):
+            return payload["address"]
+        if token:
+            return token_cache.address_of(token) or _jwt_claims(token).get("username")
+        return None
+
+    def pick(self, domain=None):
+        """API для запроса: среди обслуживающих домен, здоровые — первыми."""
+        candidates = self.shards_for(domain) if domain else []
+        candidates = candidates or self.shards
+        healthy = {s.base_url for s in candidates if s.healthy()}
+        allowed = healthy or {s.base_url for s in candidates}
+        return self._by_url[self._rr.next(allowed)]
+
+    def request(self, method, path, token=None, **kwargs):
+        address = self._address_for(token, kwargs.get("json"))
+        shard = self.pick(address.partition("@")[2] if address else None)
+        try:
+            resp = shard.client.request(method, path, token=token, **kwargs)
+        except requests.RequestException:
+            shard.record(False)
+            raise
+        shard.record(resp.status_code < 500)
+        metrics.inc("mailtm_shard_requests_total", shard=shard.base_url,
+                    outcome="error" if resp.status_code >= 500 else "ok")
+        return resp
+
+    def get(self, path, token=None, **kwargs):
+        return self.request("GET", path, token=token, **kwargs)
+
+    def post(self, path, token=None, **kwargs):
+        return self.request("POST", path, token=token, **kwargs)
+
+    def delete(self, path, token=None, **kwargs):
+        return self.request("DELETE", path, token=token, **kwargs)
+
+    def open_stream(self, url, token=None, headers=None, params=None):
+        address = self._address_for(token, None)
+        shard = self.pick(address.partition("@")[2] if address else None)
+        return shard.client.open_stream(url, token=token, headers=headers, params=params)
+
+    def pool_stats(self):
+        stats = [shard.client.pool_stats() for shard in self.shards]
+        total_requests = sum(s["requests"] for s in stats)
+        total_connections = sum(s["connections"] for s in stats)
+        return {
+            "requests": total_requests,
+            "connections": total_connections,
+            "hit_rate": 1 - total_connections / total_requests if total_requests else 0.0,
+        }
+
+    def shard_stats(self):
+        return [shard.stats() for shard in self.shards]
+
+    def close(self):
+        for shard in self.shards:
+            shard.client.close()
+
+
+class DomainRotator:
+    """Выбор домена для очередного аккаунта: по кругу или по весам.
+
+    strategy="round-robin" — домены по очереди; "weighted" — пропорционально
+    weights, а без них — суммарному лимиту API, обслуживающих домен.
+    """
+
+    def __init__(self, domains, strategy=DOMAIN_STRATEGY, weights=None):
+        domains = list(domains)
+        if not domains:
+            raise ValueError("нет доменов")
+        if strategy == "weighted" and weights is None and isinstance(client, ShardedClient):
+            weights = client.domain_weights(domains)
+        if strategy != "weighted" or not weights:
+            weights = {}
+        self._rr = _WeightedRoundRobin({d: weights.get(d, 1) for d in domains})
+
+    def next(self):
+        return self._rr.next()
 
 
 # ─────────────────────────── API-функции ───────────────────────────
 
 def get_available_domains():
-    """Получение списка доступных доменов."""
+    """Получение списка доступных доменов (со всех API при шардировании)."""
+    if isinstance(client, ShardedClient):
+        return client.load_domains(force=True)
     try:
-        resp = requests.get(f"{API_BASE}/domains", headers=HEADERS, timeout=10)
+        resp = client.get("/domains")
         resp.raise_for_status()
         data = resp.json()
         domains = []
@@ -157,35 +1717,52 @@ def create_account(address, password):
     """Создание нового email-аккаунта."""
     payload = {"address": address, "password": password}
     try:
-        resp = requests.post(
-            f"{API_BASE}/accounts",
-            headers=HEADERS,
-            json=payload,
-            timeout=10,
-        )
+        resp = client.post("/accounts", json=payload)
         if resp.status_code == 201:
             return resp.json()
         elif resp.status_code == 422:
             print_error("Этот email уже занят. Попробуйте другое имя.")
             return None
-        else:
-            print_error(f"Ошибка создания: {resp.status_code} — {resp.text}")
-            return None
+        elif resp.status_code >= 500:
+            # Сервер мог создать аккаунт до ошибки — проверяем, а не повторяем POST
+            account = _recover_account(address, password)
+            if account:
+                return account
+        print_error(f"Ошибка создания: {resp.status_code} — {resp.text}")
+        return None
+    except requests.exceptions.ConnectTimeout as e:
+        print_error(f"Ошибка сети: {e}")
+        return None
     except requests.RequestException as e:
+        # Запрос мог дойти до сервера — ответ потерян, но аккаунт создан
+        account = _recover_account(address, password)
+        if account:
+            return account
         print_error(f"Ошибка сети: {e}")
         return None
 
 
+def _recover_account(address, password):
+    """Данные аккаунта, если он был создан неоднозначно завершившимся POST."""
+    payload = {"address": address, "password": password}
+    try:
+        resp = client.post("/token", json=payload, idempotent=True)
+        if resp.status_code != 200:
+            return None
+        token = resp.json().get("token")
+        resp = client.get("/me", token=token)
+        if resp.status_code == 200:
+            return resp.json()
+    except (requests.RequestException, ValueError):
+        pass
+    return None
+
+
 def get_token(address, password):
     """Получение токена авторизации."""
     payload = {"address": address, "password": password}
     try:
-        resp = requests.post(
-            f"{API_BASE}/token",
-            headers=HEADERS,
-            json=payload,
-            timeout=10,
-        )
+        resp = client.post("/token", json=payload, idempotent=True)
         if resp.status_code == 200:
             return resp.json().get("token")
         else:
@@ -196,33 +1773,32 @@ def get_token(address, password):
         return None
 
 
-def get_messages(token):
-    """Получение списка сообщений."""
-    auth_headers = {**HEADERS, "Authorization": f"Bearer {token}"}
+def get_messages_page(token, page=1):
+    """Получение одной страницы списка сообщений (hydra-коллекция целиком)."""
     try:
-        resp = requests.get(
-            f"{API_BASE}/messages", headers=auth_headers, timeout=10
-        )
+        resp = client.get("/messages", token=token, params={"page": page})
         if resp.status_code == 200:
-            data = resp.json()
-            return data.get("hydra:member", [])
+            return resp.json()
         else:
             print_error(f"Ошибка получения сообщений: {resp.status_code}")
-            return []
+            return None
     except requests.RequestException as e:
         print_error(f"Ошибка сети: {e}")
+        return None
+
+
+def get_messages(token, page=1):
+    """Получение списка сообщений (одна страница, новые — первыми)."""
+    data = get_messages_page(token, page)
+    if data is None:
         return []
+    return data.get("hydra:member", [])
 
 
 def get_message_detail(token, message_id):
     """Получение подробностей сообщения."""
-    auth_headers = {**HEADERS, "Authorization": f"Bearer {token}"}
     try:
-        resp = requests.get(
-            f"{API_BASE}/messages/{message_id}",
-            headers=auth_headers,
-            timeout=10,
-        )
+        resp = client.get(f"/messages/{message_id}", token=token)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -235,14 +1811,10 @@ def get_message_detail(token, message_id):
 
 def delete_message(token, message_id):
     """Удаление сообщения."""
-    auth_headers = {**HEADERS, "Authorization": f"Bearer {token}"}
     try:
-        resp = requests.delete(
-            f"{API_BASE}/messages/{message_id}",
-            headers=auth_headers,
-            timeout=10,
-        )
-        return resp.status_code == 204
+        resp = client.delete(f"/messages/{message_id}", token=token)
+        # 404 после повтора: первый запрос уже удалил объект
+        return resp.status_code in (204, 404)
     except requests.RequestException as e:
         print_error(f"Ошибка сети: {e}")
         return False
@@ -250,19 +1822,2247 @@ def delete_message(token, message_id):
 
 def delete_account(token, account_id):
     """Удаление аккаунта."""
-    auth_headers = {**HEADERS, "Authorization": f"Bearer {token}"}
     try:
-        resp = requests.delete(
-            f"{API_BASE}/accounts/{account_id}",
-            headers=auth_headers,
-            timeout=10,
-        )
-        return resp.status_code == 204
+        resp = client.delete(f"/accounts/{account_id}", token=token)
+        # 404 после повтора: первый запрос уже удалил объект
+        return resp.status_code in (204, 404)
     except requests.RequestException as e:
         print_error(f"Ошибка сети: {e}")
         return False
 
 
+# ─────────────────────────── Постраничный обход писем ───────────────────────────
+
+class Message(dict):
+    """Письмо из списка; полное содержимое загружается по требованию."""
+
+    def __init__(self, data, token):
+        super().__init__(data)
+        self.token = token
+        self._detail = None
+
+    def detail(self):
+        """Полное письмо через get_message_detail (запрашивается один раз)."""
+        if self._detail is None:
+            self._detail = get_message_detail(self.token, self["id"])
+        return self._detail
+
+
+class ListingError(Exception):
+    """Страница списка писем не загрузилась — список неполон."""
+
+
+def _has_next_page(data, fetched):
+    view = data.get("hydra:view") or {}
+    if "hydra:next" in view:
+        return True
+    if view:
+        return False
+    total = data.get("hydra:totalItems")
+    return total is not None and fetched < total
+
+
+def iter_messages(token, prefetch=False, strict=False):
+    """Ленивый обход всех страниц ящика.
+
+    Страницы запрашиваются по мере потребления; если вызывающий прервал
+    цикл, следующие страницы не загружаются. С prefetch=True следующая
+    страница запрашивается в фоне, пока обрабатывается текущая. Сбой
+    загрузки страницы завершает обход, а с strict=True — вызывает
+    ListingError.
+    """
+    pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = 1
+        fetched = 0
+        pending = pool.submit(get_messages_page, token, page) if pool else None
+        while True:
+            data = pending.result() if pool else get_messages_page(token, page)
+            if data is None and strict:
+                raise ListingError(f"страница {page} не загружена")
+            if not data:
+                return
+            members = data.get("hydra:member", [])
+            fetched += len(members)
+            has_next = bool(members) and _has_next_page(data, fetched)
+            page += 1
+            if pool and has_next:
+                pending = pool.submit(get_messages_page, token, page)
+            for member in members:
+                yield Message(member, token)
+            if not has_next:
+                return
+    finally:
+        if pool:
+            pool.shutdown(wait=False)
+
+
+# ─────────────────────────── Локальное зеркало писем ───────────────────────────
+
+class MessageMirror:
+    """Локальное SQLite-зеркало писем с инкрементальной синхронизацией.
+
+    Сервер отдаёт письма от новых к старым, поэтому синхронизация читает
+    список только до первого уже известного id — обычно это один запрос.
+    Тела писем загружаются один раз и дальше читаются из зеркала.
+    """
+
+    def __init__(self, path=MIRROR_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                address    TEXT NOT NULL,
+                id         TEXT NOT NULL,
+                created_at TEXT,
+                summary    TEXT NOT NULL,
+                detail     TEXT,
+                PRIMARY KEY (address, id)
+            )"""
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS messages_by_date "
+            "ON messages (address, created_at)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS full_syncs (address TEXT PRIMARY KEY, at REAL)"
+        )
+        self._db.commit()
+
+    def known_ids(self, address):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM messages WHERE address = ?", (address,)
+            )
+            return {row[0] for row in rows}
+
+    def add(self, address, messages):
+        """Сохранение кратких данных писем (без тел)."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO messages (address, id, created_at, summary) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (address, msg["id"], msg.get("createdAt"),
+                     json.dumps(dict(msg), ensure_ascii=False))
+                    for msg in messages
+                ],
+            )
+            self._db.commit()
+
+    def _full_sync_due(self, address):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT at FROM full_syncs WHERE address = ?", (address,)
+            ).fetchone()
+        return not row or time.time() - row[0] >= MIRROR_FULL_SYNC_INTERVAL
+
+    def sync(self, address, token, full=None):
+        """Загрузка новых писем. Возвращает их список (от старых к новым).
+
+        Обычно список читается только до первого известного id. Полная
+        синхронизация (full=True, а при full=None — раз в
+        MIRROR_FULL_SYNC_INTERVAL) обходит все страницы и удаляет из зеркала
+        письма, которых больше нет на сервере, — если загрузились все страницы.
+        """
+        if full is None:
+            full = self._full_sync_due(address)
+        known = self.known_ids(address)
+        new = []
+        remote_ids = set()
+        complete = True
+        try:
+            for msg in iter_messages(token, prefetch=full, strict=full):
+                remote_ids.add(msg["id"])
+                if msg["id"] in known:
+                    if not full:
+                        break
+                    continue
+                new.append(msg)
+        except ListingError:
+            # Без части страниц нельзя отличить удалённое письмо от незагруженного
+            complete = False
+        new.reverse()
+        self.add(address, new)
+        if full and complete:
+            gone = known - remote_ids
+            with self._lock:
+                self._db.executemany(
+                    "DELETE FROM messages WHERE address = ? AND id = ?",
+                    [(address, msg_id) for msg_id in gone],
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO full_syncs (address, at) VALUES (?, ?)",
+                    (address, time.time()),
+                )
+                self._db.commit()
+        return new
+
+    def messages(self, address):
+        """Письма ящика из зеркала, новые — первыми."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT summary FROM messages WHERE address = ? "
+                "ORDER BY created_at DESC",
+                (address,),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def detail(self, address, token, message_id):
+        """Полное письмо: из зеркала или с сервера (с сохранением)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT detail FROM messages WHERE address = ? AND id = ?",
+                (address, message_id),
+            ).fetchone()
+        if row and row[0]:
+            return json.loads(row[0])
+        detail = get_message_detail(token, message_id)
+        if detail:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE messages SET detail = ? WHERE address = ? AND id = ?",
+                    (json.dumps(detail, ensure_ascii=False), address, message_id),
+                )
+                self._db.commit()
+        return detail
+
+    def remove(self, address, message_ids=None):
+        """Удаление писем (или всего ящика) из зеркала."""
+        with self._lock:
+            if message_ids is None:
+                self._db.execute("DELETE FROM messages WHERE address = ?", (address,))
+                self._db.execute("DELETE FROM full_syncs WHERE address = ?", (address,))
+            else:
+                self._db.executemany(
+                    "DELETE FROM messages WHERE address = ? AND id = ?",
+                    [(address, msg_id) for msg_id in message_ids],
+                )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_mirror = None
+
+
+def get_mirror():
+    """Общее зеркало писем (открывается при первом обращении)."""
+    global _mirror
+    if _mirror is None:
+        _mirror = MessageMirror()
+        atexit.register(_mirror.close)
+    return _mirror
+
+
+# ─────────────────────────── Кэш доменов ───────────────────────────
+
+class DomainCache:
+    """Кэш списка доменов в памяти и на диске (stale-while-revalidate).
+
+    Свежий список отдаётся сразу. Устаревший — тоже сразу, а обновление
+    запускается в фоне. Сетевой запрос блокирует вызов только при пустом кэше.
+    """
+
+    def __init__(self, path=DOMAINS_FILE, ttl=DOMAINS_TTL, api=API_BASE):
+        self.path = path
+        self.ttl = ttl
+        self.api = api              # список доменов привязан к набору API
+        self._lock = threading.Lock()
+        self._domains = None
+        self._fetched_at = 0.0
+        self._refreshing = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("api", API_BASE) != self.api:
+                return
+            self._domains = data["domains"]
+            self._fetched_at = data["fetched_at"]
+        except (json.JSONDecodeError, IOError, KeyError, TypeError):
+            pass
+
+    def _store(self, domains):
+        with self._lock:
+            self._domains = domains
+            self._fetched_at = time.time()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"api": self.api, "fetched_at": self._fetched_at,
+                           "domains": domains}, f)
+            os.replace(tmp_path, self.path)
+        except IOError:
+            pass
+
+    def is_fresh(self):
+        return self._domains is not None and time.time() - self._fetched_at < self.ttl
+
+    def refresh(self):
+        """Синхронное обновление списка доменов."""
+        domains = get_available_domains()
+        if domains:
+            self._store(domains)
+        return domains or self._domains or []
+
+    def refresh_async(self):
+        """Фоновое обновление (не более одного одновременно)."""
+        with self._lock:
+            if self._refreshing and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(target=self.refresh, daemon=True)
+            self._refreshing.start()
+
+    def prefetch(self):
+        """Прогрев кэша в фоне, если он пуст или устарел."""
+        if not self.is_fresh():
+            self.refresh_async()
+
+    def get(self):
+        """Список доменов: из кэша, с фоновым обновлением устаревшего."""
+        if self._domains is None:
+            metrics.inc("mailtm_cache_requests_total", cache="domains", result="miss")
+            return self.refresh()
+        if not self.is_fresh():
+            metrics.inc("mailtm_cache_requests_total", cache="domains", result="stale")
+            self.refresh_async()
+        else:
+            metrics.inc("mailtm_cache_requests_total", cache="domains", result="hit")
+        return list(self._domains)
+
+
+domain_cache = DomainCache()
+
+
+def get_domains():
+    """Список активных доменов из кэша."""
+    return domain_cache.get()
+
+
+# ─────────────────────────── Кэш токенов ───────────────────────────
+
+def _jwt_claims(token):
+    """Поля полезной нагрузки JWT (без проверки подписи) или {}."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError, AttributeError):
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+def _jwt_expiry(token):
+    """Время истечения JWT (поле exp) или None."""
+    return _jwt_claims(token).get("exp")
+
+
+class TokenCache:
+    """Кэш JWT по адресу с учётом срока действия."""
+
+    def __init__(self, path=TOKENS_FILE, persist=TOKEN_CACHE_PERSIST,
+                 margin=TOKEN_REFRESH_MARGIN):
+        self.path = path
+        self.persist = persist
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._tokens = None         # address -> {"token", "exp"}
+        self._passwords = {}        # address -> password
+        self._owners = {}           # token -> address (текущие и заменённые)
+        self._replaced = {}         # address -> последний заменённый токен
+        self._dirty = False
+
+    def _entries(self):
+        if self._tokens is None:
+            self._tokens = {}
+            if self.persist and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._tokens = json.load(f)
+                except (json.JSONDecodeError, IOError):
+                    pass
+        return self._tokens
+
+    def _valid(self, entry):
+        return entry and entry["exp"] - self.margin > time.time()
+
+    def get(self, address, password):
+        """Токен из кэша или новый через get_token()."""
+        with self._lock:
+            entry = self._entries().get(address)
+            if self._valid(entry):
+                self._passwords[address] = password
+                self._owners[entry["token"]] = address
+                metrics.inc("mailtm_cache_requests_total", cache="tokens", result="hit")
+                return entry["token"]
+        metrics.inc("mailtm_cache_requests_total", cache="tokens", result="miss")
+        return self._authenticate(address, password)
+
+    def _authenticate(self, address, password):
+        token = get_token(address, password)
+        if not token:
+            return None
+        self.put(address, password, token)
+        return token
+
+    def put(self, address, password, token):
+        """Сохранение токена, полученного в обход get() (например, при проверке)."""
+        exp = _jwt_expiry(token) or time.time() + TOKEN_DEFAULT_TTL
+        with self._lock:
+            old = self._entries().get(address)
+            if old and old["token"] != token:
+                self._retire(address, old["token"])
+            self._entries()[address] = {"token": token, "exp": exp}
+            self._passwords[address] = password
+            self._owners[token] = address
+            self._dirty = True
+
+    def _retire(self, address, token):
+        # Заменённый токен ещё может прийти в refresh() из потоков, которые
+        # получили с ним 401; более старые забываются — иначе карта токенов
+        # росла бы с каждым обновлением
+        stale = self._replaced.get(address)
+        if stale and stale != token:
+            self._owners.pop(stale, None)
+        self._replaced[address] = token
+
+    def refresh(self, token):
+        """Новый токен взамен отвергнутого сервером (401)."""
+        with self._lock:
+            address = self._owners.get(token)
+            password = self._passwords.get(address)
+            if password is None:
+                return None
+            entry = self._entries().get(address)
+            if entry and entry["token"] != token and self._valid(entry):
+                # Другой поток уже обновил токен
+                return entry["token"]
+            if self._entries().pop(address, None):
+                self._retire(address, entry["token"])
+        return self._authenticate(address, password)
+
+    def address_of(self, token):
+        """Адрес, для которого выдан токен, или None."""
+        with self._lock:
+            return self._owners.get(token)
+
+    def invalidate(self, address):
+        """Удаление токена адреса из кэша."""
+        with self._lock:
+            entry = self._entries().pop(address, None)
+            for stale in (entry and entry["token"], self._replaced.pop(address, None)):
+                self._owners.pop(stale, None)
+            self._passwords.pop(address, None)
+            if entry:
+                self._dirty = True
+
+    def save(self):
+        """Сохранение токенов рядом с хранилищем аккаунтов."""
+        with self._lock:
+            if not (self.persist and self._dirty):
+                return
+            now = time.time()
+            alive = {a: e for a, e in self._tokens.items() if e["exp"] > now}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(alive, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+token_cache = TokenCache()
+atexit.register(token_cache.save)
+
+
+def get_cached_token(account):
+    """Токен аккаунта из кэша (с авторизацией при необходимости)."""
+    return token_cache.get(account["address"], account["password"])
+
+
+# ─────────────────────────── Вложения ───────────────────────────
+
+def _safe_filename(name, default="attachment"):
+    """Имя файла без каталогов и управляющих символов."""
+    name = os.path.basename(str(name or "").replace("\\", "/"))
+    name = "".join(ch for ch in name if ch.isprintable()).strip().lstrip(".")
+    return name[:200] or default
+
+
+class AttachmentStore:
+    """Вложения на диске с дедупликацией по содержимому.
+
+    Содержимое хранится один раз: objects/<sha256[:2]>/<sha256>. В каталоге
+    <ящик>/<id письма>/ лежат жёсткие ссылки на объекты под исходными
+    именами; разные вложения с одним именем различаются префиксом хэша
+    (report.<sha256[:12]>.pdf). Манифест (SQLite) помнит скачанные вложения, поэтому повторно
+    они не запрашиваются.
+    """
+
+    def __init__(self, root=ATTACHMENTS_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(root, ATTACHMENTS_MANIFEST), check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS attachments (
+                message_id    TEXT NOT NULL,
+                attachment_id TEXT NOT NULL,
+                address       TEXT NOT NULL,
+                filename      TEXT,
+                sha256        TEXT NOT NULL,
+                size          INTEGER,
+                path          TEXT,
+                PRIMARY KEY (message_id, attachment_id)
+            )"""
+        )
+        self._db.commit()
+
+    def lookup(self, message_id, attachment_id):
+        """Запись манифеста о скачанном вложении или None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256, size, path FROM attachments "
+                "WHERE message_id = ? AND attachment_id = ?",
+                (message_id, attachment_id),
+            ).fetchone()
+        if row and os.path.exists(self.object_path(row[0])):
+            return {"sha256": row[0], "size": row[1], "path": row[2]}
+        return None
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def write(self, chunks):
+        """Запись потока байтов. Возвращает (sha256, size, новый ли объект)."""
+        tmp_path = os.path.join(self.root, f".{secrets.token_hex(8)}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            hexdigest = digest.hexdigest()
+            path = self.object_path(hexdigest)
+            if os.path.exists(path):
+                os.unlink(tmp_path)
+                return hexdigest, size, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            return hexdigest, size, True
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+
+    def _same_content(self, path, digest):
+        obj = self.object_path(digest)
+        try:
+            if os.path.samefile(path, obj):
+                return True
+            if os.path.getsize(path) != os.path.getsize(obj):
+                return False
+            check = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    check.update(chunk)
+        except OSError:
+            return False
+        return check.hexdigest() == digest
+
+    def link(self, address, message_id, filename, digest):
+        """Файл под исходным именем — жёсткая ссылка на объект (или копия).
+
+        Если имя уже занято другим содержимым, к нему добавляется префикс хэша.
+        """
+        directory = os.path.join(
+            self.root, _safe_filename(address), _safe_filename(message_id)
+        )
+        os.makedirs(directory, exist_ok=True)
+        name = _safe_filename(filename)
+        stem, ext = os.path.splitext(name)
+        for candidate in (name, f"{stem}.{digest[:12]}{ext}"):
+            path = os.path.join(directory, candidate)
+            try:
+                os.link(self.object_path(digest), path)
+            except FileExistsError:
+                if self._same_content(path, digest):
+                    return path
+                continue
+            except OSError:
+                # ФС без жёстких ссылок
+                if os.path.exists(path):
+                    if self._same_content(path, digest):
+                        return path
+                    continue
+                shutil.copyfile(self.object_path(digest), path)
+            return path
+        return path
+
+    def record(self, address, message_id, attachment, digest, size, path):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO attachments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message_id, attachment["id"], address, attachment.get("filename"),
+                 digest, size, path),
+            )
+            self._db.commit()
+
+    def stats(self):
+        """Число вложений и объектов, их суммарный и фактический размер."""
+        with self._lock:
+            files, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM attachments"
+            ).fetchone()
+            objects, stored = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM "
+                "(SELECT sha256, MAX(size) AS size FROM attachments GROUP BY sha256)"
+            ).fetchone()
+        return {"files": files, "objects": objects, "bytes": total, "stored_bytes": stored}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def download_attachment(token, address, message_id, attachment, store):
+    """Потоковая загрузка одного вложения в store. Возвращает запись результата.
+
+    status: downloaded — новый файл, deduplicated — такое содержимое уже
+    было, skipped — вложение скачано раньше, failed — ошибка (поле error).
+    """
+    result = {
+        "address": address,
+        "message_id": message_id,
+        "filename": attachment.get("filename"),
+        "size": attachment.get("size"),
+    }
+    known = store.lookup(message_id, attachment["id"])
+    if known:
+        return dict(result, status="skipped", **known)
+
+    path = attachment.get("downloadUrl") or (
+        f"/messages/{message_id}/attachment/{attachment['id']}"
+    )
+    bases = client.shards if isinstance(client, ShardedClient) else [client]
+    for base in bases:
+        if path.startswith(base.base_url):
+            path = path[len(base.base_url):]
+            break
+    try:
+        resp = client.get(path, token=token, stream=True)
+        with resp:
+            if resp.status_code != 200:
+                return dict(result, status="failed", error=f"HTTP {resp.status_code}")
+            digest, size, is_new = store.write(resp.iter_content(DOWNLOAD_CHUNK_SIZE))
+    except requests.RequestException as e:
+        return dict(result, status="failed", error=str(e))
+    except OSError as e:
+        return dict(result, status="failed", error=f"запись на диск: {e}")
+
+    saved_path = store.link(address, message_id, attachment.get("filename"), digest)
+    store.record(address, message_id, attachment, digest, size, saved_path)
+    status = "downloaded" if is_new else "deduplicated"
+    return dict(result, status=status, sha256=digest, size=size, path=saved_path)
+
+
+def download_message_attachments(address, token, message_id, store):
+    """Все вложения одного письма (подробности берутся из зеркала)."""
+    detail = get_mirror().detail(address, token, message_id)
+    if not detail:
+        return [{"address": address, "message_id": message_id,
+                 "status": "failed", "error": "письмо недоступно"}]
+    return [
+        download_attachment(token, address, message_id, att, store)
+        for att in detail.get("attachments", [])
+    ]
+
+
+def iter_attachment_jobs(accounts):
+    """Письма с вложениями в ящиках: (address, token, message_id), лениво."""
+    mirror = get_mirror()
+    for account in accounts:
+        token = get_cached_token(account)
+        if not token:
+            print_warning(f"Не удалось авторизоваться: {account['address']}")
+            continue
+        mirror.sync(account["address"], token)
+        for msg in mirror.messages(account["address"]):
+            if msg.get("hasAttachments"):
+                yield account["address"], token, msg["id"]
+
+
+def download_attachments(jobs, store, workers=DOWNLOAD_WORKERS):
+    """Параллельная загрузка вложений из многих писем.
+
+    jobs — итерируемое (address, token, message_id); читается лениво, в
+    работе не больше 2 × workers писем. Генератор отдаёт результаты по
+    каждому вложению по мере готовности.
+    """
+    jobs = iter(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        exhausted = False
+        while not exhausted or pending:
+            while not exhausted and len(pending) < workers * 2:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(download_message_attachments, *job, store))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+# ─────────────────────────── Уведомления (Mercure SSE) ───────────────────────────
+
+def _iter_sse(resp):
+    """Разбор потока server-sent events: (event_id, data) на каждое событие."""
+    event_id = None
+    data = []
+    # chunk_size=1: иначе requests копит буфер и задерживает события
+    for line in resp.iter_lines(chunk_size=1, decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event_id, "\n".join(data)
+            data = []
+            continue
+        if line.startswith(":"):
+            continue  # комментарий / heartbeat
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "data":
+            data.append(value)
+        elif field == "id":
+            event_id = value
+
+
+class WatchStop(threading.Event):
+    """Событие остановки watch_inbox из другого потока.
+
+    set() заодно обрывает сокет открытого потока SSE: иначе генератор
+    остался бы в блокирующем чтении до SSE_READ_TIMEOUT. Сам ответ закрывает
+    читающий поток — close() из другого потока ждал бы блокировку буфера,
+    которую держит чтение.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._stream_lock = threading.Lock()
+        self._stream = None
+
+    def attach(self, resp):
+        """Регистрация открытого потока; False — остановка уже запрошена."""
+        with self._stream_lock:
+            if self.is_set():
+                resp.close()
+                return False
+            self._stream = resp
+            return True
+
+    def detach(self):
+        with self._stream_lock:
+            self._stream = None
+
+    def set(self):
+        import socket
+
+        # Под блокировкой: читающий поток снимает регистрацию (detach) до
+        # закрытия ответа, так что дескриптор здесь ещё принадлежит потоку
+        with self._stream_lock:
+            super().set()
+            stream, self._stream = self._stream, None
+            if stream is None:
+                return
+            try:
+                with socket.socket(fileno=os.dup(stream.raw.fileno())) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, ValueError):
+                pass
+
+
+def watch_inbox(token, account_id, seen_ids, mercure_url=MERCURE_URL,
+                poll_interval=POLL_INTERVAL, on_status=None, stop=None):
+    """Генератор новых писем ящика.
+
+    Основной канал — подписка на Mercure-хаб (topic /accounts/{id}) с
+    переподключением и экспоненциальной паузой. Пока поток недоступен,
+    ящик опрашивается раз в poll_interval секунд. seen_ids — множество id
+    уже известных писем; пополняется по мере выдачи. stop (WatchStop)
+    завершает генератор из другого потока, в том числе во время чтения
+    потока или паузы между опросами.
+    """
+    stop = stop or WatchStop()
+
+    def status(state):
+        if on_status:
+            on_status(state)
+
+    def poll():
+        for msg in reversed(get_messages(token)):
+            if msg["id"] not in seen_ids:
+                seen_ids.add(msg["id"])
+                yield msg
+
+    backoff = SSE_BACKOFF_MIN
+    last_event_id = None
+    while not stop.is_set():
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else None
+        try:
+            resp = client.open_stream(
+                mercure_url, token=token, headers=headers,
+                params={"topic": f"/accounts/{account_id}"},
+            )
+            if not stop.attach(resp):
+                return
+            if resp.status_code == 401:
+                resp.close()
+                token = token_cache.refresh(token) or token
+                raise requests.RequestException("401 Unauthorized")
+            resp.raise_for_status()
+            status("stream")
+            backoff = SSE_BACKOFF_MIN
+            # Догоняем письма, пришедшие, пока подписки не было
+            yield from poll()
+            with resp, contextlib.ExitStack() as detach:
+                detach.callback(stop.detach)
+                for event_id, data in _iter_sse(resp):
+                    last_event_id = event_id or last_event_id
+                    try:
+                        payload = json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+                    if not isinstance(payload, dict):
+                        continue
+                    msg_id = payload.get("id")
+                    if payload.get("@type") == "Message" and msg_id:
+                        if msg_id not in seen_ids:
+                            seen_ids.add(msg_id)
+                            yield payload
+                    else:
+                        # Обновление аккаунта (например, счётчика used) —
+                        # сверяемся со списком писем
+                        yield from poll()
+        except Exception:
+            # Поток, закрытый из WatchStop.set(), обрывает чтение любым
+            # исключением urllib3 — это штатная остановка
+            if stop.is_set():
+                return
+            if not isinstance(sys.exc_info()[1], requests.RequestException):
+                raise
+        finally:
+            stop.detach()
+
+        # Поток недоступен: опрос до следующей попытки подключения
+        status("polling")
+        deadline = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+        while not stop.is_set():
+            yield from poll()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            stop.wait(min(poll_interval, remaining))
+        backoff = min(backoff * 2, SSE_BACKOFF_MAX)
+
+
+# ─────────────────────────── Коды подтверждения ───────────────────────────
+#
+# Правила компилируются один раз на вызов wait_for_code. Письмо сначала
+# проверяется по теме и intro из списка/события SSE — без лишних запросов;
+# тело загружается, только если там ничего не нашлось или совпадение
+# упирается в конец обрезанного intro.
+
+_OTP_KEYED = r"(?i)(?:code|код|otp|pin|passcode|пароль)\D{0,30}?(?<!\d)(\d{%s})(?!\d)"
+_OTP_BARE = r"(?<![\d.,:/-])(\d{%s})(?![\d.,:/-]?\d)"
+_URL = re.compile(r"""https?://[^\s<>"'()\[\]{}]+""")
+
+
+class CodeRule:
+    """Правило извлечения кода: регулярные выражения по порядку приоритета."""
+
+    def __init__(self, name, patterns, host=None):
+        self.name = name
+        self.patterns = patterns
+        self.host = host
+
+    def search(self, text):
+        """Первое совпадение в тексте: (значение, позиция конца) или None."""
+        for pattern in self.patterns:
+            for match in pattern.finditer(text):
+                value = match.group(1) if pattern.groups else match.group(0)
+                end = match.end(1) if pattern.groups else match.end()
+                if self.host is not None:
+                    value = value.rstrip(".,;:!?")
+                    end = match.start() + len(value)
+                    host = (urlsplit(value).hostname or "").lower()
+                    if self.host and host != self.host and not host.endswith("." + self.host):
+                        continue
+                return value, end
+        return None
+
+
+def compile_code_rules(specs=None):
+    """Правила из описаний: 'otp', 'otp:6', 'url', 'url:example.com', 're:<regex>'.
+
+    Строка без префикса считается регулярным выражением; если в нём есть
+    группа, кодом считается первая группа.
+    """
+    rules = []
+    for spec in specs or CODE_DEFAULT_RULES:
+        kind, _, arg = spec.partition(":")
+        if kind == "otp":
+            digits = arg if arg.isdigit() else "4,8"
+            rules.append(CodeRule(spec, [
+                re.compile(_OTP_KEYED % digits),
+                re.compile(_OTP_BARE % digits),
+            ]))
+        elif kind == "url":
+            rules.append(CodeRule(spec, [_URL], host=arg.lower()))
+        else:
+            regex = arg if kind == "re" else spec
+            rules.append(CodeRule(spec, [re.compile(regex)]))
+    return rules
+
+
+def _match_rules(rules, text, truncated_at=None):
+    for rule in rules:
+        found = rule.search(text)
+        if found and not (truncated_at and found[1] >= truncated_at):
+            return rule.name, found[0]
+    return None
+
+
+def extract_code(message, rules, token=None, address=None):
+    """Код из письма: {"rule", "code", "source"} или None.
+
+    Сначала проверяются тема и intro. Если intro длинное (сервер мог его
+    обрезать), совпадение у самого конца не засчитывается. Тело письма
+    загружается, только если нужно и передан token.
+    """
+    subject = message.get("subject") or ""
+    intro = message.get("intro") or ""
+    head = f"{subject}\n{intro}"
+    truncated_at = len(head) if len(intro) >= CODE_INTRO_MAX else None
+    found = _match_rules(rules, head, truncated_at)
+    if found:
+        return {"rule": found[0], "code": found[1], "source": "intro"}
+    if not token:
+        return None
+
+    detail = message if "text" in message else None
+    if detail is None:
+        if address:
+            detail = get_mirror().detail(address, token, message["id"])
+        else:
+            detail = get_message_detail(token, message["id"])
+    if not detail:
+        return None
+    body = "\n".join([detail.get("text") or ""] +
+                     [html_unescape(part) for part in detail.get("html") or []])
+    found = _match_rules(rules, f"{subject}\n{body}")
+    if found:
+        return {"rule": found[0], "code": found[1], "source": "body"}
+    return None
+
+
+def wait_for_code(address, pattern=None, timeout=CODE_TIMEOUT, since=None,
+                  mercure_url=MERCURE_URL):
+    """Ожидание письма с кодом в ящике address.
+
+    pattern — описание правила или список описаний (см. compile_code_rules),
+    по умолчанию OTP. Учитываются письма, пришедшие после вызова, а с
+    since (datetime) — и уже лежащие в ящике письма не старше since.
+    Возвращает словарь с кодом и данными письма или None по таймауту.
+    """
+    import queue
+
+    deadline = time.monotonic() + timeout
+    if isinstance(pattern, str):
+        pattern = [pattern]
+    rules = compile_code_rules(pattern)
+    account = find_account(address)
+    if not account:
+        raise KeyError(address)
+    token = get_cached_token(account)
+    if not token:
+        return None
+
+    def result(msg, found):
+        from_info = msg.get("from") or {}
+        return dict(found, address=address, message_id=msg["id"],
+                    subject=msg.get("subject"), sender=from_info.get("address"),
+                    created_at=msg.get("createdAt"))
+
+    mirror = get_mirror()
+    # Только новые письма: полная сверка задержала бы начало ожидания
+    mirror.sync(address, token, full=False)
+    seen_ids = mirror.known_ids(address)
+    if since is not None:
+        for msg in reversed(mirror.messages(address)):
+            created = _parse_api_time(msg.get("createdAt"))
+            if created and created >= since:
+                found = extract_code(msg, rules, token, address)
+                if found:
+                    return result(msg, found)
+
+    # watch_inbox блокируется на чтении потока — ждём его в фоне
+    events = queue.Queue()
+    stop = WatchStop()
+
+    def pump():
+        watcher = watch_inbox(token, account["id"], seen_ids,
+                              mercure_url=mercure_url, stop=stop)
+        try:
+            for msg in watcher:
+                events.put(msg)
+                if stop.is_set():
+                    break
+        finally:
+            watcher.close()
+
+    thread = threading.Thread(target=pump, daemon=True)
+    thread.start()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                msg = events.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            # Все увиденные письма — в зеркало: sync() остановится на первом
+            # известном id и более ранние уже не догонит
+            mirror.add(address, [msg])
+            found = extract_code(msg, rules, token, address)
+            if found:
+                return result(msg, found)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _parse_api_time(value):
+    """Время из ответа API (ISO 8601) как aware datetime или None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+# ─────────────────────────── Мониторинг многих ящиков ───────────────────────────
+
+class InboxState:
+    """Состояние одного ящика в мульти-мониторинге."""
+
+    def __init__(self, account):
+        self.account = account
+        self.seen_ids = None        # None — базовый список ещё не получен
+        self.interval = WATCH_MIN_INTERVAL
+        self.last_activity = 0.0
+        self.failures = 0
+
+    def is_active(self, now):
+        return now - self.last_activity < WATCH_ACTIVE_WINDOW
+
+
+class MultiInboxWatcher:
+    """Мониторинг сотен ящиков на одном планировщике.
+
+    Опросы всех ящиков идут через общий rate limit клиента. Планировщик —
+    куча по времени следующего опроса: ящик с новым письмом опрашивается
+    раз в WATCH_MIN_INTERVAL, молчащий — всё реже, вплоть до
+    WATCH_MAX_INTERVAL. При равном времени вперёд идут недавно активные.
+    """
+
+    def __init__(self, accounts, workers=WATCH_WORKERS):
+        self.workers = workers
+        self._states = [InboxState(acc) for acc in accounts]
+        self._heap = []
+        self._seq = itertools.count()
+        now = time.monotonic()
+        for state in self._states:
+            self._schedule(state, now)
+
+    def _schedule(self, state, due):
+        priority = 0 if state.is_active(time.time()) else 1
+        heapq.heappush(self._heap, (due, priority, next(self._seq), state))
+
+    def _poll(self, state):
+        """Опрос одного ящика; возвращает новые письма (от старых к новым)."""
+        token = get_cached_token(state.account)
+        if not token:
+            return None
+        # get_messages() прячет сбой за пустым списком — а сбой должен
+        # отодвинуть следующий опрос, а не выглядеть пустым ящиком
+        data = get_messages_page(token)
+        if data is None:
+            return None
+        messages = data.get("hydra:member", [])
+        if state.seen_ids is None:
+            state.seen_ids = {msg["id"] for msg in messages}
+            return []
+        new = [msg for msg in reversed(messages) if msg["id"] not in state.seen_ids]
+        state.seen_ids.update(msg["id"] for msg in new)
+        return new
+
+    def _reschedule(self, state, new_messages):
+        if new_messages is None:
+            state.failures += 1
+            state.interval = WATCH_MAX_INTERVAL
+        elif new_messages:
+            state.failures = 0
+            state.last_activity = time.time()
+            state.interval = WATCH_MIN_INTERVAL
+        else:
+            state.failures = 0
+            state.interval = min(state.interval * 1.5, WATCH_MAX_INTERVAL)
+        self._schedule(state, time.monotonic() + state.interval)
+
+    def watch(self):
+        """Генератор событий (account, message) по всем ящикам."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = {}
+            while self._heap or in_flight:
+                now = time.monotonic()
+                while (self._heap and self._heap[0][0] <= now
+                       and len(in_flight) < self.workers):
+                    state = heapq.heappop(self._heap)[3]
+                    in_flight[pool.submit(self._poll, state)] = state
+
+                timeout = 1.0
+                if self._heap:
+                    timeout = min(timeout, max(0.0, self._heap[0][0] - now))
+                if not in_flight:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    state = in_flight.pop(future)
+                    new_messages = future.result()
+                    self._reschedule(state, new_messages)
+                    for msg in new_messages or ():
+                        yield state.account, msg
+
+
+# ─────────────────────────── Async-клиент ───────────────────────────
+#
+# Асинхронный клиент на чистом asyncio: минимальный HTTP/1.1 с keep-alive
+# пулом соединений, без зависимостей помимо стандартной библиотеки.
+# Один event loop может обслуживать тысячи одновременных операций с ящиками.
+
+# asyncio.TimeoutError — это FuturesTimeoutError (3.8–3.10) или TimeoutError,
+# IncompleteReadError — подкласс EOFError; так asyncio не импортируется заранее.
+_ASYNC_NET_ERRORS = (OSError, EOFError, ValueError, FuturesTimeoutError)
+
+
+class AsyncTokenBucket:
+    """Token bucket для asyncio: не более rate запросов в секунду."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncResponse:
+    """Ответ async-клиента."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncMailTmClient:
+    """Асинхронный клиент Mail.tm с общим пулом соединений и семафором.
+
+    Создавать внутри работающего event loop (например, в `async def main()`).
+    """
+
+    def __init__(self, base_url=API_BASE, max_concurrency=ASYNC_MAX_CONCURRENCY,
+                 pool_size=API_POOL_SIZE, timeout=API_TIMEOUT,
+                 rate_limit=API_RATE_LIMIT):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._idle = []
+        self.rate_limiter = AsyncTokenBucket(rate_limit) if rate_limit else None
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ── Пул соединений ──
+
+    async def _acquire_connection(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self._ssl,
+            server_hostname=self.host if self._ssl else None,
+        )
+        self.connections_opened += 1
+        return reader, writer, False
+
+    def _release_connection(self, reader, writer, reusable):
+        if reusable and len(self._idle) < self.pool_size:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def close(self):
+        """Закрытие всех простаивающих соединений."""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    # ── HTTP/1.1 ──
+
+    async def _exchange(self, reader, writer, method, path, headers, body):
+        lines = [f"{method} {self.prefix}{path} HTTP/1.1", f"Host: {self.host}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        lines.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        status_code = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            resp_headers[name.strip().lower()] = value.strip()
+
+        reusable = resp_headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status_code in (204, 304) or status_code < 200:
+            content = b""
+        elif resp_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b"".join(chunks)
+        elif "content-length" in resp_headers:
+            content = await reader.readexactly(int(resp_headers["content-length"]))
+        else:
+            content = await reader.read()
+            reusable = False
+        return AsyncResponse(status_code, resp_headers, content), reusable
+
+    async def request(self, method, path, token=None, json_body=None, idempotent=None):
+        """Запрос к API через пул соединений.
+
+        idempotent — можно ли повторить запрос после обрыва соединения; по
+        умолчанию все методы, кроме POST.
+        """
+        if idempotent is None:
+            idempotent = method != "POST"
+        headers = dict(HEADERS)
+        headers["Accept-Encoding"] = "identity"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        body = b"" if json_body is None else json.dumps(json_body).encode("utf-8")
+        endpoint = endpoint_key(method, path)
+
+        async with self._semaphore:
+            if self.rate_limiter:
+                started = time.perf_counter()
+                await self.rate_limiter.acquire()
+                metrics.inc("mailtm_ratelimit_acquire_total")
+                metrics.inc("mailtm_ratelimit_wait_seconds_total",
+                            time.perf_counter() - started)
+            for attempt in range(2):
+                reader, writer, reused = await self._acquire_connection()
+                started = time.perf_counter()
+                try:
+                    resp, reusable = await asyncio.wait_for(
+                        self._exchange(reader, writer, method, path, headers, body),
+                        self.timeout,
+                    )
+                except _ASYNC_NET_ERRORS:
+                    writer.close()
+                    metrics.inc("mailtm_requests_total", endpoint=endpoint, status="error")
+                    # Сервер мог закрыть простаивающее соединение — повторяем
+                    # один раз на свежем. POST мог дойти до сервера, поэтому
+                    # неидемпотентные запросы не повторяются.
+                    if reused and attempt == 0 and idempotent:
+                        metrics.inc("mailtm_retries_total", endpoint=endpoint, reason="network")
+                        continue
+                    raise
+                finally:
+                    metrics.observe("mailtm_request_duration_seconds",
+                                    time.perf_counter() - started, endpoint=endpoint)
+                metrics.inc("mailtm_requests_total", endpoint=endpoint, status=resp.status_code)
+                self.requests_sent += 1
+                self._release_connection(reader, writer, reusable)
+                return resp
+
+    def pool_stats(self):
+        """Статистика пула: запросы, новые соединения и доля переиспользования."""
+        hit_rate = 0.0
+        if self.requests_sent:
+            hit_rate = max(0.0, 1 - self.connections_opened / self.requests_sent)
+        return {
+            "requests": self.requests_sent,
+            "connections": self.connections_opened,
+            "hit_rate": hit_rate,
+        }
+
+    # ── API ──
+
+    async def get_available_domains(self):
+        """Получение списка доступных доменов."""
+        try:
+            resp = await self.request("GET", "/domains")
+            if resp.status_code != 200:
+                print_error(f"Ошибка получения доменов: {resp.status_code}")
+                return []
+            return [
+                m["domain"] for m in resp.json().get("hydra:member", [])
+                if m.get("isActive")
+            ]
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка получения доменов: {e!r}")
+            return []
+
+    async def create_account(self, address, password):
+        """Создание нового email-аккаунта."""
+        payload = {"address": address, "password": password}
+        try:
+            resp = await self.request("POST", "/accounts", json_body=payload)
+            if resp.status_code == 201:
+                return resp.json()
+            elif resp.status_code == 422:
+                print_error("Этот email уже занят. Попробуйте другое имя.")
+                return None
+            else:
+                print_error(f"Ошибка создания: {resp.status_code} — {resp.text}")
+                return None
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка сети: {e!r}")
+            return None
+
+    async def get_token(self, address, password):
+        """Получение токена авторизации."""
+        payload = {"address": address, "password": password}
+        try:
+            resp = await self.request("POST", "/token", json_body=payload, idempotent=True)
+            if resp.status_code == 200:
+                return resp.json().get("token")
+            print_error(f"Ошибка авторизации: {resp.status_code}")
+            return None
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка сети: {e!r}")
+            return None
+
+    async def get_messages(self, token):
+        """Получение списка сообщений."""
+        try:
+            resp = await self.request("GET", "/messages", token=token)
+            if resp.status_code == 200:
+                return resp.json().get("hydra:member", [])
+            print_error(f"Ошибка получения сообщений: {resp.status_code}")
+            return []
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка сети: {e!r}")
+            return []
+
+    async def get_message_detail(self, token, message_id):
+        """Получение подробностей сообщения."""
+        try:
+            resp = await self.request("GET", f"/messages/{message_id}", token=token)
+            if resp.status_code == 200:
+                return resp.json()
+            print_error(f"Ошибка чтения сообщения: {resp.status_code}")
+            return None
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка сети: {e!r}")
+            return None
+
+    async def delete_message(self, token, message_id):
+        """Удаление сообщения."""
+        try:
+            resp = await self.request("DELETE", f"/messages/{message_id}", token=token)
+            return resp.status_code == 204
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка сети: {e!r}")
+            return False
+
+    async def delete_account(self, token, account_id):
+        """Удаление аккаунта."""
+        try:
+            resp = await self.request("DELETE", f"/accounts/{account_id}", token=token)
+            return resp.status_code == 204
+        except _ASYNC_NET_ERRORS as e:
+            print_error(f"Ошибка сети: {e!r}")
+            return False
+
+
+# ─────────────────────────── Массовая генерация ───────────────────────────
+
+def _create_random_account(domain, credentials=None):
+    """Создание одного аккаунта со случайными данными и сохранение в хранилище."""
+    if credentials:
+        address, password = credentials.next(domain)
+    else:
+        address = f"{generate_random_username()}@{domain}"
+        password = generate_random_password()
+    result = create_account(address, password)
+    if not result:
+        return address, None
+    account_data = {
+        "id": result.get("id"),
+        "address": address,
+        "password": password,
+        "created_at": datetime.now().isoformat(),
+    }
+    add_account(account_data)
+    return address, account_data
+
+
+def create_accounts_bulk(count, domain=None, workers=BULK_WORKERS,
+                         strategy=DOMAIN_STRATEGY):
+    """Параллельное создание аккаунтов под общим rate limit.
+
+    Генератор отдаёт пары (address, account_data | None) по мере готовности.
+    В работе держится не более 2 × workers задач, так что память не зависит
+    от count. Учётные данные берутся из CredentialGenerator, который не
+    выдаёт адресов, уже известных хранилищу. Без domain аккаунты
+    распределяются по всем активным доменам (см. DomainRotator).
+    """
+    rotator = DomainRotator([domain] if domain else get_domains(), strategy=strategy)
+    credentials = CredentialGenerator(batch_size=min(max(count, 16), 4096),
+                                      expected=count)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        submitted = 0
+        while submitted < count or pending:
+            while submitted < count and len(pending) < workers * 2:
+                pending.add(pool.submit(_create_random_account, rotator.next(),
+                                        credentials))
+                submitted += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+# ─────────────────────────── Массовое удаление ───────────────────────────
+
+def parse_duration(value):
+    """Разбор длительности: '90' (сек), '30m', '12h', '7d' → timedelta."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return timedelta(seconds=float(value[:-1]) * units[value[-1]])
+    return timedelta(seconds=float(value))
+
+
+def filter_accounts(accounts, older_than=None, pattern=None):
+    """Ленивый фильтр аккаунтов по возрасту (timedelta) и glob-шаблону адреса."""
+    cutoff = datetime.now() - older_than if older_than else None
+    for acc in accounts:
+        if pattern and not fnmatch.fnmatch(acc["address"], pattern):
+            continue
+        if cutoff:
+            try:
+                if datetime.fromisoformat(acc.get("created_at", "")) > cutoff:
+                    continue
+            except ValueError:
+                continue
+        yield acc
+
+
+def select_accounts(accounts, older_than=None, pattern=None):
+    """Отбор аккаунтов по возрасту (timedelta) и glob-шаблону адреса."""
+    return list(filter_accounts(accounts, older_than=older_than, pattern=pattern))
+
+
+def _delete_remote(account):
+    token = get_cached_token(account)
+    return bool(token) and delete_account(token, account["id"])
+
+
+def delete_accounts_bulk(accounts, workers=BULK_WORKERS):
+    """Параллельное удаление аккаунтов с сервера под общим rate limit.
+
+    Генератор отдаёт пары (account, deleted) по мере готовности.
+    """
+    remaining = iter(accounts)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            for account in remaining:
+                pending[pool.submit(_delete_remote, account)] = account
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def remove_accounts(addresses):
+    """Удаление аккаунтов из хранилища одной записью, а также их токенов и писем."""
+    addresses = set(addresses)
+    if not addresses:
+        return
+    get_index().remove(addresses)
+    mirror = get_mirror()
+    for address in addresses:
+        token_cache.invalidate(address)
+        mirror.remove(address)
+
+
+def cleanup_accounts(accounts, workers=BULK_WORKERS, force=False, on_result=None):
+    """Массовое удаление: сервер параллельно, хранилище — одним обновлением.
+
+    С force=True из хранилища убираются и аккаунты, которые не удалось
+    удалить на сервере. Возвращает статистику.
+    """
+    removed = []
+    failed = []
+    started = time.monotonic()
+    for account, deleted in delete_accounts_bulk(accounts, workers=workers):
+        (removed if deleted else failed).append(account["address"])
+        if on_result:
+            on_result(account, deleted)
+    elapsed = time.monotonic() - started
+    remove_accounts(removed + (failed if force else []))
+    return {
+        "deleted": len(removed),
+        "failed": len(failed),
+        "failed_addresses": failed,
+        "elapsed": round(elapsed, 3),
+        "per_second": round(len(accounts) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+# ─────────────────────────── Очистка ящиков ───────────────────────────
+#
+# Письма на сервере копятся, и каждый опрос ящика тянет всё более длинный
+# список. Очистка обходит ящики по одному, лениво читает страницы писем,
+# отбирает подходящие по возрасту, отправителю и теме и удаляет их
+# параллельно под общим rate limit. Список ящика дочитывается до начала
+# удалений в нём: удаление сдвигает страницы, и обход вперемешку с
+# удалением пропускал бы письма.
+
+def filter_messages(messages, older_than=None, sender=None, subject=None):
+    """Ленивый фильтр писем по возрасту (timedelta), glob-шаблону отправителя
+    и подстроке темы (без учёта регистра)."""
+    cutoff = datetime.now(timezone.utc) - older_than if older_than else None
+    sender = sender.lower() if sender else None
+    subject = subject.lower() if subject else None
+    for msg in messages:
+        if sender:
+            address = ((msg.get("from") or {}).get("address") or "").lower()
+            if not fnmatch.fnmatch(address, sender):
+                continue
+        if subject and subject not in (msg.get("subject") or "").lower():
+            continue
+        if cutoff:
+            created = _parse_api_time(msg.get("createdAt"))
+            if created is None or created > cutoff:
+                continue
+        yield msg
+
+
+def purge_messages(accounts, older_than=None, sender=None, subject=None,
+                   workers=BULK_WORKERS, dry_run=False, on_result=None):
+    """Удаление писем из ящиков по фильтрам. Возвращает статистику.
+
+    on_result(address, message, deleted) вызывается для каждого отобранного
+    письма; с dry_run=True письма только отбираются (deleted=None).
+    """
+    stats = dict.fromkeys(("inboxes", "unreachable", "matched", "deleted", "failed"), 0)
+    removed = {}                # address -> id удалённых писем (для зеркала)
+    pending = {}
+    started = time.monotonic()
+
+    def finish(done):
+        for future in done:
+            address, message = pending.pop(future)
+            deleted = future.result()
+            stats["deleted" if deleted else "failed"] += 1
+            metrics.inc("mailtm_purge_messages_total",
+                        result="deleted" if deleted else "failed")
+            if deleted:
+                removed.setdefault(address, []).append(message["id"])
+            if on_result:
+                on_result(address, message, deleted)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for account in accounts:
+            address = account["address"]
+            token = get_cached_token(account)
+            if not token:
+                stats["unreachable"] += 1
+                continue
+            stats["inboxes"] += 1
+            matched = list(filter_messages(iter_messages(token), older_than=older_than,
+                                           sender=sender, subject=subject))
+            stats["matched"] += len(matched)
+            for message in matched:
+                if dry_run:
+                    if on_result:
+                        on_result(address, message, None)
+                    continue
+                pending[pool.submit(delete_message, token, message["id"])] = (address, message)
+                if len(pending) >= workers * 2:
+                    finish(wait(pending, return_when=FIRST_COMPLETED)[0])
+        while pending:
+            finish(wait(pending, return_when=FIRST_COMPLETED)[0])
+    elapsed = time.monotonic() - started
+
+    if removed:
+        mirror = get_mirror()
+        for address, message_ids in removed.items():
+            mirror.remove(address, message_ids)
+    stats["elapsed"] = round(elapsed, 3)
+    stats["per_second"] = round(stats["deleted"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+
+# ─────────────────────────── Проверка аккаунтов ───────────────────────────
+#
+# Сервер удаляет аккаунты по сроку, а хранилище о них помнит: каждое
+# действие с таким аккаунтом платит за неудачный get_token. Проверка
+# параллельно, под общим rate limit, получает токен и запрашивает /me.
+# Результат записывается в хранилище одним обновлением: поле "health"
+# ("ok", "dead" или "error"), "checked_at" и "verified_at" — время последней
+# успешной проверки. Мёртвые аккаунты удаляются или переносятся в
+# карантинный файл в том же проходе.
+
+def verify_account(account):
+    """Проверка аккаунта на сервере: "ok", "dead" или "error" (ответ неизвестен)."""
+    payload = {"address": account["address"], "password": account["password"]}
+    try:
+        resp = client.post("/token", json=payload, idempotent=True)
+        if resp.status_code == 401:
+            return "dead"
+        if resp.status_code != 200:
+            return "error"
+        token = resp.json().get("token")
+        resp = client.get("/me", token=token)
+    except (requests.RequestException, ValueError):
+        return "error"
+    if resp.status_code in (401, 404):
+        return "dead"
+    if resp.status_code != 200:
+        return "error"
+    token_cache.put(account["address"], account["password"], token)
+    return "ok"
+
+
+def verify_accounts_bulk(accounts, workers=BULK_WORKERS):
+    """Параллельная проверка аккаунтов под общим rate limit.
+
+    Генератор отдаёт пары (account, health) по мере готовности.
+    """
+    remaining = iter(accounts)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            for account in remaining:
+                pending[pool.submit(verify_account, account)] = account
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def filter_unverified(accounts, verified_before=None):
+    """Ленивый фильтр: аккаунты без успешной проверки за последние verified_before."""
+    if verified_before is None:
+        yield from accounts
+        return
+    cutoff = (datetime.now() - verified_before).isoformat()
+    for acc in accounts:
+        if acc.get("verified_at", "") < cutoff:
+            yield acc
+
+
+def quarantine_accounts(accounts, path=QUARANTINE_FILE):
+    """Дописывание записей аккаунтов в карантинный файл (JSON Lines)."""
+    with open(path, "a", encoding="utf-8") as f:
+        for acc in accounts:
+            f.write(json.dumps(acc, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def sweep_accounts(accounts, workers=BULK_WORKERS, prune=False, dry_run=False,
+                   on_result=None):
+    """Проверка аккаунтов и запись результатов в хранилище одним обновлением.
+
+    Мёртвые аккаунты уходят в QUARANTINE_FILE, а с prune=True удаляются
+    без следа. С dry_run=True хранилище не меняется. Возвращает статистику.
+    """
+    checked = {}
+    counts = dict.fromkeys(("ok", "dead", "error"), 0)
+    started = time.monotonic()
+    for account, health in verify_accounts_bulk(accounts, workers=workers):
+        checked[account["address"]] = health
+        counts[health] += 1
+        metrics.inc("mailtm_sweep_accounts_total", result=health)
+        if on_result:
+            on_result(account, health)
+    elapsed = time.monotonic() - started
+
+    dead = [address for address, health in checked.items() if health == "dead"]
+    if checked and not dry_run:
+        now = datetime.now().isoformat()
+        buried = []
+
+        def apply(stored):
+            kept = []
+            for acc in stored:
+                health = checked.get(acc["address"])
+                if health is None:
+                    kept.append(acc)
+                    continue
+                acc = dict(acc, health=health, checked_at=now)
+                if health == "ok":
+                    acc["verified_at"] = now
+                (buried if health == "dead" else kept).append(acc)
+            if buried and not prune:
+                # Карантин пишется до снимка: при сбое запись продублируется, но не потеряется
+                quarantine_accounts(buried)
+            return kept
+
+        _store.update(apply)
+        mirror = get_mirror()
+        for address in dead:
+            token_cache.invalidate(address)
+            mirror.remove(address)
+
+    total = len(checked)
+    return dict(
+        counts,
+        checked=total,
+        dead_addresses=dead,
+        elapsed=round(elapsed, 3),
+        per_second=round(total / elapsed, 2) if elapsed else 0.0,
+    )
+
+
+# ─────────────────────────── Пул готовых ящиков ───────────────────────────
+#
+# Демон держит POOL_SIZE созданных и авторизованных аккаунтов и выдаёт их
+# по локальному HTTP (TCP или Unix-сокет): аренда — это словарь из памяти,
+# без обращений к API. Пополнение идёт в фоне под общим rate limit,
+# возвращённые и просроченные ящики удаляются пакетами через
+# cleanup_accounts. Аккаунты пула помечены в хранилище полем "pool" и после
+# перезапуска подхватываются снова, если их ящики пусты. Каждая выдача до
+# ответа клиенту дописывается в POOL_LEASES_FILE: аккаунт, выданный до
+# аварийного завершения, при подхвате удаляется, а не выдаётся второй раз.
+
+class InboxPool:
+    """Пул заранее созданных ящиков с арендой и фоновым пополнением."""
+
+    def __init__(self, size=POOL_SIZE, domain=None, lease_ttl=POOL_LEASE_TTL,
+                 workers=POOL_WORKERS, leases_path=POOL_LEASES_FILE):
+        self.size = size
+        self.domain = domain
+        self.lease_ttl = lease_ttl
+        self.workers = workers
+        self.leases_path = leases_path
+        self._leases_fd = None
+        self._leases_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._ready = []            # [(account, token, exp)], старые — первыми
+        self._leases = {}           # lease_id -> (account, token, expires_at)
+        self._retiring = []         # аккаунты к удалению
+        self._creating = 0
+        self._stopped = threading.Event()
+        self._threads = []
+        self._credentials = CredentialGenerator(expected=size * 4)
+        self._rotator = None
+        self.stats = {"created": 0, "leased": 0, "retired": 0, "failed": 0, "adopted": 0}
+
+    # ── Жизненный цикл ──
+
+    def start(self):
+        """Подхват ящиков из хранилища и запуск фоновых потоков."""
+        self._adopt()
+        for _ in range(self.workers):
+            self._spawn(self._refill_loop)
+        self._spawn(self._janitor_loop)
+
+    def _spawn(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, retire_leased=True):
+        """Остановка. Выданные ящики удаляются, готовые остаются в хранилище."""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+            if retire_leased:
+                self._retiring.extend(acc for acc, _, _ in self._leases.values())
+                self._leases.clear()
+        for thread in self._threads:
+            thread.join(timeout=API_TIMEOUT)
+        self._retire_pending()
+        with self._leases_lock:
+            if self._leases_fd is not None:
+                os.close(self._leases_fd)
+                self._leases_fd = None
+
+    def _record_lease(self, account, lease_id):
+        """Запись выдачи в журнал до ответа клиенту.
+
+        Запись без fsync: она переживает аварийное завершение процесса, но
+        не сбой питания — как и журнал хранилища между fsync.
+        """
+        line = json.dumps({"address": account["address"], "lease_id": lease_id,
+                           "leased_at": datetime.now().isoformat()}) + "\n"
+        with self._leases_lock:
+            if self._leases_fd is None:
+                self._leases_fd = os.open(
+                    self.leases_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+                )
+            os.write(self._leases_fd, line.encode("utf-8"))
+
+    def _load_leased(self, pooled):
+        """Адреса из журнала выдач. Журнал сокращается до аккаунтов, ещё
+        лежащих в хранилище: удалённые из него больше не нужны."""
+        entries = []
+        try:
+            with open(self.leases_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # оборванная запись
+                    if isinstance(entry, dict) and entry.get("address") in pooled:
+                        entries.append(entry)
+        except FileNotFoundError:
+            return set()
+        tmp_path = f"{self.leases_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.leases_path)
+        return {entry["address"] for entry in entries}
+
+    def _adopt(self):
+        pooled = [acc for acc in iter_accounts() if acc.get("pool")]
+        leased = self._load_leased({acc["address"] for acc in pooled})
+        for account in pooled:
+            if account["address"] in leased or len(self._ready) >= self.size:
+                # Выдан до перезапуска или лишний — удаляем, а не раздаём
+                self._retiring.append(account)
+                continue
+            token = get_cached_token(account)
+            page = get_messages_page(token) if token else None
+            if page is not None and not page.get("hydra:member"):
+                self._ready.append((account, token, _jwt_expiry(token) or 0))
+                self.stats["adopted"] += 1
+            else:
+                # Ящик мог быть выдан до перезапуска — не раздаём повторно
+                self._retiring.append(account)
+        self._update_gauges()
+
+    # ── Аренда ──
+
+    def lease(self, wait=0):
+        """Выдача готового ящика. Ждёт до wait секунд; None — пул пуст."""
+        started = time.monotonic()
+        deadline = started + wait
+        with self._cond:
+            while not self._ready:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopped.is_set():
+                    metrics.inc("mailtm_pool_leases_total", result="empty")
+                    return None
+                self._cond.wait(remaining)
+            account, token, _ = self._ready.pop(0)
+            lease_id = secrets.token_urlsafe(12)
+            expires_at = time.time() + self.lease_ttl
+            self._leases[lease_id] = (account, token, expires_at)
+            self.stats["leased"] += 1
+            self._cond.notify_all()
+        self._record_lease(account, lease_id)
+        metrics.inc("mailtm_pool_leases_total", result="ok")
+        metrics.observe("mailtm_pool_lease_wait_seconds", time.monotonic() - started)
+        self._update_gauges()
+        return {
+            "lease_id": lease_id,
+            "address": account["address"],
+            "password": account["password"],
+            "id": account["id"],
+            "token": token,
+            "expires_at": datetime.fromtimestamp(expires_at, timezone.utc).isoformat(),
+        }
+
+    def release(self, lease_id):
+        """Возврат ящика: он удаляется при следующем проходе уборщика."""
+        with self._cond:
+            lease = self._leases.pop(lease_id, None)
+            if lease is None:
+                return False
+            self._retiring.append(lease[0])
+            self._cond.notify_all()
+        self._update_gauges()
+        return True
+
+    def status(self):
+        with self._cond:
+            return dict(
+                self.stats,
+                size=self.size,
+                ready=len(self._ready),
+                leases=len(self._leases),
+                creating=self._creating,
+                retiring=len(self._retiring),
+            )
+
+    def _update_gauges(self):
+        status = self.status()
+        for key in ("ready", "leases", "creating", "retiring"):
+            metrics.set("mailtm_pool_inboxes", status[key], state=key)
+
+    # ── Фоновые потоки ──
+
+    def _refill_loop(self):
+        backoff = SSE_BACKOFF_MIN
+        while not self._stopped.is_set():
+            with self._cond:
+                while (len(self._ready) + self._creating >= self.size
+                       and not self._stopped.is_set()):
+                    self._cond.wait()
+                if self._stopped.is_set():
+                    return
+                self._creating += 1
+            entry = None
+            try:
+                entry = self._create()
+            finally:
+                with self._cond:
+                    self._creating -= 1
+                    if entry:
+                        self._ready.append(entry)
+                        self.stats["created"] += 1
+                    else:
+                        self.stats["failed"] += 1
+                    self._cond.notify_all()
+                self._update_gauges()
+            if entry:
+                backoff = SSE_BACKOFF_MIN
+            else:
+                # Сервер недоступен или лимит — не долбим его впустую
+                self._stopped.wait(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, SSE_BACKOFF_MAX)
+
+    def _create(self):
+        if self._rotator is None:
+            domains = [self.domain] if self.domain else get_domains()
+            if not domains:
+                return None
+            self._rotator = DomainRotator(domains)
+        address, password = self._credentials.next(self._rotator.next())
+        result = create_account(address, password)
+        if not result:
+            return None
+        account = {
+            "id": result.get("id"),
+            "address": address,
+            "password": password,
+            "created_at": datetime.now().isoformat(),
+            "pool": True,
+        }
+        add_account(account)
+        token = get_cached_token(account)
+        if not token:
+            with self._cond:
+                self._retiring.append(account)
+            return None
+        return account, token, _jwt_expiry(token) or 0
+
+    def _janitor_loop(self):
+        while not self._stopped.wait(POOL_JANITOR_INTERVAL):
+            now = time.time()
+            with self._cond:
+                expired = [lid for lid, (_, _, exp) in self._leases.items() if exp <= now]
+                for lease_id in expired:
+                    self._retiring.append(self._leases.pop(lease_id)[0])
+                stale = [entry for entry in self._ready
+                         if entry[2] and entry[2] - now < TOKEN_REFRESH_MARGIN * 2]
+            for entry in stale:
+                self._refresh_token(entry)
+            self._retire_pending()
+
+    def _refresh_token(self, entry):
+        """Новый токен для готового ящика, пока старый не истёк."""
+        account, token, _ = entry
+        new_token = token_cache.refresh(token)
+        with self._cond:
+            if entry not in self._ready:
+                return          # ящик уже выдан
+            index = self._ready.index(entry)
+            if new_token:
+                self._ready[index] = (account, new_token, _jwt_expiry(new_token) or 0)
+            else:
+                self._retiring.append(self._ready.pop(index)[0])
+
+    def _retire_pending(self):
+        with self._cond:
+            batch, self._retiring = self._retiring, []
+        if not batch:
+            return
+        stats = cleanup_accounts(batch, workers=min(len(batch), BULK_WORKERS))
+        failed = set(stats["failed_addresses"])
+        with self._cond:
+            self.stats["retired"] += stats["deleted"]
+            if failed and not self._stopped.is_set():
+                # Повторим на следующем проходе
+                self._retiring.extend(acc for acc in batch if acc["address"] in failed)
+        self._update_gauges()
+
+
+def _parse_pool_endpoint(endpoint):
+    """'127.0.0.1:8026' → ('tcp', (host, port)); 'unix:/path' → ('unix', path)."""
+    if endpoint.startswith("unix:"):
+        return "unix", endpoint[5:]
+    host, _, port = endpoint.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def serve_pool(pool, endpoint=POOL_ENDPOINT):
+    """HTTP-сервер пула в фоновом потоке. Возвращает сервер.
+
+    POST /lease?wait=N — выдать ящик (503, если пуст), POST /release/<id> —
+    вернуть, GET /status — состояние, GET /metrics — метрики Prometheus.
+    """
+    import socketserver
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, obj=None, body=None, content_type="application/json"):
+            if body is None:
+                body = b"" if obj is None else json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def handle(self):
+            # Клиент закрыл соединение раньше времени — не ошибка сервера
+            with contextlib.suppress(ConnectionError):
+                super().handle()
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == "/status":
+                self._send(200, pool.status())
+            elif path == "/metrics":
+                self._send(200, body=metrics.render().encode("utf-8"),
+                           content_type="text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self._send(404, {"detail": "not found"})
+
+        def do_POST(self):
+            parts = urlsplit(self.path)
+            if parts.path == "/lease":
+                try:
+                    wait = float(parse_qs(parts.query).get("wait", ["0"])[0])
+                except ValueError:
+                    wait = 0
+                lease = pool.lease(wait=min(wait, POOL_MAX_WAIT))
+                if lease:
+                    self._send(200, lease)
+                else:
+                    self._send(503, {"detail": "pool empty"})
+            elif parts.path.startswith("/release/"):
+                released = pool.release(parts.path[len("/release/"):])
+                self._send(204 if released else 404)
+            else:
+                self._send(404, {"detail": "not found"})
+
+        def log_message(self, *args):
+            pass
+
+    kind, address = _parse_pool_endpoint(endpoint)
+    if kind == "unix":
+        class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(address)
+        server = UnixServer(address, Handler)
+    else:
+        server = ThreadingHTTPServer(address, Handler)
+        server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def pool_request(method, path, endpoint=POOL_ENDPOINT, timeout=API_TIMEOUT):
+    """Запрос к демону пула. Возвращает (статус, JSON-ответ или None)."""
+    import http.client
+    import socket
+
+    kind, address = _parse_pool_endpoint(endpoint)
+    if kind == "unix":
+        conn = http.client.HTTPConnection("localhost", timeout=timeout)
+        conn.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.sock.settimeout(timeout)
+        conn.sock.connect(address)
+    else:
+        conn = http.client.HTTPConnection(*address, timeout=timeout)
+    try:
+        conn.request(method, path)
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, json.loads(body) if body else None
+    finally:
+        conn.close()
+
+
+# ─────────────────────────── Экспорт ───────────────────────────
+
+def _export_txt(out, accounts):
+    out.write("=" * 60 + "\n")
+    out.write("  Mail.tm — Экспорт аккаунтов\n")
+    out.write(f"  Дата: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
+    out.write("=" * 60 + "\n\n")
+    count = 0
+    for count, acc in enumerate(accounts, 1):
+        out.write(
+            f"[{count}]\n"
+            f"  Email:    {acc['address']}\n"
+            f"  Password: {acc['password']}\n"
+            f"  ID:       {acc.get('id', 'N/A')}\n"
+            f"  Created:  {acc.get('created_at', 'N/A')}\n"
+            + "-" * 40 + "\n"
+        )
+    out.write(f"\nВсего: {count} аккаунт(ов)\n")
+    return count
+
+
+def _export_csv(out, accounts):
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for count, acc in enumerate(accounts, 1):
+        writer.writerow(acc)
+    return count
+
+
+def _export_jsonl(out, accounts):
+    count = 0
+    for count, acc in enumerate(accounts, 1):
+        out.write(json.dumps(acc, ensure_ascii=False) + "\n")
+    return count
+
+
+EXPORTERS = {"txt": _export_txt, "csv": _export_csv, "jsonl": _export_jsonl}
+
+
+def export_accounts(path, fmt="txt", older_than=None, pattern=None,
+                    compress=False):
+    """Потоковый экспорт хранилища в txt/csv/jsonl (опционально gzip).
+
+    Аккаунты читаются из хранилища по одному (AccountStore.iter) и пишутся
+    через буфер EXPORT_BUFFER_SIZE, так что память не зависит от размера
+    хранилища. Исключение — снимок старого формата (JSON-массив), который
+    читается целиком до первого сворачивания журнала.
+    path="-" — вывод в stdout. Возвращает число выгруженных аккаунтов.
+    """
+    accounts = filter_accounts(iter_accounts(), older_than=older_than, pattern=pattern)
+    if path == "-":
+        sys.stdout.flush()
+        raw = open(sys.stdout.fileno(), "wb", buffering=EXPORT_BUFFER_SIZE,
+                   closefd=False)
+    else:
+        raw = open(path, "wb", buffering=EXPORT_BUFFER_SIZE)
+    binary = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+    out = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+    try:
+        return EXPORTERS[fmt](out, accounts)
+    finally:
+        out.flush()
+        if compress:
+            binary.close()
+        raw.close()
+
+
 # ─────────────────────────── Интерактивные действия ───────────────────────────
 
 def action_create_single():
@@ -271,7 +4071,7 @@ def action_create_single():
     print(f"  {C.BOLD}📨 Создание нового email-ящика{C.RESET}")
     print_separator()
 
-    domains = get_available_domains()
+    domains = get_domains()
     if not domains:
         print_error("Нет доступных доменов. Попробуйте позже.")
         return
@@ -336,85 +4136,148 @@ def action_create_bulk():
     print(f"  {C.BOLD}📦 Массовая генерация аккаунтов{C.RESET}")
     print_separator()
 
-    domains = get_available_domains()
+    domains = get_domains()
     if not domains:
         print_error("Нет доступных доменов.")
         return
 
-    selected_domain = domains[0]
-    print_info(f"Используется домен: @{selected_domain}")
+    if len(domains) == 1:
+        print_info(f"Используется домен: @{domains[0]}")
+    else:
+        print_info(f"Домены по очереди: {', '.join('@' + d for d in domains)}")
 
     try:
-        count = int(input(f"\n  Количество аккаунтов (1-20): ").strip())
-        count = max(1, min(count, 20))
+        count = int(input(f"\n  Количество аккаунтов: ").strip())
+        count = max(1, count)
     except ValueError:
         count = 3
 
     print(f"\n  {C.DIM}Генерация {count} аккаунтов...{C.RESET}\n")
 
     created = 0
-    for i in range(count):
-        username = generate_random_username()
-        address = f"{username}@{selected_domain}"
-        password = generate_random_password()
-
-        result = create_account(address, password)
-        if result:
-            account_data = {
-                "id": result.get("id"),
-                "address": address,
-                "password": password,
-                "created_at": datetime.now().isoformat(),
-            }
-            add_account(account_data)
+    started = time.monotonic()
+    for address, account_data in create_accounts_bulk(count):
+        if account_data:
             created += 1
             print(
                 f"    {C.GREEN}[{created}/{count}]{C.RESET} {C.CYAN}{address}{C.RESET}"
-                f"  |  🔑 {C.YELLOW}{password}{C.RESET}"
+                f"  |  🔑 {C.YELLOW}{account_data['password']}{C.RESET}"
             )
         else:
             print(f"    {C.RED}[✗]{C.RESET} Не удалось создать {address}")
-
-        # Пауза между запросами (rate limit: 8 QPS)
-        if i < count - 1:
-            time.sleep(0.3)
+    elapsed = time.monotonic() - started
 
     print()
     print_separator()
     print_success(f"Создано {created} из {count} аккаунтов")
+    if elapsed > 0:
+        print_info(f"Скорость: {created / elapsed:.1f} акк/сек за {elapsed:.1f} сек")
     print_info(f"Все данные сохранены в {ACCOUNTS_FILE}")
 
 
+def _format_created(acc):
+    created = acc.get("created_at", "N/A")
+    if created != "N/A":
+        try:
+            dt = datetime.fromisoformat(created)
+            created = dt.strftime("%d.%m.%Y %H:%M")
+        except ValueError:
+            pass
+    return created
+
+
+def pick_account(title="Выберите аккаунт"):
+    """Постраничный выбор аккаунта через индекс.
+
+    Номер — выбор, n/p — следующая/предыдущая страница, иной текст — поиск
+    по адресу или его началу, Enter — отмена.
+    """
+    index = get_index()
+    total = index.count()
+    if not total:
+        return None
+    size = ACCOUNTS_PAGE_SIZE
+    pages = (total + size - 1) // size
+    page = 0
+    while True:
+        rows = index.page(page)
+        print(f"\n  {C.CYAN}{title} (стр. {page + 1}/{pages}, всего {total}):{C.RESET}")
+        for i, acc in enumerate(rows, page * size + 1):
+            print(f"    {C.YELLOW}{i}.{C.RESET} {acc['address']}")
+        print(
+            f"\n  {C.DIM}Номер — выбор, n/p — страницы, "
+            f"начало адреса — поиск, Enter — отмена{C.RESET}"
+        )
+        choice = input(f"  Аккаунт: ").strip()
+        if not choice:
+            return None
+        if choice in ("n", "p"):
+            step = 1 if choice == "n" else -1
+            page = min(max(page + step, 0), pages - 1)
+            continue
+        if choice.isdigit():
+            page_no, pos = divmod(int(choice) - 1, size)
+            found = index.page(page_no) if 0 <= page_no < pages else []
+            if 0 <= pos < len(found):
+                return found[pos]
+            print_error("Неверный номер.")
+            continue
+
+        exact = index.get(choice)
+        if exact:
+            return exact
+        matches = index.prefix(choice)
+        if not matches:
+            print_warning("Ничего не найдено.")
+            continue
+        if len(matches) == 1:
+            return matches[0]
+        print(f"\n  {C.CYAN}Найдено (первые {len(matches)}):{C.RESET}")
+        for i, acc in enumerate(matches, 1):
+            print(f"    {C.YELLOW}{i}.{C.RESET} {acc['address']}")
+        try:
+            return matches[int(input(f"\n  Номер: ").strip()) - 1]
+        except (ValueError, IndexError):
+            print_error("Неверный выбор.")
+
+
 def action_list_accounts():
-    """Просмотр сохранённых аккаунтов."""
+    """Просмотр сохранённых аккаунтов (постранично)."""
     print()
     print(f"  {C.BOLD}📋 Сохранённые аккаунты{C.RESET}")
     print_separator()
 
-    accounts = load_accounts()
-    if not accounts:
+    index = get_index()
+    total = index.count()
+    if not total:
         print_warning("Нет сохранённых аккаунтов.")
         return
 
-    for i, acc in enumerate(accounts, 1):
-        created = acc.get("created_at", "N/A")
-        if created != "N/A":
-            try:
-                dt = datetime.fromisoformat(created)
-                created = dt.strftime("%d.%m.%Y %H:%M")
-            except ValueError:
-                pass
-
-        print(
-            f"    {C.YELLOW}{i:>3}.{C.RESET} "
-            f"{C.CYAN}{acc['address']:<35}{C.RESET} "
-            f"🔑 {C.DIM}{acc['password']}{C.RESET} "
-            f" | {C.DIM}{created}{C.RESET}"
-        )
+    size = ACCOUNTS_PAGE_SIZE
+    pages = (total + size - 1) // size
+    page = 0
+    while True:
+        for i, acc in enumerate(index.page(page), page * size + 1):
+            print(
+                f"    {C.YELLOW}{i:>3}.{C.RESET} "
+                f"{C.CYAN}{acc['address']:<35}{C.RESET} "
+                f"🔑 {C.DIM}{acc['password']}{C.RESET} "
+                f" | {C.DIM}{_format_created(acc)}{C.RESET}"
+            )
 
-    print()
-    print_separator()
-    print_info(f"Всего: {len(accounts)} аккаунт(ов)")
+        print()
+        print_separator()
+        print_info(f"Страница {page + 1}/{pages}. Всего: {total} аккаунт(ов)")
+        if pages == 1:
+            return
+        choice = input(f"  n/p — страницы, Enter — выход: ").strip().lower()
+        if choice == "n" and page < pages - 1:
+            page += 1
+        elif choice == "p" and page > 0:
+            page -= 1
+        elif not choice:
+            return
+        print()
 
 
 def action_check_inbox():
@@ -423,37 +4286,24 @@ def action_check_inbox():
     print(f"  {C.BOLD}📬 Проверка входящих{C.RESET}")
     print_separator()
 
-    accounts = load_accounts()
-    if not accounts:
+    if not get_index().count():
         print_warning("Нет сохранённых аккаунтов. Сначала создайте аккаунт.")
         return
 
-    # Выбор аккаунта
-    print(f"\n  {C.CYAN}Выберите аккаунт:{C.RESET}")
-    for i, acc in enumerate(accounts, 1):
-        print(f"    {C.YELLOW}{i}.{C.RESET} {acc['address']}")
-
-    try:
-        choice = int(input(f"\n  Номер аккаунта: ").strip()) - 1
-        account = accounts[choice]
-    except (ValueError, IndexError):
-        print_error("Неверный выбор.")
+    account = pick_account()
+    if not account:
         return
 
     print(f"\n  {C.DIM}Авторизация...{C.RESET}")
-    token = get_token(account["address"], account["password"])
+    token = get_cached_token(account)
     if not token:
         print_error("Не удалось авторизоваться.")
         return
 
-    print(f"  {C.DIM}Загрузка сообщений...{C.RESET}\n")
-    messages = get_messages(token)
-
-    if not messages:
-        print_warning("Входящих писем нет.")
-        return
-
-    print(f"  {C.GREEN}Найдено писем: {len(messages)}{C.RESET}\n")
+    print(f"  {C.DIM}Синхронизация сообщений...{C.RESET}\n")
+    mirror = get_mirror()
+    mirror.sync(account["address"], token)
+    messages = mirror.messages(account["address"])
 
     for i, msg in enumerate(messages, 1):
         seen_icon = "📭" if msg.get("seen") else "📩"
@@ -480,6 +4330,12 @@ def action_check_inbox():
             print(f"       {C.DIM}{intro[:80]}...{C.RESET}")
         print()
 
+    if not messages:
+        print_warning("Входящих писем нет.")
+        return
+
+    print(f"  {C.GREEN}Найдено писем: {len(messages)}{C.RESET}\n")
+
     # Чтение конкретного письма
     read_choice = input(
         f"  Введите номер письма для чтения (или Enter для выхода): "
@@ -487,8 +4343,9 @@ def action_check_inbox():
     if read_choice:
         try:
             msg_idx = int(read_choice) - 1
-            msg_id = messages[msg_idx]["id"]
-            detail = get_message_detail(token, msg_id)
+            detail = mirror.detail(
+                account["address"], token, messages[msg_idx]["id"]
+            )
             if detail:
                 print()
                 print_separator()
@@ -528,6 +4385,20 @@ def action_check_inbox():
                             f"({att.get('contentType', 'N/A')}, "
                             f"{att.get('size', 0)} байт)"
                         )
+                    download = input(f"\n  Скачать вложения? (y/n): ").strip().lower()
+                    if download == "y":
+                        store = AttachmentStore()
+                        try:
+                            results = download_message_attachments(
+                                account["address"], token, detail["id"], store
+                            )
+                        finally:
+                            store.close()
+                        for res in results:
+                            if res["status"] == "failed":
+                                print_error(f"{res.get('filename')}: {res['error']}")
+                            else:
+                                print_success(f"{res['filename']} → {res['path']}")
         except (ValueError, IndexError):
             print_error("Неверный номер.")
 
@@ -538,82 +4409,101 @@ def action_wait_for_mail():
     print(f"  {C.BOLD}⏳ Ожидание нового письма{C.RESET}")
     print_separator()
 
-    accounts = load_accounts()
-    if not accounts:
+    if not get_index().count():
         print_warning("Нет сохранённых аккаунтов.")
         return
 
-    print(f"\n  {C.CYAN}Выберите аккаунт:{C.RESET}")
-    for i, acc in enumerate(accounts, 1):
-        print(f"    {C.YELLOW}{i}.{C.RESET} {acc['address']}")
-
-    try:
-        choice = int(input(f"\n  Номер аккаунта: ").strip()) - 1
-        account = accounts[choice]
-    except (ValueError, IndexError):
-        print_error("Неверный выбор.")
+    account = pick_account()
+    if not account:
         return
 
-    token = get_token(account["address"], account["password"])
+    token = get_cached_token(account)
     if not token:
         print_error("Не удалось авторизоваться.")
         return
 
-    # Сохраняем текущее кол-во сообщений
-    initial_messages = get_messages(token)
-    initial_count = len(initial_messages)
+    mirror = get_mirror()
+    mirror.sync(account["address"], token)
+    seen_ids = mirror.known_ids(account["address"])
 
-    interval = 5  # секунд
     print(f"\n  {C.CYAN}📧 Ящик: {account['address']}{C.RESET}")
-    print(f"  {C.DIM}Текущих писем: {initial_count}{C.RESET}")
-    print(f"  {C.DIM}Проверка каждые {interval} сек. Нажмите Ctrl+C для отмены.{C.RESET}\n")
-
+    print(f"  {C.DIM}Текущих писем: {len(seen_ids)}{C.RESET}")
+    print(
+        f"  {C.DIM}Уведомления через Mercure (резерв — опрос каждые "
+        f"{POLL_INTERVAL} сек). Нажмите Ctrl+C для отмены.{C.RESET}\n"
+    )
+
+    def on_status(state):
+        label = "поток SSE подключён" if state == "stream" else "поток недоступен, опрос"
+        sys.stdout.write(f"\r  {C.DIM}Статус: {label}{C.RESET}          ")
+        sys.stdout.flush()
+
+    code_rules = compile_code_rules()
     try:
-        check_count = 0
-        while True:
-            time.sleep(interval)
-            check_count += 1
-            messages = get_messages(token)
-            current_count = len(messages)
-
-            sys.stdout.write(
-                f"\r  {C.DIM}Проверка #{check_count}... "
-                f"Писем: {current_count}{C.RESET}    "
+        for new_msg in watch_inbox(token, account["id"], seen_ids,
+                                   on_status=on_status):
+            mirror.add(account["address"], [new_msg])
+            print()
+            print(f"\n  {C.GREEN}{C.BOLD}🎉 Новое письмо!{C.RESET}")
+            print_separator()
+            from_info = new_msg.get("from", {})
+            print(
+                f"  {C.CYAN}От:{C.RESET} {from_info.get('address', 'N/A')}"
+            )
+            print(
+                f"  {C.CYAN}Тема:{C.RESET} {new_msg.get('subject', '(без темы)')}"
+            )
+            print(
+                f"  {C.CYAN}Превью:{C.RESET} {new_msg.get('intro', '')[:100]}"
             )
-            sys.stdout.flush()
+            found = extract_code(new_msg, code_rules, token, account["address"])
+            if found:
+                print(f"  {C.GREEN}{C.BOLD}🔑 Код:{C.RESET} {found['code']}")
+            print_separator()
+
+            # Прочитать подробности?
+            read = input(
+                f"\n  Прочитать полностью? (y/n): "
+            ).strip().lower()
+            if read == "y":
+                detail = mirror.detail(account["address"], token, new_msg["id"])
+                if detail:
+                    text = detail.get("text", "")
+                    if text:
+                        print(f"\n{text}\n")
 
-            if current_count > initial_count:
-                print()
-                new_msg = messages[0]  # Последнее письмо
-                print(f"\n  {C.GREEN}{C.BOLD}🎉 Новое письмо!{C.RESET}")
-                print_separator()
-                from_info = new_msg.get("from", {})
-                print(
-                    f"  {C.CYAN}От:{C.RESET} {from_info.get('address', 'N/A')}"
-                )
-                print(
-                    f"  {C.CYAN}Тема:{C.RESET} {new_msg.get('subject', '(без темы)')}"
-                )
-                print(
-                    f"  {C.CYAN}Превью:{C.RESET} {new_msg.get('intro', '')[:100]}"
-                )
-                print_separator()
+    except KeyboardInterrupt:
+        print(f"\n\n  {C.YELLOW}Ожидание остановлено.{C.RESET}")
 
-                # Прочитать подробности?
-                read = input(
-                    f"\n  Прочитать полностью? (y/n): "
-                ).strip().lower()
-                if read == "y":
-                    detail = get_message_detail(token, new_msg["id"])
-                    if detail:
-                        text = detail.get("text", "")
-                        if text:
-                            print(f"\n{text}\n")
 
-                initial_count = current_count
+def action_watch_all():
+    """Мониторинг всех сохранённых ящиков."""
+    print()
+    print(f"  {C.BOLD}👀 Мониторинг всех ящиков{C.RESET}")
+    print_separator()
 
+    accounts = load_accounts()
+    if not accounts:
+        print_warning("Нет сохранённых аккаунтов.")
+        return
+
+    print(
+        f"  {C.DIM}Ящиков: {len(accounts)}. Интервал опроса "
+        f"{WATCH_MIN_INTERVAL}–{WATCH_MAX_INTERVAL} сек в зависимости от "
+        f"активности. Нажмите Ctrl+C для отмены.{C.RESET}\n"
+    )
+
+    watcher = MultiInboxWatcher(accounts)
+    try:
+        for account, msg in watcher.watch():
+            from_info = msg.get("from", {})
+            print(
+                f"  {C.GREEN}📩 {account['address']}{C.RESET} "
+                f"{C.DIM}от {from_info.get('address', 'N/A')}:{C.RESET} "
+                f"{C.BOLD}{msg.get('subject', '(без темы)')[:60]}{C.RESET}"
+            )
     except KeyboardInterrupt:
-        print(f"\n\n  {C.YELLOW}Ожидание остановлено.{C.RESET}")
+        print(f"\n\n  {C.YELLOW}Мониторинг остановлен.{C.RESET}")
 
 
 def action_delete_account():
@@ -622,20 +4512,12 @@ def action_delete_account():
     print(f"  {C.BOLD}🗑️  Удаление аккаунта{C.RESET}")
     print_separator()
 
-    accounts = load_accounts()
-    if not accounts:
+    if not get_index().count():
         print_warning("Нет сохранённых аккаунтов.")
         return
 
-    print(f"\n  {C.CYAN}Выберите аккаунт для удаления:{C.RESET}")
-    for i, acc in enumerate(accounts, 1):
-        print(f"    {C.YELLOW}{i}.{C.RESET} {acc['address']}")
-
-    try:
-        choice = int(input(f"\n  Номер аккаунта: ").strip()) - 1
-        account = accounts[choice]
-    except (ValueError, IndexError):
-        print_error("Неверный выбор.")
+    account = pick_account("Выберите аккаунт для удаления")
+    if not account:
         return
 
     confirm = input(
@@ -646,10 +4528,9 @@ def action_delete_account():
         print_info("Отменено.")
         return
 
-    token = get_token(account["address"], account["password"])
+    token = get_cached_token(account)
     if token and delete_account(token, account["id"]):
-        accounts.pop(choice)
-        save_accounts(accounts)
+        remove_accounts([account["address"]])
         print_success(f"Аккаунт {account['address']} удалён!")
     else:
         print_error("Не удалось удалить аккаунт с сервера.")
@@ -657,42 +4538,172 @@ def action_delete_account():
             f"  Удалить из локального файла? (y/n): "
         ).strip().lower()
         if remove_local == "y":
-            accounts.pop(choice)
-            save_accounts(accounts)
+            remove_accounts([account["address"]])
             print_success("Удалено из локального хранилища.")
 
 
-def action_export_txt():
-    """Экспорт аккаунтов в текстовый файл."""
+def action_cleanup():
+    """Массовое удаление аккаунтов по возрасту и шаблону."""
     print()
-    print(f"  {C.BOLD}💾 Экспорт аккаунтов{C.RESET}")
+    print(f"  {C.BOLD}🧹 Массовое удаление аккаунтов{C.RESET}")
     print_separator()
 
     accounts = load_accounts()
     if not accounts:
-        print_warning("Нет аккаунтов для экспорта.")
+        print_warning("Нет сохранённых аккаунтов.")
+        return
+
+    age = input(f"\n  Старше чем (например 7d, 12h; Enter — любые): ").strip()
+    pattern = input(f"  Шаблон адреса (например test*@*; Enter — любые): ").strip()
+    try:
+        older_than = parse_duration(age) if age else None
+    except ValueError:
+        print_error("Неверный формат длительности.")
+        return
+
+    selected = select_accounts(accounts, older_than=older_than, pattern=pattern or None)
+    if not selected:
+        print_warning("Под условия не подходит ни один аккаунт.")
+        return
+
+    confirm = input(
+        f"\n  {C.RED}Удалить {len(selected)} аккаунт(ов)? (y/n): {C.RESET}"
+    ).strip().lower()
+    if confirm != "y":
+        print_info("Отменено.")
+        return
+
+    def on_result(account, deleted):
+        mark = f"{C.GREEN}✓{C.RESET}" if deleted else f"{C.RED}✗{C.RESET}"
+        print(f"    {mark} {account['address']}")
+
+    stats = cleanup_accounts(selected, on_result=on_result)
+    print()
+    print_separator()
+    print_success(f"Удалено {stats['deleted']} из {len(selected)}")
+    if stats["failed"]:
+        print_warning(f"Не удалось удалить с сервера: {stats['failed']} (остались в хранилище)")
+    print_info(f"Скорость: {stats['per_second']} акк/сек за {stats['elapsed']} сек")
+
+
+def action_sweep():
+    """Проверка всех аккаунтов и уборка мёртвых."""
+    print()
+    print(f"  {C.BOLD}🩺 Проверка аккаунтов{C.RESET}")
+    print_separator()
+
+    total = get_index().count()
+    if not total:
+        print_warning("Нет сохранённых аккаунтов.")
+        return
+
+    print(f"\n  {C.CYAN}Что делать с мёртвыми аккаунтами:{C.RESET}")
+    print(f"    {C.YELLOW}1.{C.RESET} Перенести в {QUARANTINE_FILE}")
+    print(f"    {C.YELLOW}2.{C.RESET} Удалить из хранилища")
+    prune = input(f"\n  Ваш выбор (1-2): ").strip() == "2"
+
+    print(f"\n  {C.DIM}Проверка {total} аккаунт(ов)...{C.RESET}\n")
+    marks = {
+        "ok": f"{C.GREEN}✓{C.RESET}",
+        "dead": f"{C.RED}✗{C.RESET}",
+        "error": f"{C.YELLOW}?{C.RESET}",
+    }
+
+    def on_result(account, health):
+        if health != "ok":
+            print(f"    {marks[health]} {account['address']}")
+
+    stats = sweep_accounts(iter_accounts(), prune=prune, on_result=on_result)
+    print()
+    print_separator()
+    print_success(f"Живых: {stats['ok']} из {stats['checked']}")
+    if stats["dead"]:
+        where = "удалены" if prune else f"перенесены в {QUARANTINE_FILE}"
+        print_warning(f"Мёртвых: {stats['dead']} ({where})")
+    if stats["error"]:
+        print_warning(f"Не удалось проверить: {stats['error']} (остались как есть)")
+    print_info(f"Скорость: {stats['per_second']} акк/сек за {stats['elapsed']} сек")
+
+
+def action_purge():
+    """Удаление писем из одного или всех ящиков по фильтрам."""
+    print()
+    print(f"  {C.BOLD}📭 Очистка ящиков{C.RESET}")
+    print_separator()
+
+    total = get_index().count()
+    if not total:
+        print_warning("Нет сохранённых аккаунтов.")
+        return
+
+    print(f"\n  {C.CYAN}Какие ящики очистить:{C.RESET}")
+    print(f"    {C.YELLOW}1.{C.RESET} Один ящик")
+    print(f"    {C.YELLOW}2.{C.RESET} Все ящики ({total})")
+    if input(f"\n  Ваш выбор (1-2): ").strip() == "2":
+        accounts = iter_accounts()
+    else:
+        account = pick_account()
+        if not account:
+            return
+        accounts = [account]
+
+    age = input(f"\n  Старше чем (например 7d, 12h; Enter — любые): ").strip()
+    sender = input(f"  Отправитель (например *@example.com; Enter — любой): ").strip()
+    subject = input(f"  Тема содержит (Enter — любая): ").strip()
+    try:
+        older_than = parse_duration(age) if age else None
+    except ValueError:
+        print_error("Неверный формат длительности.")
         return
 
-    filename = f"accounts_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    confirm = input(
+        f"\n  {C.RED}Удалить подходящие письма? (y/n): {C.RESET}"
+    ).strip().lower()
+    if confirm != "y":
+        print_info("Отменено.")
+        return
 
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("=" * 60 + "\n")
-        f.write("  Mail.tm — Экспорт аккаунтов\n")
-        f.write(f"  Дата: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
-        f.write("=" * 60 + "\n\n")
+    def on_result(address, message, deleted):
+        mark = f"{C.GREEN}✓{C.RESET}" if deleted else f"{C.RED}✗{C.RESET}"
+        print(f"    {mark} {address}: {message.get('subject') or '(без темы)'}")
 
-        for i, acc in enumerate(accounts, 1):
-            f.write(f"[{i}]\n")
-            f.write(f"  Email:    {acc['address']}\n")
-            f.write(f"  Password: {acc['password']}\n")
-            f.write(f"  ID:       {acc.get('id', 'N/A')}\n")
-            f.write(f"  Created:  {acc.get('created_at', 'N/A')}\n")
-            f.write("-" * 40 + "\n")
+    stats = purge_messages(accounts, older_than=older_than, sender=sender or None,
+                           subject=subject or None, on_result=on_result)
+    print()
+    print_separator()
+    print_success(
+        f"Удалено писем: {stats['deleted']} из {stats['matched']} "
+        f"в {stats['inboxes']} ящик(ах)"
+    )
+    if stats["failed"]:
+        print_warning(f"Не удалось удалить: {stats['failed']}")
+    if stats["unreachable"]:
+        print_warning(f"Ящиков без авторизации: {stats['unreachable']}")
+    print_info(f"Скорость: {stats['per_second']} писем/сек за {stats['elapsed']} сек")
 
-        f.write(f"\nВсего: {len(accounts)} аккаунт(ов)\n")
+
+def action_export_txt():
+    """Экспорт аккаунтов в файл (txt, csv или jsonl)."""
+    print()
+    print(f"  {C.BOLD}💾 Экспорт аккаунтов{C.RESET}")
+    print_separator()
+
+    print(f"\n  {C.CYAN}Формат:{C.RESET}")
+    print(f"    {C.YELLOW}1.{C.RESET} Текст (.txt)")
+    print(f"    {C.YELLOW}2.{C.RESET} CSV")
+    print(f"    {C.YELLOW}3.{C.RESET} JSON Lines")
+    fmt = {"2": "csv", "3": "jsonl"}.get(input(f"\n  Ваш выбор (1-3): ").strip(), "txt")
+
+    filename = f"accounts_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    count = export_accounts(filename, fmt)
+
+    if not count:
+        os.remove(filename)
+        print_warning("Нет аккаунтов для экспорта.")
+        return
 
     print_success(f"Экспортировано в {filename}")
-    print_info(f"Всего: {len(accounts)} аккаунт(ов)")
+    print_info(f"Всего: {count} аккаунт(ов)")
 
 
 def action_setup_env():
@@ -737,6 +4748,10 @@ def main_menu():
         print(f"    {C.YELLOW}6.{C.RESET} 🗑️  Удалить аккаунт")
         print(f"    {C.YELLOW}7.{C.RESET} 💾 Экспорт в .txt")
         print(f"    {C.YELLOW}8.{C.RESET} 🛠️  Настройка окружения (VPS)")
+        print(f"    {C.YELLOW}9.{C.RESET} 👀 Мониторинг всех ящиков")
+        print(f"   {C.YELLOW}10.{C.RESET} 🧹 Массовое удаление")
+        print(f"   {C.YELLOW}11.{C.RESET} 🩺 Проверка аккаунтов")
+        print(f"   {C.YELLOW}12.{C.RESET} 📭 Очистка ящиков")
         print(f"    {C.YELLOW}0.{C.RESET} 🚪 Выход")
         print()
 
@@ -758,6 +4773,14 @@ def main_menu():
             action_export_txt()
         elif choice == "8":
             action_setup_env()
+        elif choice == "9":
+            action_watch_all()
+        elif choice == "10":
+            action_cleanup()
+        elif choice == "11":
+            action_sweep()
+        elif choice == "12":
+            action_purge()
         elif choice == "0":
             print(f"\n  {C.CYAN}👋 До свидания!{C.RESET}\n")
             break
@@ -765,27 +4788,538 @@ def main_menu():
             print_error("Неверный выбор. Попробуйте снова.")
 
 
+# ─────────────────────────── Пакетный режим (CLI) ───────────────────────────
+#
+# Неинтерактивные подкоманды для скриптов: результат — JSON/JSONL в stdout,
+# сообщения — в stderr. Без баннера, очистки экрана и проверки соединения.
+
+def emit(obj):
+    """Вывод одной JSON-записи в stdout."""
+    sys.stdout.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+
+def cli_create(args):
+    if not args.domain and not get_domains():
+        print_error("Нет доступных доменов.")
+        return 1
+
+    created = 0
+    started = time.monotonic()
+    for address, account_data in create_accounts_bulk(args.count, args.domain,
+                                                      workers=args.workers,
+                                                      strategy=args.strategy):
+        if account_data:
+            created += 1
+            emit(account_data)
+        else:
+            emit({"address": address, "error": "create_failed"})
+    elapsed = time.monotonic() - started
+    if elapsed > 0:
+        print_info(f"Создано {created} из {args.count}: {created / elapsed:.1f} акк/сек")
+    return 0 if created == args.count else 1
+
+
+def cli_list(args):
+    index = get_index()
+    if args.prefix:
+        rows = index.prefix(args.prefix, limit=args.size or -1)
+    elif args.since or args.until:
+        rows = index.created_between(args.since, args.until, limit=args.size)
+    elif args.size:
+        rows = index.page(args.page, size=args.size)
+    else:
+        rows = iter_accounts()
+    for acc in rows:
+        emit(acc)
+    return 0
+
+
+def cli_inbox(args):
+    account = find_account(args.address)
+    if not account:
+        print_error(f"Аккаунт {args.address} не найден.")
+        return 1
+    token = get_cached_token(account)
+    if not token:
+        return 1
+    mirror = get_mirror()
+    mirror.sync(account["address"], token, full=True if args.full else None)
+    for msg in mirror.messages(account["address"]):
+        if args.body:
+            msg = mirror.detail(account["address"], token, msg["id"]) or msg
+        emit(msg)
+    return 0
+
+
+def cli_attachments(args):
+    if args.all:
+        accounts = iter_accounts()
+    else:
+        accounts = []
+        for address in args.addresses:
+            account = find_account(address)
+            if account:
+                accounts.append(account)
+            else:
+                print_error(f"Аккаунт {address} не найден.")
+        if not accounts:
+            return 1
+    store = AttachmentStore(args.dir)
+    counts = {}
+    try:
+        for res in download_attachments(iter_attachment_jobs(accounts), store, args.workers):
+            counts[res["status"]] = counts.get(res["status"], 0) + 1
+            emit(res)
+        stats = store.stats()
+    finally:
+        store.close()
+    print_info(
+        f"Скачано: {counts.get('downloaded', 0)}, "
+        f"дубликатов: {counts.get('deduplicated', 0)}, "
+        f"уже было: {counts.get('skipped', 0)}, ошибок: {counts.get('failed', 0)}. "
+        f"На диске {stats['objects']} объектов, {stats['stored_bytes']} байт "
+        f"из {stats['bytes']}."
+    )
+    return 1 if counts.get("failed") else 0
+
+
+def cli_wait(args):
+    import queue
+
+    account = find_account(args.address)
+    if not account:
+        print_error(f"Аккаунт {args.address} не найден.")
+        return 1
+    token = get_cached_token(account)
+    if not token:
+        return 1
+    mirror = get_mirror()
+    mirror.sync(account["address"], token, full=False)
+    seen_ids = mirror.known_ids(account["address"])
+
+    # watch_inbox блокируется на чтении потока — ждём его в фоне
+    events = queue.Queue()
+
+    def pump():
+        for msg in watch_inbox(token, account["id"], seen_ids):
+            events.put(msg)
+
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        msg = events.get(timeout=args.timeout)
+    except queue.Empty:
+        print_error("Время ожидания истекло.")
+        return 1
+    mirror.add(account["address"], [msg])
+    if args.body:
+        msg = mirror.detail(account["address"], token, msg["id"]) or msg
+    emit(msg)
+    return 0
+
+
+def cli_code(args):
+    since = None
+    if args.since:
+        try:
+            since = datetime.now(timezone.utc) - parse_duration(args.since)
+        except ValueError:
+            since = _parse_api_time(args.since)
+            if since is None:
+                print_error(f"Неверное значение --since: {args.since}")
+                return 2
+    try:
+        found = wait_for_code(args.address, args.pattern, args.timeout, since)
+    except KeyError:
+        print_error(f"Аккаунт {args.address} не найден.")
+        return 1
+    except re.error as e:
+        print_error(f"Неверное регулярное выражение: {e}")
+        return 2
+    if not found:
+        print_error("Время ожидания истекло.")
+        return 1
+    if args.raw:
+        sys.stdout.write(found["code"] + "\n")
+    else:
+        emit(found)
+    return 0
+
+
+def cli_pool(args):
+    if args.pool_command == "serve":
+        pool = InboxPool(size=args.size, domain=args.domain,
+                         lease_ttl=args.lease_ttl, workers=args.workers)
+        print_info(f"Подготовка пула на {args.size} ящиков...")
+        pool.start()
+        try:
+            serve_pool(pool, args.endpoint)
+        except OSError as e:
+            print_error(f"Не удалось открыть {args.endpoint}: {e}")
+            pool.stop()
+            return 1
+        print_success(f"Пул слушает {args.endpoint} (Ctrl+C — остановка)")
+        import signal
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            while not stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        print_info("Остановка пула: удаляем выданные ящики...")
+        pool.stop()
+        return 0
+
+    try:
+        if args.pool_command == "lease":
+            status, body = pool_request("POST", f"/lease?wait={args.wait}", args.endpoint,
+                                        timeout=args.wait + API_TIMEOUT)
+        elif args.pool_command == "release":
+            status, body = pool_request("POST", f"/release/{args.lease_id}", args.endpoint)
+        else:
+            status, body = pool_request("GET", "/status", args.endpoint)
+    except (OSError, ValueError) as e:
+        print_error(f"Демон пула недоступен ({args.endpoint}): {e}")
+        return 1
+    if status == 503:
+        print_error("В пуле нет готовых ящиков.")
+        return 1
+    if status == 404:
+        print_error("Аренда не найдена.")
+        return 1
+    if body is not None:
+        emit(body)
+    return 0
+
+
+def cli_delete(args):
+    index = get_index()
+    selected = []
+    for address in args.addresses:
+        account = index.get(address)
+        if account:
+            selected.append(account)
+        else:
+            emit({"address": address, "deleted": False, "error": "not_found"})
+    stats = cleanup_accounts(
+        selected, force=args.force,
+        on_result=lambda acc, ok: emit({"address": acc["address"], "deleted": ok}),
+    )
+    return 0 if stats["deleted"] == len(args.addresses) else 1
+
+
+def cli_cleanup(args):
+    try:
+        older_than = parse_duration(args.older_than) if args.older_than else None
+    except ValueError:
+        print_error(f"Неверное значение --older-than: {args.older_than}")
+        return 2
+    selected = select_accounts(load_accounts(), older_than=older_than,
+                               pattern=args.pattern)
+    if args.dry_run:
+        for acc in selected:
+            emit(acc)
+        return 0
+    stats = cleanup_accounts(
+        selected, workers=args.workers, force=args.force,
+        on_result=lambda acc, ok: emit({"address": acc["address"], "deleted": ok}),
+    )
+    print_info(
+        f"Удалено {stats['deleted']}, ошибок {stats['failed']}, "
+        f"{stats['per_second']} акк/сек"
+    )
+    return 0 if not stats["failed"] else 1
+
+
+def cli_sweep(args):
+    try:
+        older_than = parse_duration(args.older_than) if args.older_than else None
+    except ValueError:
+        print_error(f"Неверное значение --older-than: {args.older_than}")
+        return 2
+    try:
+        unverified_for = parse_duration(args.unverified_for) if args.unverified_for else None
+    except ValueError:
+        print_error(f"Неверное значение --unverified-for: {args.unverified_for}")
+        return 2
+    selected = filter_unverified(
+        filter_accounts(iter_accounts(), older_than=older_than, pattern=args.pattern),
+        verified_before=unverified_for,
+    )
+    stats = sweep_accounts(
+        selected, workers=args.workers, prune=args.prune, dry_run=args.dry_run,
+        on_result=lambda acc, health: emit({"address": acc["address"], "health": health}),
+    )
+    print_info(
+        f"Проверено {stats['checked']}: живых {stats['ok']}, мёртвых {stats['dead']}, "
+        f"ошибок {stats['error']}; {stats['per_second']} акк/сек"
+    )
+    return 0 if not stats["error"] else 1
+
+
+def cli_purge(args):
+    try:
+        older_than = parse_duration(args.older_than) if args.older_than else None
+    except ValueError:
+        print_error(f"Неверное значение --older-than: {args.older_than}")
+        return 2
+    if args.all:
+        accounts = iter_accounts()
+    else:
+        accounts = []
+        for address in args.addresses:
+            account = find_account(address)
+            if account:
+                accounts.append(account)
+            else:
+                print_error(f"Аккаунт {address} не найден.")
+        if not accounts:
+            return 1
+
+    def on_result(address, message, deleted):
+        record = {
+            "address": address,
+            "message_id": message["id"],
+            "from": (message.get("from") or {}).get("address"),
+            "subject": message.get("subject"),
+        }
+        if deleted is not None:
+            record["deleted"] = deleted
+        emit(record)
+
+    stats = purge_messages(accounts, older_than=older_than, sender=args.sender,
+                           subject=args.subject, workers=args.workers,
+                           dry_run=args.dry_run, on_result=on_result)
+    print_info(
+        f"Ящиков: {stats['inboxes']}, отобрано писем: {stats['matched']}, "
+        f"удалено: {stats['deleted']}, ошибок: {stats['failed']}; "
+        f"{stats['per_second']} писем/сек"
+    )
+    return 0 if not (stats["failed"] or stats["unreachable"]) else 1
+
+
+def cli_export(args):
+    try:
+        older_than = parse_duration(args.older_than) if args.older_than else None
+    except ValueError:
+        print_error(f"Неверное значение --older-than: {args.older_than}")
+        return 2
+    count = export_accounts(args.output, args.format, older_than=older_than,
+                            pattern=args.pattern, compress=args.gzip)
+    print_info(f"Экспортировано: {count} аккаунт(ов)")
+    return 0
+
+
+def cli_bench_credentials(args):
+    emit(bench_credentials(args.count))
+    return 0
+
+
+def run_cli(argv):
+    """Разбор аргументов и запуск подкоманды. Возвращает код выхода."""
+    import argparse
+
+    global UI_STREAM, client, domain_cache
+    UI_STREAM = sys.stderr
+    if not sys.stderr.isatty():
+        disable_colors()
+
+    parser = argparse.ArgumentParser(
+        prog="mail_generator.py",
+        description="Mail.tm Email Generator — пакетный режим (вывод в JSON/JSONL).",
+    )
+    parser.add_argument("--api-base", action="append", metavar="URL[=RATE]",
+                        help=f"адрес API (по умолчанию {API_BASE}); повторите, чтобы "
+                             "распределять нагрузку по нескольким API, RATE — "
+                             "лимит запросов в секунду для этого API")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="отдавать метрики Prometheus на 127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="записывать метрики Prometheus в файл "
+                             f"(каждые {METRICS_DUMP_INTERVAL} сек и при выходе)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("create", help="создать N аккаунтов")
+    p.add_argument("count", type=int)
+    p.add_argument("--domain", help="домен (по умолчанию — все активные по очереди)")
+    p.add_argument("--strategy", choices=("round-robin", "weighted"),
+                   default=DOMAIN_STRATEGY,
+                   help="распределение по доменам: по очереди или по лимитам API")
+    p.add_argument("--workers", type=int, default=BULK_WORKERS)
+    p.set_defaults(func=cli_create)
+
+    p = sub.add_parser("list", help="список сохранённых аккаунтов")
+    p.add_argument("--prefix", help="адреса, начинающиеся с префикса")
+    p.add_argument("--since", help="созданные не раньше (ISO-дата)")
+    p.add_argument("--until", help="созданные раньше (ISO-дата)")
+    p.add_argument("--page", type=int, default=0, help="номер страницы (с нуля)")
+    p.add_argument("--size", type=int, help="размер страницы")
+    p.set_defaults(func=cli_list)
+
+    p = sub.add_parser("inbox", help="письма ящика")
+    p.add_argument("address")
+    p.add_argument("--body", action="store_true", help="с полным содержимым")
+    p.add_argument("--full", action="store_true",
+                   help="сверить зеркало со всеми страницами ящика на сервере")
+    p.set_defaults(func=cli_inbox)
+
+    p = sub.add_parser("attachments", help="скачать вложения писем")
+    p.add_argument("addresses", nargs="*", metavar="address")
+    p.add_argument("--all", action="store_true", help="из всех сохранённых ящиков")
+    p.add_argument("--dir", default=ATTACHMENTS_DIR, help=f"каталог (по умолчанию {ATTACHMENTS_DIR})")
+    p.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    p.set_defaults(func=cli_attachments)
+
+    p = sub.add_parser("wait", help="дождаться нового письма")
+    p.add_argument("address")
+    p.add_argument("--timeout", type=float, default=300, help="секунд (по умолчанию 300)")
+    p.add_argument("--body", action="store_true", help="с полным содержимым")
+    p.set_defaults(func=cli_wait)
+
+    p = sub.add_parser("code", help="дождаться письма с кодом или ссылкой")
+    p.add_argument("address")
+    p.add_argument("--pattern", "-p", action="append",
+                   help="otp, otp:6, url, url:example.com, re:<regex> "
+                        "(можно несколько; по умолчанию otp)")
+    p.add_argument("--timeout", type=float, default=CODE_TIMEOUT,
+                   help=f"секунд (по умолчанию {CODE_TIMEOUT})")
+    p.add_argument("--since", help="учесть уже пришедшие письма: 5m, 1h или ISO-дата")
+    p.add_argument("--raw", action="store_true", help="вывести только код")
+    p.set_defaults(func=cli_code)
+
+    p = sub.add_parser("pool", help="пул готовых ящиков: serve, lease, release, status")
+    pool_sub = p.add_subparsers(dest="pool_command", required=True)
+    pp = pool_sub.add_parser("serve", help="запустить демон пула")
+    pp.add_argument("--size", type=int, default=POOL_SIZE, help="готовых ящиков")
+    pp.add_argument("--domain", help="домен (по умолчанию — первый активный)")
+    pp.add_argument("--lease-ttl", type=int, default=POOL_LEASE_TTL,
+                    help="секунд до принудительного возврата")
+    pp.add_argument("--workers", type=int, default=POOL_WORKERS)
+    pp = pool_sub.add_parser("lease", help="взять ящик из пула")
+    pp.add_argument("--wait", type=float, default=0, help="ждать свободный ящик, сек")
+    pp = pool_sub.add_parser("release", help="вернуть ящик (он будет удалён)")
+    pp.add_argument("lease_id")
+    pool_sub.add_parser("status", help="состояние пула")
+    for pp in pool_sub.choices.values():
+        pp.add_argument("--endpoint", default=POOL_ENDPOINT,
+                        help=f"host:port или unix:/путь (по умолчанию {POOL_ENDPOINT})")
+    p.set_defaults(func=cli_pool)
+
+    p = sub.add_parser("delete", help="удалить аккаунты")
+    p.add_argument("addresses", nargs="+")
+    p.add_argument("--force", action="store_true",
+                   help="удалить из хранилища, даже если сервер не подтвердил")
+    p.set_defaults(func=cli_delete)
+
+    p = sub.add_parser("cleanup", help="массово удалить аккаунты по возрасту/шаблону")
+    p.add_argument("--older-than", help="возраст: 90, 30m, 12h, 7d")
+    p.add_argument("--pattern", help="glob-шаблон адреса, например 'test*@*'")
+    p.add_argument("--all", action="store_true", help="удалить все аккаунты без фильтров")
+    p.add_argument("--workers", type=int, default=BULK_WORKERS)
+    p.add_argument("--force", action="store_true",
+                   help="удалить из хранилища, даже если сервер не подтвердил")
+    p.add_argument("--dry-run", action="store_true", help="только показать отобранные")
+    p.set_defaults(func=cli_cleanup)
+
+    p = sub.add_parser("purge", help="удалить письма из ящиков по фильтрам")
+    p.add_argument("addresses", nargs="*", metavar="address")
+    p.add_argument("--all", action="store_true", help="во всех сохранённых ящиках")
+    p.add_argument("--older-than", help="возраст письма: 90, 30m, 12h, 7d")
+    p.add_argument("--sender", help="glob-шаблон отправителя, например '*@example.com'")
+    p.add_argument("--subject", help="подстрока темы (без учёта регистра)")
+    p.add_argument("--workers", type=int, default=BULK_WORKERS)
+    p.add_argument("--dry-run", action="store_true", help="только показать отобранные")
+    p.set_defaults(func=cli_purge)
+
+    p = sub.add_parser("sweep", help="проверить аккаунты и убрать мёртвые")
+    p.add_argument("--older-than", help="только созданные раньше: 90, 30m, 12h, 7d")
+    p.add_argument("--pattern", help="glob-шаблон адреса")
+    p.add_argument("--unverified-for",
+                   help="только не проверенные успешно за этот срок, например 1d")
+    p.add_argument("--workers", type=int, default=BULK_WORKERS)
+    p.add_argument("--prune", action="store_true",
+                   help=f"удалять мёртвые без переноса в {QUARANTINE_FILE}")
+    p.add_argument("--dry-run", action="store_true",
+                   help="только проверить, хранилище не менять")
+    p.set_defaults(func=cli_sweep)
+
+    p = sub.add_parser("bench-credentials",
+                       help="сравнить пакетную и посимвольную генерацию данных")
+    p.add_argument("count", type=int, nargs="?", default=100000)
+    p.set_defaults(func=cli_bench_credentials)
+
+    p = sub.add_parser("export", help="выгрузить аккаунты (jsonl/csv/txt)")
+    p.add_argument("--format", choices=sorted(EXPORTERS), default="jsonl")
+    p.add_argument("--output", "-o", default="-", help="файл (по умолчанию stdout)")
+    p.add_argument("--gzip", action="store_true", help="сжать gzip")
+    p.add_argument("--older-than", help="возраст: 90, 30m, 12h, 7d")
+    p.add_argument("--pattern", help="glob-шаблон адреса")
+    p.set_defaults(func=cli_export)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "count", 1) < 1:
+        parser.error("count должен быть положительным")
+    if args.command in ("attachments", "purge") and not (args.all or args.addresses):
+        parser.error("укажите адреса или --all")
+    if args.command == "cleanup" and not (args.all or args.older_than or args.pattern):
+        parser.error("укажите --older-than, --pattern или --all")
+    if args.api_base and len(args.api_base) > 1:
+        client = ShardedClient.from_specs(args.api_base)
+    elif args.api_base:
+        url, _, rate = args.api_base[0].partition("=")
+        client = MailTmClient(url, rate_limit=float(rate) if rate else API_RATE_LIMIT)
+    if args.api_base:
+        domain_cache = DomainCache(api=" ".join(sorted(
+            spec.partition("=")[0].rstrip("/") for spec in args.api_base)))
+    if args.metrics_port is not None:
+        try:
+            serve_metrics(args.metrics_port)
+        except OSError as e:
+            print_error(f"Не удалось открыть порт метрик {args.metrics_port}: {e}")
+            return 1
+        print_info(f"Метрики: http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.metrics_file:
+        dump_metrics_periodically(args.metrics_file)
+    try:
+        code = args.func(args)
+        sys.stdout.flush()
+        return code
+    except KeyboardInterrupt:
+        return 130
+    except StoreError as e:
+        print_error(f"Хранилище повреждено: {e}")
+        return 1
+    except BrokenPipeError:
+        # Читатель закрыл канал (например, `| head`) — это не ошибка
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+
+
 # ─────────────────────────── Точка входа ───────────────────────────
 
-def main():
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        sys.exit(run_cli(argv))
+
     clear_screen()
     print_banner()
 
-    # Быстрый тест соединения
-    print(f"  {C.DIM}Проверка соединения с Mail.tm...{C.RESET}")
-    domains = get_available_domains()
-    if domains:
-        print_success(f"Подключено! Доступные домены: {', '.join(domains)}")
-    else:
-        print_error("Не удалось подключиться к Mail.tm API.")
-        print_info("Проверьте интернет-соединение и попробуйте позже.")
-        return
+    # Список доменов берётся из кэша; при необходимости обновляется в фоне,
+    # так что запуск не ждёт сети.
+    domain_cache.prefetch()
 
-    accounts = load_accounts()
-    if accounts:
-        print_info(f"Загружено {len(accounts)} сохранённых аккаунтов")
-
-    main_menu()
+    try:
+        total = get_index().count()
+        if total:
+            print_info(f"Загружено {total} сохранённых аккаунтов")
+
+        main_menu()
+    except StoreError as e:
+        print_error(f"Хранилище повреждено: {e}")
+        print_info("Исправьте или переместите файл и запустите скрипт снова.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+"""Общие фикстуры: изолированный рабочий каталог и локальная заглушка Mail.tm."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mail_generator as mg  # noqa: E402
+from fake_mailtm import FakeMailTm  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Отдельное хранилище аккаунтов во временном каталоге."""
+    store = mg.AccountStore(str(tmp_path / "accounts.json"),
+                            str(tmp_path / "accounts.jsonl"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Пустой рабочий каталог со своими хранилищем, индексом, зеркалом и кэшами."""
+    monkeypatch.chdir(tmp_path)
+    store = mg.AccountStore(mg.ACCOUNTS_FILE, mg.ACCOUNTS_JOURNAL)
+    monkeypatch.setattr(mg, "_store", store)
+    monkeypatch.setattr(mg, "_index", None)
+    monkeypatch.setattr(mg, "_mirror", None)
+    monkeypatch.setattr(mg, "token_cache", mg.TokenCache(persist=False))
+    monkeypatch.setattr(mg, "domain_cache", mg.DomainCache())
+    # run_cli() переключает вывод сообщений на текущий sys.stderr
+    monkeypatch.setattr(mg, "UI_STREAM", mg.UI_STREAM)
+    yield tmp_path
+    for resource in (mg._index, mg._mirror, store):
+        if resource is not None:
+            resource.close()
+
+
+@pytest.fixture
+def fake():
+    """Заглушка Mail.tm в фоновом потоке этого процесса."""
+    server = FakeMailTm(seed=1)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def api(fake, workdir, monkeypatch):
+    """Глобальный клиент модуля, направленный на заглушку.
+
+    Без rate limit и с почти нулевыми паузами между повторами.
+    """
+    http = mg.MailTmClient(fake.base_url, rate_limit=0)
+    monkeypatch.setattr(mg, "client", http)
+    monkeypatch.setattr(mg, "backoff_delay", lambda attempt, **kwargs: 0.001)
+    yield http
+    http.close()
@@ -0,0 +1,109 @@
+"""Асинхронный клиент против локальной заглушки Mail.tm."""
+
+import asyncio
+
+import pytest
+
+import mail_generator as mg
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_account_lifecycle(fake):
+    async def scenario():
+        async with mg.AsyncMailTmClient(fake.base_url, rate_limit=0) as api:
+            domains = await api.get_available_domains()
+            assert domains == fake.domains
+            address = f"async-user@{domains[0]}"
+            account = await api.create_account(address, "secret")
+            assert account["address"] == address
+            token = await api.get_token(address, "secret")
+            assert token
+
+            fake.deliver(address, subject="Код", text="Ваш код 123456")
+            messages = await api.get_messages(token)
+            assert [m["subject"] for m in messages] == ["Код"]
+            detail = await api.get_message_detail(token, messages[0]["id"])
+            assert "123456" in detail["text"]
+            assert await api.delete_message(token, messages[0]["id"])
+            assert await api.get_messages(token) == []
+            assert await api.delete_account(token, account["id"])
+            return api.pool_stats()
+
+    stats = run(scenario())
+    assert stats["requests"] == 8
+    # Все запросы идут по одному keep-alive соединению
+    assert stats["connections"] == 1
+
+
+def test_concurrent_requests_share_pool(fake):
+    async def scenario():
+        async with mg.AsyncMailTmClient(fake.base_url, max_concurrency=4,
+                                        pool_size=4, rate_limit=0) as api:
+            results = await asyncio.gather(*(api.get_available_domains() for _ in range(40)))
+            return results, api.pool_stats()
+
+    results, stats = run(scenario())
+    assert all(domains == fake.domains for domains in results)
+    assert stats["requests"] == 40
+    assert stats["connections"] <= 4
+
+
+def test_idempotent_request_retried_on_reused_connection(fake):
+    async def scenario():
+        async with mg.AsyncMailTmClient(fake.base_url, rate_limit=0) as api:
+            await api.request("GET", "/domains")
+            fake.drop_rate = 1.0
+            before = fake.requests
+            with pytest.raises(mg._ASYNC_NET_ERRORS):
+                await api.request("GET", "/domains")
+            return fake.requests - before
+
+    # Первая попытка на старом соединении и один повтор на новом
+    assert run(scenario()) == 2
+
+
+def test_post_not_retried_on_reused_connection(fake):
+    async def scenario():
+        async with mg.AsyncMailTmClient(fake.base_url, rate_limit=0) as api:
+            await api.request("GET", "/domains")
+            fake.drop_rate = 1.0
+            before = fake.requests
+            with pytest.raises(mg._ASYNC_NET_ERRORS):
+                await api.request("POST", "/accounts", json_body={
+                    "address": f"once@{fake.domains[0]}", "password": "secret",
+                })
+            return fake.requests - before
+
+    # Аккаунт создан сервером, ответ потерян — повтор дал бы 422
+    assert run(scenario()) == 1
+    assert len(fake._accounts) == 1
+
+
+def test_token_post_retried_on_reused_connection(fake):
+    async def scenario():
+        async with mg.AsyncMailTmClient(fake.base_url, rate_limit=0) as api:
+            address = f"token@{fake.domains[0]}"
+            assert await api.create_account(address, "secret")
+            fake.drop_rate = 1.0
+            before = fake.requests
+            # get_token ловит сетевые ошибки сам и возвращает None
+            assert await api.get_token(address, "secret") is None
+            return fake.requests - before
+
+    # POST /token идемпотентен: повтор на свежем соединении
+    assert run(scenario()) == 2
+
+
+def test_async_rate_limit(fake):
+    async def scenario():
+        async with mg.AsyncMailTmClient(fake.base_url, max_concurrency=8,
+                                        rate_limit=50) as api:
+            started = asyncio.get_running_loop().time()
+            await asyncio.gather(*(api.request("GET", "/domains") for _ in range(11)))
+            return asyncio.get_running_loop().time() - started
+
+    # Первый токен сразу, остальные 10 — по одному на 20 мс
+    assert run(scenario()) >= 0.19
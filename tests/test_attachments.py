@@ -0,0 +1,77 @@
+"""Загрузка вложений: дедупликация по содержимому, имена файлов и манифест."""
+
+import json
+import os
+
+import mail_generator as mg
+
+
+def make_account(fake, name):
+    address = f"{name}@{fake.domains[0]}"
+    data = mg.create_account(address, "secret")
+    account = {"id": data["id"], "address": address, "password": "secret"}
+    mg.add_account(account)
+    return account
+
+
+def run(capsys, *argv):
+    code = mg.run_cli(["attachments", "--dir", "files", *argv])
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return code, results
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_download_and_dedup(api, fake, capsys):
+    first = make_account(fake, "first")
+    second = make_account(fake, "second")
+    fake.deliver(first["address"], attachments=[("a.txt", b"same"), ("b.bin", b"other")])
+    fake.deliver(second["address"], attachments=[("copy.txt", b"same")])
+
+    code, results = run(capsys, "--all")
+    assert code == 0
+    assert sorted(r["status"] for r in results) == ["deduplicated", "downloaded", "downloaded"]
+    assert {read(r["path"]) for r in results} == {b"same", b"other"}
+    objects = [f for _, _, files in os.walk("files/objects") for f in files]
+    assert len(objects) == 2
+
+    # Повторный запуск ничего не скачивает
+    before = fake.requests
+    code, results = run(capsys, first["address"])
+    assert [r["status"] for r in results] == ["skipped", "skipped"]
+    assert fake.requests - before == 1         # только /messages
+
+
+def test_same_filename_different_content(api, fake, capsys):
+    account = make_account(fake, "reports")
+    fake.deliver(account["address"], attachments=[("report.pdf", b"AAAA"),
+                                                  ("report.pdf", b"BBBB")])
+    code, results = run(capsys, account["address"])
+    assert code == 0
+    paths = [r["path"] for r in results]
+    assert len(set(paths)) == 2
+    assert sorted(read(path) for path in paths) == [b"AAAA", b"BBBB"]
+    assert "report.pdf" in {os.path.basename(path) for path in paths}
+
+
+def test_link_reuses_same_content(workdir):
+    store = mg.AttachmentStore(str(workdir / "files"))
+    try:
+        digest, _, _ = store.write([b"data"])
+        path = store.link("a@x.test", "m1", "file.txt", digest)
+        assert store.link("a@x.test", "m1", "file.txt", digest) == path
+        other, _, _ = store.write([b"else"])
+        renamed = store.link("a@x.test", "m1", "file.txt", other)
+        assert os.path.basename(renamed) == f"file.{other[:12]}.txt"
+        assert read(path) == b"data" and read(renamed) == b"else"
+    finally:
+        store.close()
+
+
+def test_unknown_address(api, capsys):
+    code, results = run(capsys, "nobody@example.test")
+    assert code == 1
+    assert results == []
@@ -0,0 +1,87 @@
+"""Массовое удаление аккаунтов и команда cleanup."""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import mail_generator as mg
+
+
+def make_accounts(fake, names, age=timedelta(0)):
+    created_at = (datetime.now() - age).isoformat()
+    accounts = []
+    for name in names:
+        address = f"{name}@{fake.domains[0]}"
+        data = mg.create_account(address, "secret")
+        account = {"id": data["id"], "address": address, "password": "secret",
+                   "created_at": created_at}
+        mg.add_account(account)
+        accounts.append(account)
+    return accounts
+
+
+def stored():
+    return sorted(a["address"] for a in mg.load_accounts())
+
+
+def test_parse_duration():
+    assert mg.parse_duration("90") == timedelta(seconds=90)
+    assert mg.parse_duration("30m") == timedelta(minutes=30)
+    assert mg.parse_duration("12H") == timedelta(hours=12)
+    assert mg.parse_duration("7d") == timedelta(days=7)
+    with pytest.raises(ValueError):
+        mg.parse_duration("week")
+
+
+def test_cleanup_removes_from_server_and_store(api, fake):
+    accounts = make_accounts(fake, [f"bulk{n}" for n in range(12)])
+    results = []
+    stats = mg.cleanup_accounts(accounts, workers=4,
+                                on_result=lambda acc, ok: results.append(ok))
+    assert stats["deleted"] == 12 and stats["failed"] == 0
+    assert results == [True] * 12
+    assert fake._accounts == {}
+    assert stored() == []
+
+
+def test_failed_remote_delete_kept_unless_forced(api, fake):
+    accounts = make_accounts(fake, ["alive", "gone"])
+    fake.delete_account(accounts[1]["id"])      # токен для него не получить
+
+    stats = mg.cleanup_accounts(accounts, workers=2)
+    assert stats["failed_addresses"] == [accounts[1]["address"]]
+    assert stored() == [accounts[1]["address"]]
+
+    stats = mg.cleanup_accounts([accounts[1]], force=True)
+    assert stats["failed"] == 1
+    assert stored() == []
+
+
+def test_cli_requires_filter_or_all(api, fake):
+    make_accounts(fake, ["keep"])
+    with pytest.raises(SystemExit):
+        mg.run_cli(["cleanup"])
+    assert stored() == [f"keep@{fake.domains[0]}"]
+    assert len(fake._accounts) == 1
+
+
+def test_cli_filters_by_age_and_pattern(api, fake, capsys):
+    old = make_accounts(fake, ["test-old", "prod-old"], age=timedelta(days=10))
+    make_accounts(fake, ["test-new"])
+    assert mg.run_cli(["cleanup", "--older-than", "7d", "--pattern", "test-*"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines == [{"address": old[0]["address"], "deleted": True}]
+    assert stored() == sorted([f"prod-old@{fake.domains[0]}", f"test-new@{fake.domains[0]}"])
+
+
+def test_cli_all_dry_run(api, fake, capsys):
+    make_accounts(fake, ["a", "b"])
+    assert mg.run_cli(["cleanup", "--all", "--dry-run"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 2
+    assert len(stored()) == 2
+
+
+def test_cli_bad_duration(api, fake, capsys):
+    assert mg.run_cli(["cleanup", "--older-than", "week"]) == 2
+    assert "--older-than" in capsys.readouterr().err
@@ -0,0 +1,145 @@
+"""Извлечение кодов подтверждения и ожидание письма с кодом."""
+
+import json
+import threading
+import time
+
+import pytest
+
+import mail_generator as mg
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def code(text, *specs, subject=""):
+    found = mg.extract_code({"subject": subject, "intro": text}, mg.compile_code_rules(specs))
+    return found and found["code"]
+
+
+def make_account(fake, name="code"):
+    address = f"{name}@{fake.domains[0]}"
+    data = mg.create_account(address, "secret")
+    mg.add_account({"address": address, "password": "secret", "id": data["id"]})
+    return address
+
+
+# ── Правила ──
+
+def test_keyword_code_preferred():
+    assert code("Заказ 90817263 оформлен. Ваш код: 4821") == "4821"
+    assert code("Your verification code is 559012") == "559012"
+    assert code("", subject="PIN 7710") == "7710"
+
+
+def test_bare_number_not_date_time_or_amount():
+    assert code("Встреча 12.05.2026 в 10:30, сумма 1,500") is None
+    assert code("Подтвердите вход: 318274") == "318274"
+
+
+def test_otp_length():
+    assert code("code 1234, code 123456", "otp:6") == "123456"
+    assert code("code 1234", "otp:6") is None
+
+
+def test_url_rules():
+    text = "Откройте https://evil.test/x или https://auth.example.com/confirm?t=abc."
+    assert code(text, "url:example.com") == "https://auth.example.com/confirm?t=abc"
+    assert code(text, "url") == "https://evil.test/x"
+    assert code(text, "url:other.test") is None
+
+
+def test_regex_rules():
+    assert code("Ref: AB-1234", "re:([A-Z]{2}-\\d{4})") == "AB-1234"
+    assert code("Ref: AB-1234", "[A-Z]{2}-\\d+") == "AB-1234"
+    # Правила проверяются по порядку
+    assert code("Ref: AB-1234, код 5555", "re:AB-\\d+", "otp") == "AB-1234"
+
+
+def test_match_at_end_of_truncated_intro_needs_body():
+    rules = mg.compile_code_rules()
+    intro = "x" * (mg.CODE_INTRO_MAX - 8) + " код 4821"
+    message = {"subject": "", "intro": intro}
+    assert mg.extract_code(message, rules) is None
+    message["text"] = intro + "93"
+    assert mg.extract_code(message, rules, token="t") == {
+        "rule": "otp", "code": "482193", "source": "body",
+    }
+
+
+def test_body_loaded_only_when_needed(api, fake):
+    address = make_account(fake)
+    fake.deliver(address, subject="Вход", text="Здравствуйте!\n" + "." * 200 + "\nКод: 6677")
+    token = mg.get_token(address, "secret")
+    message = mg.get_messages_page(token)["hydra:member"][0]
+    rules = mg.compile_code_rules()
+    assert mg.extract_code(message, rules) is None
+    before = fake.requests
+    found = mg.extract_code(message, rules, token, address)
+    assert found == {"rule": "otp", "code": "6677", "source": "body"}
+    assert fake.requests - before == 1
+
+
+# ── Ожидание ──
+
+def test_wait_for_code_leaves_no_watcher(api, fake):
+    address = make_account(fake)
+    threads_before = threading.active_count()
+
+    def send():
+        assert wait_until(lambda: fake.subscriber_count() == 1)
+        fake.deliver(address, subject="Реклама", text="без кода")
+        fake.deliver(address, subject="Подтверждение", text="Ваш код: 482913")
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    result = mg.wait_for_code(address, timeout=5, mercure_url=fake.mercure_url)
+    sender.join(5)
+
+    assert result["code"] == "482913"
+    assert wait_until(lambda: fake.subscriber_count() == 0)
+    assert wait_until(lambda: threading.active_count() <= threads_before)
+    # В зеркале все письма, увиденные наблюдателем, а не только совпавшее
+    subjects = {m["subject"] for m in mg.get_mirror().messages(address)}
+    assert subjects == {"Реклама", "Подтверждение"}
+
+
+def test_wait_for_code_times_out(api, fake):
+    address = make_account(fake)
+    fake.deliver(address, subject="Старое", text="код 1111")
+    started = time.monotonic()
+    assert mg.wait_for_code(address, timeout=0.3, mercure_url=fake.mercure_url) is None
+    assert time.monotonic() - started < 2
+
+
+def test_cli_since_uses_existing_message(api, fake, capsys):
+    address = make_account(fake)
+    fake.deliver(address, subject="Код входа", text="код 90210")
+    assert mg.run_cli(["code", address, "--since", "5m", "--raw"]) == 0
+    assert capsys.readouterr().out == "90210\n"
+
+
+def test_cli_url_rule(api, fake, capsys):
+    address = make_account(fake)
+    fake.deliver(address, subject="Подтверждение", text="Ссылка: https://example.com/v?k=1")
+    assert mg.run_cli(["code", address, "--since", "5m", "-p", "url:example.com"]) == 0
+    found = json.loads(capsys.readouterr().out)
+    assert found["code"] == "https://example.com/v?k=1"
+    assert found["address"] == address
+
+
+@pytest.mark.parametrize("argv, expected", [
+    (["nobody@example.test"], 1),
+    (["{address}", "-p", "re:("], 2),
+    (["{address}", "--since", "вчера"], 2),
+])
+def test_cli_errors(api, fake, argv, expected):
+    address = make_account(fake)
+    argv = [arg.format(address=address) for arg in argv]
+    assert mg.run_cli(["code", *argv, "--timeout", "0.1"]) == expected
@@ -0,0 +1,135 @@
+"""Хранилище при нескольких писателях: потоки, процессы и обход без блокировки."""
+
+import os
+import subprocess
+import sys
+import threading
+
+import mail_generator as mg
+from test_journal import account, reopen
+
+
+def test_concurrent_appends_threads(store):
+    threads, per_thread = 8, 200
+
+    def worker(t):
+        for n in range(per_thread):
+            store.add(account(t * per_thread + n))
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    addresses = [a["address"] for a in store.load()]
+    assert len(addresses) == threads * per_thread
+    assert set(addresses) == {account(n)["address"] for n in range(threads * per_thread)}
+
+
+def test_concurrent_appends_processes(store):
+    processes, per_process = 4, 200
+    script = (
+        "import sys, mail_generator as mg\n"
+        "store = mg.AccountStore(sys.argv[1], sys.argv[2], compact_bytes=16 << 10)\n"
+        "base = int(sys.argv[3])\n"
+        "for n in range(base, base + int(sys.argv[4])):\n"
+        "    store.add({'address': f'user{n}@example.test', 'id': str(n)})\n"
+        "store.close()\n"
+    )
+    root = os.path.dirname(os.path.abspath(mg.__file__))
+    children = [
+        subprocess.Popen(
+            [sys.executable, "-c", script, store.snapshot_path, store.journal_path,
+             str(p * per_process), str(per_process)],
+            cwd=root,
+        )
+        for p in range(processes)
+    ]
+    for child in children:
+        assert child.wait(timeout=60) == 0
+
+    ids = [a["id"] for a in store.load()]
+    assert len(ids) == processes * per_process
+    assert set(ids) == {str(n) for n in range(processes * per_process)}
+
+
+def test_compaction_with_concurrent_appends(store):
+    store.compact_bytes = 0
+    errors = []
+
+    def writer(t):
+        try:
+            for n in range(100):
+                store.add(account(t * 100 + n))
+        except Exception as e:
+            errors.append(e)
+
+    pool = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    assert not errors
+    assert sorted(a["id"] for a in store.load()) == sorted(account(n)["id"] for n in range(400))
+
+
+def test_iter_does_not_hold_lock(store):
+    for n in range(5):
+        store.add(account(n))
+    other = reopen(store)
+    accounts = store.iter()
+    first = next(accounts)
+
+    # Пока обход не завершён, другой экземпляр должен получить
+    # эксклюзивную блокировку файла
+    done = threading.Event()
+    thread = threading.Thread(
+        target=lambda: (other.update(lambda accs: accs + [account(99)]), done.set()),
+        daemon=True,
+    )
+    thread.start()
+    try:
+        assert done.wait(5), "update() ждёт блокировку, удерживаемую iter()"
+    finally:
+        assert [first] + list(accounts) == [account(n) for n in range(5)]
+        thread.join(5)
+        other.close()
+    assert store.load()[-1] == account(99)
+
+
+def test_index_remove_keeps_concurrent_append(workdir):
+    for n in range(5):
+        mg.add_account(account(n))
+    index = mg.get_index()
+    assert index.get(account(2)["address"]) == account(2)
+
+    # Запись другого процесса, ещё не попавшая в индекс
+    other = mg.AccountStore(mg.ACCOUNTS_FILE, mg.ACCOUNTS_JOURNAL)
+    other.add(account(7))
+    other.close()
+
+    mg.remove_accounts([account(2)["address"]])
+    addresses = [a["address"] for a in mg.load_accounts()]
+    assert account(2)["address"] not in addresses
+    assert account(7)["address"] in addresses
+    assert mg.find_account(account(2)["address"]) is None
+    assert mg.find_account(account(7)["address"]) == account(7)
+
+
+def test_iter_sees_state_at_call_time(store):
+    store.save([account(n) for n in range(50)])
+    for n in range(50, 60):
+        store.add(account(n))
+    accounts = store.iter()
+    head = [next(accounts) for _ in range(5)]
+
+    # Другой процесс переписывает снимок и сворачивает журнал посреди обхода
+    other = reopen(store, compact_bytes=0)
+    other.update(lambda accs: accs[::2])
+    other.add(account(99))
+    other.close()
+
+    assert head + list(accounts) == [account(n) for n in range(60)]
+    assert len(store.load()) == 31
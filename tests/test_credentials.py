@@ -0,0 +1,79 @@
+"""Пакетная генерация учётных данных и фильтр Блума по выданным адресам."""
+
+import threading
+from collections import Counter
+
+import mail_generator as mg
+
+
+def test_usernames_use_alphabet_evenly():
+    names = mg.generate_usernames(5000, length=8)
+    assert len(names) == 5000
+    assert all(len(name) == 8 for name in names)
+    counts = Counter("".join(names))
+    assert set(counts) == set(mg.USERNAME_CHARS)
+    # 40000 символов: каждый встречается около 40000 / len(алфавита) раз
+    expected = 40000 / len(mg.USERNAME_CHARS)
+    assert all(0.8 * expected < n < 1.2 * expected for n in counts.values())
+
+
+def test_passwords_have_every_class():
+    passwords = mg.generate_passwords(2000, length=12)
+    assert len(passwords) == 2000
+    for password in passwords:
+        assert len(password) == 12
+        assert set(password) <= set(mg.PASSWORD_CHARS)
+        assert all(set(password) & cls for cls in mg._PASSWORD_CLASSES)
+
+
+def test_bloom_false_positive_rate():
+    bloom = mg.BloomFilter(10000, error_rate=0.01)
+    for n in range(10000):
+        bloom.add(f"member{n}")
+    assert all(f"member{n}" in bloom for n in range(10000))
+    false_hits = sum(f"other{n}" in bloom for n in range(20000))
+    assert false_hits / 20000 < 0.02
+
+
+def test_bloom_does_not_saturate():
+    bloom = mg.BloomFilter(1024, error_rate=0.01)
+    for n in range(50000):
+        bloom.add(f"member{n}")
+    assert len(bloom._slices) > 1
+    assert all(f"member{n}" in bloom for n in range(0, 50000, 7))
+    false_hits = sum(f"other{n}" in bloom for n in range(20000))
+    assert false_hits / 20000 < 0.02
+
+
+def test_generator_skips_known_and_issued(monkeypatch):
+    names = iter([["dup", "known", "fresh"], ["other", "dup", "dup"]])
+    monkeypatch.setattr(mg, "generate_usernames", lambda count: next(names))
+    monkeypatch.setattr(mg, "generate_passwords", lambda count: ["pw"] * count)
+    generator = mg.CredentialGenerator(batch_size=3, known_addresses=["known@d.test"])
+    issued = [generator.next("d.test")[0] for _ in range(3)]
+    # Пакет разбирается с конца
+    assert issued == ["fresh@d.test", "dup@d.test", "other@d.test"]
+    assert generator.skipped == 3
+
+
+def test_generator_reads_store(workdir, monkeypatch):
+    mg.add_account({"address": "taken@d.test", "password": "pw", "id": "1"})
+    monkeypatch.setattr(mg, "generate_usernames", lambda count: ["free", "taken"])
+    generator = mg.CredentialGenerator(batch_size=2)
+    assert generator.next("d.test")[0] == "free@d.test"
+    assert generator.skipped == 1
+
+
+def test_generator_unique_across_threads():
+    generator = mg.CredentialGenerator(batch_size=256, known_addresses=[], expected=8000)
+    issued = []
+
+    def worker():
+        issued.extend(generator.next("d.test")[0] for _ in range(2000))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(issued) == len(set(issued)) == 8000
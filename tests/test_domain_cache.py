@@ -0,0 +1,62 @@
+"""Кэш списка доменов: TTL, stale-while-revalidate и файл на диске."""
+
+import time
+
+import mail_generator as mg
+
+
+def cache(workdir, fake, ttl=3600):
+    return mg.DomainCache(path=str(workdir / "domains.json"), ttl=ttl, api=fake.base_url)
+
+
+def test_miss_then_hit(api, fake, workdir):
+    domains = cache(workdir, fake)
+    assert domains.get() == fake.domains
+    assert fake.requests == 1
+    assert domains.get() == fake.domains
+    assert fake.requests == 1
+
+
+def test_stale_list_served_while_refreshing(api, fake, workdir):
+    domains = cache(workdir, fake, ttl=0.05)
+    assert domains.get() == fake.domains
+    fake.domains = ["fresh.test"]
+    time.sleep(0.06)
+
+    # Устаревший список отдаётся сразу, обновление идёт в фоне
+    assert domains.get() != ["fresh.test"]
+    domains._refreshing.join(5)
+    assert domains.get() == ["fresh.test"]
+
+
+def test_list_survives_restart(api, fake, workdir):
+    cache(workdir, fake).get()
+    before = fake.requests
+    restored = cache(workdir, fake)
+    assert restored.is_fresh()
+    assert restored.get() == fake.domains
+    assert fake.requests == before
+
+
+def test_file_of_other_api_ignored(api, fake, workdir):
+    cache(workdir, fake).get()
+    other = mg.DomainCache(path=str(workdir / "domains.json"), api="http://other.test")
+    assert not other.is_fresh()
+
+
+def test_failed_refresh_keeps_list(api, fake, workdir):
+    domains = cache(workdir, fake, ttl=0)
+    assert domains.get() == fake.domains
+    fake.error_rate = 1.0
+    assert domains.refresh() == fake.domains
+
+
+def test_prefetch_does_not_block(api, fake, workdir):
+    fake.latency = 0.3
+    domains = cache(workdir, fake)
+    started = time.monotonic()
+    domains.prefetch()
+    assert time.monotonic() - started < 0.1
+    domains._refreshing.join(5)
+    assert domains.is_fresh()
+    assert domains.get() == fake.domains
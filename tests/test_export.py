@@ -0,0 +1,99 @@
+"""Потоковый экспорт аккаунтов и чтение снимков старого формата."""
+
+import csv
+import gzip
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+import mail_generator as mg
+from test_journal import account
+
+
+def stored_account(n, age=timedelta(0)):
+    acc = account(n)
+    acc["created_at"] = (datetime.now() - age).isoformat()
+    return acc
+
+
+@pytest.mark.parametrize("content", [
+    "[]",
+    "[]\n",
+    json.dumps([account(1), account(2)]),
+    json.dumps([account(1), account(2)], indent=2),
+])
+def test_legacy_snapshot(store, content):
+    with open(store.snapshot_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    expected = json.loads(content)
+    assert store.load() == expected
+    store.add(account(3))
+    assert store.load() == expected + [account(3)]
+
+
+def test_corrupt_snapshot_raises(store):
+    with open(store.snapshot_path, "w", encoding="utf-8") as f:
+        f.write('[\n{"address": "broken"\n')
+    with pytest.raises(mg.StoreError):
+        store.load()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_jsonl(workdir, compress):
+    accounts = [stored_account(n) for n in range(5)]
+    mg.save_accounts(accounts[:3])
+    for acc in accounts[3:]:
+        mg.add_account(acc)
+    path = workdir / "out.jsonl"
+    assert mg.export_accounts(str(path), "jsonl", compress=compress) == 5
+    opener = gzip.open if compress else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == accounts
+
+
+def test_csv_and_txt(workdir):
+    accounts = [stored_account(n) for n in range(3)]
+    mg.save_accounts(accounts)
+    assert mg.export_accounts(str(workdir / "out.csv"), "csv") == 3
+    with open(workdir / "out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [{field: acc[field] for field in mg.EXPORT_FIELDS} for acc in accounts]
+
+    assert mg.export_accounts(str(workdir / "out.txt"), "txt") == 3
+    text = (workdir / "out.txt").read_text(encoding="utf-8")
+    assert all(acc["address"] in text for acc in accounts)
+    assert "Всего: 3 аккаунт(ов)" in text
+
+
+def test_filters(workdir):
+    old = [stored_account(n, age=timedelta(days=10)) for n in range(3)]
+    mg.save_accounts(old + [stored_account(n) for n in range(3, 6)])
+    path = str(workdir / "out.jsonl")
+    assert mg.export_accounts(path, "jsonl", older_than=timedelta(days=7),
+                              pattern="user[12]@*") == 2
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == old[1:]
+
+
+def test_memory_does_not_grow_with_store(workdir):
+    mg.save_accounts([stored_account(n) for n in range(20000)])
+    for n in range(20000, 20500):
+        mg.add_account(stored_account(n))
+    path = str(workdir / "out.csv")
+
+    tracemalloc.start()
+    try:
+        count = mg.export_accounts(path, "csv")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 20500
+    # Сами записи занимают ~10 МБ; в памяти — буфер записи и одна запись
+    assert peak < mg.EXPORT_BUFFER_SIZE + (1 << 20)
+
+
+def test_cli_bad_duration(workdir, capsys):
+    assert mg.run_cli(["export", "--older-than", "week", "-o", "out.jsonl"]) == 2
+    assert "--older-than" in capsys.readouterr().err
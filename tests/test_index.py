@@ -0,0 +1,86 @@
+"""SQLite-индекс хранилища: поиск, префиксы, диапазоны дат и страницы."""
+
+import sqlite3
+
+import mail_generator as mg
+from test_journal import account
+
+
+def fill(count):
+    accounts = [account(n) for n in range(count)]
+    mg.save_accounts(accounts[:count // 2])
+    for acc in accounts[count // 2:]:
+        mg.add_account(acc)
+    return sorted(accounts, key=lambda a: (a["created_at"], a["address"]))
+
+
+def test_lookup_and_prefix(workdir):
+    fill(30)
+    index = mg.get_index()
+    assert index.count() == 30
+    assert index.get("user7@example.test") == account(7)
+    assert index.get_by_id(account(21)["id"]) == account(21)
+    assert index.get("nobody@example.test") is None
+    assert [a["address"] for a in index.prefix("user2")] == [
+        *(f"user{n}@example.test" for n in range(20, 30)), "user2@example.test"
+    ]
+
+
+def test_created_between(workdir):
+    fill(30)
+    rows = mg.get_index().created_between("2026-01-01T00:00:10", "2026-01-01T00:00:13")
+    assert [a["address"] for a in rows] == [f"user{n}@example.test" for n in (10, 11, 12)]
+
+
+def test_pages_in_creation_order(workdir):
+    expected = fill(95)
+    index = mg.get_index()
+    pages = [index.page(n, size=20) for n in range(5)]
+    assert [len(p) for p in pages] == [20, 20, 20, 20, 15]
+    assert [a for p in pages for a in p] == expected
+    assert index.page(5, size=20) == []
+    # Назад и вразнобой — те же страницы
+    assert index.page(2, size=20) == pages[2]
+    other = mg.AccountIndex(mg._store)
+    try:
+        assert other.page(3, size=20) == pages[3]
+    finally:
+        other.close()
+
+
+def test_pages_follow_new_accounts(workdir):
+    fill(10)
+    index = mg.get_index()
+    assert len(index.page(0, size=6)) == 6
+    assert len(index.page(1, size=6)) == 4
+    extra = dict(account(99), created_at=account(0)["created_at"])
+    mg.add_account(extra)
+    index = mg.get_index()
+    assert index.page(0, size=6)[1] == extra
+    assert len(index.page(1, size=6)) == 5
+
+
+def test_page_query_uses_index(workdir):
+    fill(10)
+    index = mg.get_index()
+    plan = " ".join(row[-1] for row in index._db.execute(
+        "EXPLAIN QUERY PLAN SELECT data FROM accounts "
+        "WHERE (created_at, address) > (?, ?) ORDER BY created_at, address LIMIT 5",
+        ("", ""),
+    ))
+    assert "accounts_by_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_old_schema_rebuilt(workdir):
+    fill(5)
+    mg.get_index().close()
+    mg._index = None
+    db = sqlite3.connect(mg.ACCOUNTS_INDEX_FILE)
+    db.execute("DROP INDEX accounts_by_created")
+    db.execute("CREATE INDEX accounts_by_date ON accounts (created_at)")
+    db.execute("UPDATE accounts SET created_at = NULL")
+    db.commit()
+    db.close()
+    index = mg.get_index()
+    assert len(index.page(0, size=3) + index.page(1, size=3)) == 5
@@ -0,0 +1,58 @@
+"""Постраничный ленивый обход писем."""
+
+import itertools
+import time
+
+import pytest
+
+import mail_generator as mg
+
+
+@pytest.fixture
+def inbox(api, fake):
+    address = f"paged@{fake.domains[0]}"
+    mg.create_account(address, "secret")
+    for n in range(70):
+        fake.deliver(address, subject=f"Письмо {n}", text=f"Тело {n}")
+    return mg.get_token(address, "secret")
+
+
+def test_all_pages_newest_first(inbox, fake):
+    before = fake.requests
+    subjects = [m["subject"] for m in mg.iter_messages(inbox)]
+    assert subjects == [f"Письмо {n}" for n in reversed(range(70))]
+    assert fake.requests - before == 3     # 30 + 30 + 10
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_pages_fetched_on_demand(inbox, fake, prefetch):
+    before = fake.requests
+    first = list(itertools.islice(mg.iter_messages(inbox, prefetch=prefetch), 5))
+    assert [m["subject"] for m in first] == [f"Письмо {n}" for n in range(69, 64, -1)]
+    # Без prefetch — одна страница, с prefetch — ещё одна в фоне
+    expected = 2 if prefetch else 1
+    deadline = time.monotonic() + 2
+    while fake.requests - before < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert fake.requests - before == expected
+
+
+def test_prefetch_yields_same_messages(inbox):
+    plain = [m["id"] for m in mg.iter_messages(inbox)]
+    assert [m["id"] for m in mg.iter_messages(inbox, prefetch=True)] == plain
+
+
+def test_detail_loaded_once(inbox, fake):
+    message = next(mg.iter_messages(inbox))
+    before = fake.requests
+    assert message.detail()["text"] == "Тело 69"
+    assert message.detail()["text"] == "Тело 69"
+    assert fake.requests - before == 1
+
+
+def test_empty_inbox(api, fake):
+    address = f"empty@{fake.domains[0]}"
+    mg.create_account(address, "secret")
+    token = mg.get_token(address, "secret")
+    assert list(mg.iter_messages(token)) == []
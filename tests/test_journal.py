@@ -0,0 +1,82 @@
+"""Хранилище аккаунтов: снимок + журнал, конкурентная запись и свёртка."""
+
+import json
+import os
+
+import mail_generator as mg
+
+
+def account(n):
+    return {
+        "address": f"user{n}@example.test",
+        "password": f"pw{n}",
+        "id": f"{n:024x}",
+        "created_at": f"2026-01-01T00:00:{n % 60:02d}+00:00",
+    }
+
+
+def reopen(store, **kwargs):
+    return mg.AccountStore(store.snapshot_path, store.journal_path, **kwargs)
+
+
+def test_round_trip(store):
+    accounts = [account(n) for n in range(50)]
+    for acc in accounts[:30]:
+        store.add(acc)
+    assert store.load() == accounts[:30]
+
+    store.save(accounts[:10])
+    for acc in accounts[10:]:
+        store.add(acc)
+    assert store.load() == accounts
+    assert list(store.iter()) == accounts
+
+    other = reopen(store)
+    try:
+        assert other.load() == accounts
+    finally:
+        other.close()
+
+
+def test_update_keeps_order_and_clears_journal(store):
+    for n in range(10):
+        store.add(account(n))
+    result = store.update(lambda accounts: [a for a in accounts if a["id"] != account(3)["id"]])
+    assert [a["address"] for a in result] == [account(n)["address"] for n in range(10) if n != 3]
+    assert store.load() == result
+    with open(store.journal_path, "rb") as f:
+        assert f.read() == b""
+
+
+def test_torn_journal_line_is_skipped(store):
+    for n in range(3):
+        store.add(account(n))
+    store.close()
+    # Аварийное завершение посреди записи строки
+    with open(store.journal_path, "ab") as f:
+        f.write(json.dumps(account(3)).encode()[:20])
+    assert reopen(store).load() == [account(n) for n in range(3)]
+
+
+def test_add_does_not_rewrite_snapshot(store):
+    store.save([account(n) for n in range(10)])
+    stat = os.stat(store.snapshot_path)
+    for n in range(10, 20):
+        store.add(account(n))
+    after = os.stat(store.snapshot_path)
+    assert (after.st_ino, after.st_size, after.st_mtime_ns) == \
+        (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    assert store.load() == [account(n) for n in range(20)]
+
+
+def test_compaction_moves_journal_into_snapshot(store):
+    store.compact_bytes = 2048
+    accounts = [account(n) for n in range(100)]
+    for acc in accounts:
+        store.add(acc)
+
+    with open(store.journal_path, "rb") as f:
+        assert len(f.read()) < store.compact_bytes
+    snapshot = reopen(store)._read_snapshot()
+    assert snapshot and snapshot == accounts[:len(snapshot)]
+    assert store.load() == accounts
@@ -0,0 +1,59 @@
+"""Метрики в памяти и их вывод в формате Prometheus."""
+
+import socket
+
+import requests
+
+import mail_generator as mg
+
+
+def test_counters_and_histograms_rendered():
+    metrics = mg.Metrics(buckets=(0.1, 1))
+    metrics.declare("jobs_total", "counter", "Задачи")
+    metrics.declare("job_seconds", "histogram", "Длительность")
+    metrics.inc("jobs_total", kind="a")
+    metrics.inc("jobs_total", 2, kind="a")
+    metrics.observe("job_seconds", 0.05)
+    metrics.observe("job_seconds", 0.5)
+    lines = metrics.render().splitlines()
+    assert "# TYPE jobs_total counter" in lines
+    assert 'jobs_total{kind="a"} 3' in lines
+    assert 'job_seconds_bucket{le="0.1"} 1' in lines
+    assert 'job_seconds_bucket{le="1"} 2' in lines
+    assert 'job_seconds_bucket{le="+Inf"} 2' in lines
+    assert "job_seconds_count 2" in lines
+
+
+def test_mixed_label_types_render():
+    metrics = mg.Metrics()
+    metrics.inc("requests_total", endpoint="GET /x", status="error")
+    metrics.inc("requests_total", endpoint="GET /x", status=200)
+    metrics.inc("requests_total", endpoint="GET /x", status="200")
+    lines = metrics.render().splitlines()
+    assert 'requests_total{endpoint="GET /x",status="200"} 2' in lines
+    assert 'requests_total{endpoint="GET /x",status="error"} 1' in lines
+    assert metrics.value("requests_total", endpoint="GET /x", status=200) == 2
+
+
+def test_metrics_endpoint_after_network_error_and_success(api, fake):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    refused = mg.MailTmClient(f"http://127.0.0.1:{port}", rate_limit=0, retries=1)
+    try:
+        refused.get("/domains")
+    except requests.ConnectionError:
+        pass
+    finally:
+        refused.close()
+    assert api.get("/domains").status_code == 200
+
+    server = mg.serve_metrics(0)
+    try:
+        resp = requests.get(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert resp.status_code == 200
+    assert 'mailtm_requests_total{endpoint="GET /domains",status="error"}' in resp.text
+    assert 'mailtm_requests_total{endpoint="GET /domains",status="200"}' in resp.text
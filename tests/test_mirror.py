@@ -0,0 +1,97 @@
+"""Локальное зеркало писем: инкрементальная и полная синхронизация."""
+
+import pytest
+
+import mail_generator as mg
+
+
+@pytest.fixture
+def inbox(api, fake):
+    address = f"mirrored@{fake.domains[0]}"
+    mg.create_account(address, "secret")
+    return address, mg.get_token(address, "secret")
+
+
+def subjects(mirror, address):
+    return [m["subject"] for m in mirror.messages(address)]
+
+
+def test_incremental_sync_reads_until_known(inbox, fake, workdir):
+    address, token = inbox
+    mirror = mg.MessageMirror(str(workdir / "mirror.db"))
+    fake.deliver(address, subject="Первое")
+    assert [m["subject"] for m in mirror.sync(address, token)] == ["Первое"]
+
+    fake.deliver(address, subject="Второе")
+    fake.deliver(address, subject="Третье")
+    before = fake.requests
+    new = mirror.sync(address, token, full=False)
+    assert [m["subject"] for m in new] == ["Второе", "Третье"]
+    assert fake.requests - before == 1
+    assert subjects(mirror, address) == ["Третье", "Второе", "Первое"]
+    mirror.close()
+
+
+def test_full_sync_drops_deleted_messages(inbox, fake, workdir):
+    address, token = inbox
+    mirror = mg.MessageMirror(str(workdir / "mirror.db"))
+    for subject in ("Оставить", "Удалить"):
+        fake.deliver(address, subject=subject)
+    mirror.sync(address, token)
+    gone = next(m for m in mirror.messages(address) if m["subject"] == "Удалить")
+    assert mg.delete_message(token, gone["id"])
+
+    # Инкрементальная синхронизация удалений не видит
+    mirror.sync(address, token, full=False)
+    assert len(mirror.messages(address)) == 2
+    mirror.sync(address, token, full=True)
+    assert subjects(mirror, address) == ["Оставить"]
+    mirror.close()
+
+
+def test_periodic_full_sync(inbox, fake, workdir, monkeypatch):
+    address, token = inbox
+    mirror = mg.MessageMirror(str(workdir / "mirror.db"))
+    fake.deliver(address, subject="Удалить")
+    mirror.sync(address, token)
+    assert mg.delete_message(token, mirror.messages(address)[0]["id"])
+
+    mirror.sync(address, token)
+    assert len(mirror.messages(address)) == 1     # сверка ещё не пора
+    monkeypatch.setattr(mg, "MIRROR_FULL_SYNC_INTERVAL", 0)
+    mirror.sync(address, token)
+    assert mirror.messages(address) == []
+    mirror.close()
+
+
+def test_failed_page_does_not_delete(inbox, fake, workdir, monkeypatch):
+    address, token = inbox
+    mirror = mg.MessageMirror(str(workdir / "mirror.db"))
+    for n in range(40):
+        fake.deliver(address, subject=f"Письмо {n}")
+    mirror.sync(address, token)
+    assert len(mirror.messages(address)) == 40
+
+    fetch_page = mg.get_messages_page
+    monkeypatch.setattr(mg, "get_messages_page",
+                        lambda token, page=1: None if page == 2 else fetch_page(token, page))
+    mirror.sync(address, token, full=True)
+    # Письма со второй страницы не загружены, но на сервере они есть
+    assert len(mirror.messages(address)) == 40
+
+    monkeypatch.setattr(mg, "get_messages_page", fetch_page)
+    mirror.sync(address, token, full=True)
+    assert len(mirror.messages(address)) == 40
+    mirror.close()
+
+
+def test_detail_cached(inbox, fake, workdir):
+    address, token = inbox
+    mirror = mg.MessageMirror(str(workdir / "mirror.db"))
+    fake.deliver(address, subject="Тема", text="Тело письма")
+    msg_id = mirror.sync(address, token)[0]["id"]
+    assert mirror.detail(address, token, msg_id)["text"] == "Тело письма"
+    before = fake.requests
+    assert mirror.detail(address, token, msg_id)["text"] == "Тело письма"
+    assert fake.requests == before
+    mirror.close()
@@ -0,0 +1,92 @@
+"""Мульти-мониторинг ящиков: общий планировщик, события и отступ при сбоях."""
+
+import threading
+import time
+
+import pytest
+
+import mail_generator as mg
+
+
+@pytest.fixture
+def fast_intervals(monkeypatch):
+    monkeypatch.setattr(mg, "WATCH_MIN_INTERVAL", 0.05)
+    monkeypatch.setattr(mg, "WATCH_MAX_INTERVAL", 0.3)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def make_accounts(fake, count):
+    accounts = []
+    for n in range(count):
+        address = f"multi{n}@{fake.domains[0]}"
+        data = mg.create_account(address, "secret")
+        accounts.append({"address": address, "password": "secret", "id": data["id"]})
+    return accounts
+
+
+def test_events_from_many_inboxes(api, fake, fast_intervals):
+    accounts = make_accounts(fake, 5)
+    fake.deliver(accounts[0]["address"], subject="Старое")
+    watcher = mg.MultiInboxWatcher(accounts, workers=3)
+    events = watcher.watch()
+    received = []
+
+    def consume():
+        for account, msg in events:
+            received.append((account["address"], msg["subject"]))
+            if len(received) == 2:
+                return
+
+    # Первый проход только запоминает уже лежащие письма
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    assert wait_until(lambda: all(s.seen_ids is not None for s in watcher._states))
+    fake.deliver(accounts[1]["address"], subject="Первое")
+    fake.deliver(accounts[4]["address"], subject="Второе")
+    thread.join(5)
+    events.close()
+
+    assert sorted(received) == [
+        (accounts[1]["address"], "Первое"),
+        (accounts[4]["address"], "Второе"),
+    ]
+
+
+def test_failed_poll_backs_off(api, fake, fast_intervals):
+    watcher = mg.MultiInboxWatcher(make_accounts(fake, 1))
+    state = watcher._states[0]
+    assert watcher._poll(state) == []
+
+    fake.error_rate = 1.0
+    result = watcher._poll(state)
+    assert result is None
+    watcher._reschedule(state, result)
+    assert state.failures == 1
+    assert state.interval == mg.WATCH_MAX_INTERVAL
+
+    fake.error_rate = 0.0
+    fake.deliver(state.account["address"], subject="После сбоя")
+    result = watcher._poll(state)
+    assert [m["subject"] for m in result] == ["После сбоя"]
+    watcher._reschedule(state, result)
+    assert state.failures == 0
+    assert state.interval == mg.WATCH_MIN_INTERVAL
+
+
+def test_quiet_inbox_polled_less_often(api, fake, fast_intervals):
+    watcher = mg.MultiInboxWatcher(make_accounts(fake, 1))
+    state = watcher._states[0]
+    intervals = []
+    for _ in range(6):
+        watcher._reschedule(state, watcher._poll(state))
+        intervals.append(state.interval)
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == mg.WATCH_MAX_INTERVAL
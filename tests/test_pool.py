@@ -0,0 +1,125 @@
+"""Пул готовых ящиков: аренда, пополнение, уборка и подхват после сбоя."""
+
+import json
+import time
+
+import pytest
+
+import mail_generator as mg
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture
+def make_pool(api, fake, workdir, monkeypatch):
+    monkeypatch.setattr(mg, "POOL_JANITOR_INTERVAL", 0.05)
+    pools = []
+
+    def make(size=2, start=True):
+        pool = mg.InboxPool(size=size, domain=fake.domains[0], workers=2,
+                            leases_path=str(workdir / "leases.jsonl"))
+        pools.append(pool)
+        if start:
+            pool.start()
+            assert wait_until(lambda: pool.status()["ready"] == size)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop()
+
+
+def crash(pool):
+    """Остановка потоков без уборки — как при аварийном завершении."""
+    pool._stopped.set()
+    with pool._cond:
+        pool._cond.notify_all()
+    for thread in pool._threads:
+        thread.join(5)
+    pool._threads = []
+    pool._leases.clear()
+
+
+def pooled():
+    return sorted(acc["address"] for acc in mg.iter_accounts() if acc.get("pool"))
+
+
+def test_lease_refill_and_release(make_pool, fake):
+    pool = make_pool(size=2)
+    lease = pool.lease()
+    assert fake._account_for(lease["token"])["address"] == lease["address"]
+    # Пул пополняется до прежнего размера
+    assert wait_until(lambda: pool.status()["ready"] == 2)
+    assert pool.status()["leases"] == 1
+
+    assert pool.release(lease["lease_id"])
+    assert not pool.release(lease["lease_id"])
+    assert wait_until(lambda: lease["address"] not in pooled())
+    assert lease["address"] not in {a["address"] for a in fake._accounts.values()}
+    assert wait_until(lambda: pool.stats["retired"] == 1)
+
+
+def test_empty_pool_waits_then_gives_up(make_pool, fake):
+    pool = make_pool(size=1)
+    assert pool.lease()
+    fake.error_rate = 1.0           # пополнение не удаётся
+    started = time.monotonic()
+    assert pool.lease(wait=0.2) is None
+    assert time.monotonic() - started >= 0.2
+
+
+def test_expired_lease_retired(make_pool):
+    pool = make_pool(size=1)
+    pool.lease_ttl = 0
+    lease = pool.lease()
+    assert wait_until(lambda: lease["address"] not in pooled())
+    assert pool.status()["leases"] == 0
+
+
+def test_restart_adopts_only_unused_inboxes(make_pool, fake):
+    pool = make_pool(size=3)
+    leased = pool.lease()["address"]
+    assert wait_until(lambda: pool.status()["ready"] == 3)
+    crash(pool)
+    used = next(a for a in pooled() if a != leased)
+    fake.deliver(used, subject="Письмо до перезапуска")
+
+    restarted = make_pool(size=3, start=False)
+    restarted._adopt()
+    assert restarted.stats["adopted"] == 2
+    ready = {account["address"] for account, _, _ in restarted._ready}
+    assert leased not in ready and used not in ready
+    assert {acc["address"] for acc in restarted._retiring} == {leased, used}
+
+    with open(restarted.leases_path, encoding="utf-8") as f:
+        assert [json.loads(line)["address"] for line in f] == [leased]
+
+    restarted._retire_pending()
+    assert leased not in pooled() and used not in pooled()
+    # Журнал выдач сокращается до аккаунтов, ещё лежащих в хранилище
+    assert restarted._load_leased(set(pooled())) == set()
+    with open(restarted.leases_path, encoding="utf-8") as f:
+        assert f.read() == ""
+
+
+def test_http_endpoint(make_pool, workdir):
+    pool = make_pool(size=1)
+    endpoint = f"unix:{workdir / 'pool.sock'}"
+    server = mg.serve_pool(pool, endpoint)
+    try:
+        status, lease = mg.pool_request("POST", "/lease?wait=1", endpoint)
+        assert status == 200 and lease["address"]
+        status, body = mg.pool_request("GET", "/status", endpoint)
+        assert status == 200 and body["leases"] == 1
+        assert mg.pool_request("POST", f"/release/{lease['lease_id']}", endpoint)[0] == 204
+        assert mg.pool_request("POST", "/release/unknown", endpoint)[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
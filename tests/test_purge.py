@@ -0,0 +1,90 @@
+"""Очистка ящиков: отбор писем по фильтрам и параллельное удаление."""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import mail_generator as mg
+
+
+def make_inbox(fake, name, letters):
+    address = f"{name}@{fake.domains[0]}"
+    data = mg.create_account(address, "secret")
+    mg.add_account({"id": data["id"], "address": address, "password": "secret"})
+    for sender, subject in letters:
+        fake.deliver(address, subject=subject, sender=sender)
+    return address
+
+
+def subjects(address):
+    token = mg.get_token(address, "secret")
+    return sorted(m["subject"] for m in mg.iter_messages(token))
+
+
+def test_filter_messages():
+    now = datetime.now(timezone.utc)
+    messages = [
+        {"from": {"address": "news@shop.test"}, "subject": "Скидки",
+         "createdAt": (now - timedelta(days=3)).isoformat()},
+        {"from": {"address": "bot@bank.test"}, "subject": "Код входа",
+         "createdAt": now.isoformat()},
+        {"from": {"address": "promo@SHOP.test"}, "subject": "СКИДКИ недели",
+         "createdAt": now.isoformat()},
+    ]
+
+    def pick(**filters):
+        return [m["subject"] for m in mg.filter_messages(messages, **filters)]
+
+    assert pick(sender="*@shop.test") == ["Скидки", "СКИДКИ недели"]
+    assert pick(subject="скидки") == ["Скидки", "СКИДКИ недели"]
+    assert pick(older_than=timedelta(days=1)) == ["Скидки"]
+    assert pick(sender="*@shop.test", older_than=timedelta(days=1)) == ["Скидки"]
+
+
+def test_purge_many_pages(api, fake):
+    letters = [("news@shop.test", f"Рассылка {n}") for n in range(45)]
+    letters += [("bot@bank.test", "Код входа")]
+    address = make_inbox(fake, "busy", letters)
+    mg.get_mirror().sync(address, mg.get_token(address, "secret"))
+
+    stats = mg.purge_messages(mg.iter_accounts(), sender="*@shop.test", workers=4)
+    assert (stats["inboxes"], stats["matched"], stats["deleted"], stats["failed"]) == (1, 45, 45, 0)
+    # Удаления не сдвигают страницы под обходом: не пропущено ни одного письма
+    assert subjects(address) == ["Код входа"]
+    assert [m["subject"] for m in mg.get_mirror().messages(address)] == ["Код входа"]
+
+
+def test_dry_run_deletes_nothing(api, fake):
+    address = make_inbox(fake, "dry", [("a@x.test", "Первое"), ("b@x.test", "Второе")])
+    seen = []
+    stats = mg.purge_messages(mg.iter_accounts(), subject="перв", dry_run=True,
+                              on_result=lambda addr, msg, deleted: seen.append(deleted))
+    assert stats["matched"] == 1 and stats["deleted"] == 0
+    assert seen == [None]
+    assert subjects(address) == ["Второе", "Первое"]
+
+
+def test_unreachable_inbox_counted(api, fake):
+    make_inbox(fake, "kept", [("a@x.test", "Письмо")])
+    gone = make_inbox(fake, "gone", [])
+    fake.delete_account(mg.find_account(gone)["id"])
+    stats = mg.purge_messages(mg.iter_accounts())
+    assert (stats["inboxes"], stats["unreachable"], stats["deleted"]) == (1, 1, 1)
+
+
+def test_cli(api, fake, capsys):
+    first = make_inbox(fake, "first", [("news@shop.test", "Скидки"), ("me@x.test", "Личное")])
+    second = make_inbox(fake, "second", [("news@shop.test", "Скидки")])
+    assert mg.run_cli(["purge", "--all", "--sender", "news@*"]) == 0
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert sorted(r["address"] for r in records) == sorted([first, second])
+    assert all(r["deleted"] for r in records)
+    assert subjects(first) == ["Личное"]
+    assert subjects(second) == []
+
+
+def test_cli_errors(api, fake, capsys):
+    address = make_inbox(fake, "safe", [("a@x.test", "Письмо")])
+    assert mg.run_cli(["purge", "--all", "--older-than", "week"]) == 2
+    assert "--older-than" in capsys.readouterr().err
+    assert mg.run_cli(["purge", "nobody@example.test"]) == 1
+    assert subjects(address) == ["Письмо"]
@@ -0,0 +1,65 @@
+"""Token bucket и массовое создание аккаунтов под общим rate limit."""
+
+import threading
+import time
+
+import mail_generator as mg
+
+
+def test_token_bucket_limits_rate():
+    bucket = mg.TokenBucket(rate=50)
+    started = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    # Первый токен есть сразу, остальные 10 — по одному на 20 мс
+    assert time.monotonic() - started >= 0.19
+
+
+def test_token_bucket_pause_blocks_all_threads():
+    bucket = mg.TokenBucket(rate=1000)
+    bucket.pause(0.2)
+    waits = []
+    threads = [threading.Thread(target=lambda: waits.append(bucket.acquire()))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(waits) == 4
+    assert min(waits) >= 0.15
+
+
+def test_client_rate_limit(api, fake):
+    api.rate_limiter = mg.TokenBucket(rate=40)
+    started = time.monotonic()
+    for _ in range(9):
+        assert api.get("/domains").status_code == 200
+    assert time.monotonic() - started >= 0.19
+
+
+def test_bulk_creation_under_rate_limit(api, fake):
+    api.rate_limiter = mg.TokenBucket(rate=100)
+    started = time.monotonic()
+    results = list(mg.create_accounts_bulk(30, workers=6))
+    elapsed = time.monotonic() - started
+
+    created = [data for _, data in results if data]
+    assert len(created) == 30
+    assert len({acc["address"] for acc in created}) == 30
+    # 30 запросов при 100/с: первый токен сразу, остальные — по 10 мс
+    assert elapsed >= 0.28
+    assert len(fake._accounts) == 30
+    assert sorted(a["address"] for a in mg.load_accounts()) == \
+        sorted(acc["address"] for acc in created)
+
+
+def test_bulk_creation_stays_under_server_limit(api, fake):
+    fake.rate_limit = 100
+    api.rate_limiter = mg.TokenBucket(rate=50)
+    before = mg.metrics.value("mailtm_retries_total", endpoint="POST /accounts", reason="429")
+    results = list(mg.create_accounts_bulk(20, workers=8))
+    assert all(data for _, data in results)
+    assert len(fake._accounts) == 20
+    # Общий лимит клиента ниже серверного: 8 потоков не упираются в 429
+    assert mg.metrics.value("mailtm_retries_total", endpoint="POST /accounts",
+                            reason="429") - before <= 1
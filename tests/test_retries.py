@@ -0,0 +1,198 @@
+"""Повторы запросов, пауза по 429 и circuit breaker эндпоинтов."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+import mail_generator as mg
+
+
+def retries(endpoint, reason):
+    return mg.metrics.value("mailtm_retries_total", endpoint=endpoint, reason=reason)
+
+
+def throttle(fake, rate=0.5):
+    """Следующий запрос к заглушке получит 429."""
+    fake.rate_limit = rate
+    fake._bucket_tokens = 0.0
+    fake._bucket_updated = time.monotonic()
+
+
+# ── Повторы ──
+
+def retries_5xx(endpoint):
+    return sum(retries(endpoint, str(status)) for status in (500, 502, 503))
+
+
+def test_idempotent_5xx_retried_up_to_limit(api, fake):
+    fake.error_rate = 1.0
+    before = retries_5xx("GET /domains")
+    resp = api.get("/domains")
+    assert resp.status_code >= 500
+    assert fake.requests == api.retries
+    assert retries_5xx("GET /domains") - before == api.retries - 1
+
+
+def test_5xx_then_success(api, fake, monkeypatch):
+    fake.error_rate = 1.0
+    monkeypatch.setattr(mg, "backoff_delay", lambda attempt, **kwargs: 0.2)
+    timer = threading.Timer(0.05, setattr, (fake, "error_rate", 0.0))
+    timer.start()
+    try:
+        resp = api.get("/domains")
+    finally:
+        timer.cancel()
+    assert resp.status_code == 200
+    assert fake.requests == 2
+
+
+def test_post_not_retried_on_5xx(api, fake):
+    fake.error_rate = 1.0
+    resp = api.post("/accounts", json={"address": f"x@{fake.domains[0]}", "password": "pw"})
+    assert resp.status_code >= 500
+    assert fake.requests == 1
+
+
+def test_429_honours_retry_after(api, fake):
+    api.rate_limiter = mg.TokenBucket(1000)
+    throttle(fake, rate=2)
+    before = retries("GET /domains", "429")
+    started = time.monotonic()
+    resp = api.get("/domains")
+    assert resp.status_code == 200
+    assert fake.requests == 2
+    # Retry-After: 1 — пауза и у запроса, и у общего token bucket
+    assert time.monotonic() - started >= 0.95
+    assert api.rate_limiter._paused_until > started
+    assert retries("GET /domains", "429") - before == 1
+
+
+def test_429_retried_for_post(api, fake):
+    throttle(fake, rate=2)
+    address = f"limited@{fake.domains[0]}"
+    assert mg.create_account(address, "secret")["address"] == address
+    assert fake.requests == 2
+
+
+def test_429_returned_when_retries_exhausted(api, fake):
+    api.retries = 1
+    throttle(fake)
+    resp = api.get("/domains")
+    assert resp.status_code == 429
+    assert fake.requests == 1
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_429_with_long_retry_after_returned(api, fake):
+    api.rate_limiter = mg.TokenBucket(1000)
+    throttle(fake, rate=0.01)           # Retry-After: 100 > API_RETRY_CAP
+    started = time.monotonic()
+    resp = api.get("/domains")
+    assert resp.status_code == 429
+    assert fake.requests == 1
+    assert time.monotonic() - started < 1
+    # Общий лимит не заморожен
+    assert api.rate_limiter._paused_until <= time.monotonic()
+
+
+def test_post_retried_when_connection_refused(api):
+    refused = mg.MailTmClient(f"http://127.0.0.1:{free_port()}", rate_limit=0)
+    endpoint = "POST /accounts"
+    before = retries(endpoint, "network")
+    try:
+        with pytest.raises(mg.requests.ConnectionError):
+            refused.post("/accounts", json={"address": "x@y.test", "password": "pw"})
+    finally:
+        refused.close()
+    assert retries(endpoint, "network") - before == refused.retries - 1
+
+
+def test_post_not_retried_after_read_timeout(api, fake):
+    slow = mg.MailTmClient(fake.base_url, rate_limit=0, timeout=0.1)
+    fake.latency = 0.3
+    before = retries("POST /accounts", "network")
+    try:
+        with pytest.raises(mg.requests.Timeout):
+            slow.post("/accounts", json={"address": f"x@{fake.domains[0]}", "password": "pw"})
+    finally:
+        slow.close()
+    # Сервер мог обработать запрос — повтор создал бы аккаунт дважды
+    time.sleep(0.3)
+    assert fake.requests == 1
+    assert retries("POST /accounts", "network") == before
+
+
+# ── Circuit breaker ──
+
+def open_breaker(api, fake, endpoint="GET /domains"):
+    breaker = api.breaker(endpoint)
+    breaker.threshold = 2
+    breaker.reset_timeout = 0.1
+    fake.error_rate = 1.0
+    api.retries = 2
+    assert api.get("/domains").status_code >= 500
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_breaker_opens_and_answers_locally(api, fake):
+    open_breaker(api, fake)
+    before = mg.metrics.value("mailtm_circuit_open_total", endpoint="GET /domains")
+    requests_before = fake.requests
+    resp = api.get("/domains")
+    assert resp.status_code == 503
+    assert resp.reason == "Circuit Open"
+    assert fake.requests == requests_before
+    assert mg.metrics.value("mailtm_circuit_open_total", endpoint="GET /domains") == before + 1
+    # Другие эндпоинты не затронуты
+    fake.error_rate = 0.0
+    assert api.get("/me").status_code == 401
+
+
+def test_breaker_closes_after_successful_probe(api, fake):
+    breaker = open_breaker(api, fake)
+    fake.error_rate = 0.0
+    time.sleep(breaker.reset_timeout)
+    assert api.get("/domains").status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_breaker_reopens_after_failed_probe(api, fake):
+    breaker = open_breaker(api, fake)
+    time.sleep(breaker.reset_timeout)
+    requests_before = fake.requests
+    assert api.get("/domains").status_code >= 500
+    # Проба одна: после её неудачи цепь снова разомкнута
+    assert fake.requests == requests_before + 1
+    assert breaker.state == "open"
+
+
+def test_breaker_probe_answered_with_429_closes(api, fake):
+    breaker = open_breaker(api, fake)
+    fake.error_rate = 0.0
+    api.retries = 1
+    time.sleep(breaker.reset_timeout)
+    throttle(fake)
+    assert api.get("/domains").status_code == 429
+    assert breaker.state == "closed"
+    fake.rate_limit = None
+    assert api.get("/domains").status_code == 200
+
+
+def test_breaker_probe_retried_after_lost_probe():
+    breaker = mg.CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.05)
+    assert breaker.allow()              # проба, результат которой не учтён
+    assert not breaker.allow()
+    time.sleep(0.05)
+    assert breaker.allow()
+
@@ -0,0 +1,87 @@
+"""Несколько API: маршрутизация по домену, веса и исключение нездоровых."""
+
+from collections import Counter
+
+import pytest
+
+import mail_generator as mg
+from fake_mailtm import FakeMailTm
+
+
+@pytest.fixture
+def shards(workdir, monkeypatch):
+    servers = [FakeMailTm(domains=["one.test"], seed=1),
+               FakeMailTm(domains=["two.test", "shared.test"], seed=2)]
+    for server in servers:
+        server.start()
+    sharded = mg.ShardedClient.from_specs([f"{s.base_url}=0" for s in servers])
+    monkeypatch.setattr(mg, "client", sharded)
+    monkeypatch.setattr(mg, "backoff_delay", lambda attempt, **kwargs: 0.001)
+    yield servers
+    sharded.close()
+    for server in servers:
+        server.stop()
+
+
+def test_weighted_round_robin_is_smooth():
+    rr = mg._WeightedRoundRobin({"a": 5, "b": 1, "c": 1})
+    picks = [rr.next() for _ in range(14)]
+    assert Counter(picks) == {"a": 10, "b": 2, "c": 2}
+    # Тяжёлый элемент перемежается с лёгкими, а не идёт серией
+    assert "".join(picks[:7]) == "aabacaa"
+    assert {rr.next({"b", "c"}) for _ in range(4)} == {"b", "c"}
+    assert rr.next(set()) is None
+
+
+def test_domain_rotator():
+    rotator = mg.DomainRotator(["x.test", "y.test"])
+    assert [rotator.next() for _ in range(4)] == ["x.test", "y.test"] * 2
+    weighted = mg.DomainRotator(["x.test", "y.test"], strategy="weighted",
+                                weights={"x.test": 3, "y.test": 1})
+    assert Counter(weighted.next() for _ in range(8)) == {"x.test": 6, "y.test": 2}
+    with pytest.raises(ValueError):
+        mg.DomainRotator([])
+
+
+def test_domains_from_every_api(shards):
+    assert mg.get_available_domains() == ["one.test", "shared.test", "two.test"]
+
+
+def test_requests_routed_by_domain(shards):
+    for address in ("a@one.test", "b@two.test"):
+        assert mg.create_account(address, "secret")
+    assert [a["address"] for a in shards[0]._accounts.values()] == ["a@one.test"]
+    assert [a["address"] for a in shards[1]._accounts.values()] == ["b@two.test"]
+
+    # Запросы с токеном идут на API, где живёт аккаунт
+    for address in ("a@one.test", "b@two.test"):
+        token = mg.get_token(address, "secret")
+        assert mg.client.get("/me", token=token).json()["address"] == address
+
+
+def test_weighted_domains_follow_api_limits(shards):
+    mg.client.shards[1].weight = 3
+    weights = mg.client.domain_weights(["one.test", "two.test"])
+    assert weights == {"one.test": 1, "two.test": 3}
+    rotator = mg.DomainRotator(["one.test", "two.test"], strategy="weighted")
+    assert Counter(rotator.next() for _ in range(8)) == {"one.test": 2, "two.test": 6}
+
+
+def test_unhealthy_api_skipped(shards, monkeypatch):
+    monkeypatch.setattr(mg, "SHARD_FAILURE_THRESHOLD", 2)
+    first, second = mg.client.shards
+    second.domains = {"shared.test"}
+    first.domains = {"one.test", "shared.test"}
+    assert {mg.client.pick("shared.test") for _ in range(4)} == {first, second}
+
+    shards[0].error_rate = 1.0
+    first.client.retries = 1
+    payload = {"address": "a@one.test", "password": "secret"}
+    for _ in range(2):
+        assert mg.client.post("/token", json=payload).status_code >= 500
+    assert not first.healthy()
+    assert {mg.client.pick("shared.test") for _ in range(4)} == {second}
+    assert mg.metrics.value("mailtm_shard_healthy", shard=first.base_url) == 0
+    # Когда нездоровы все — выбор среди всех, а не отказ
+    second.unhealthy_until = first.unhealthy_until
+    assert {mg.client.pick("shared.test") for _ in range(4)} == {first, second}
@@ -0,0 +1,98 @@
+"""Проверка аккаунтов на сервере и уборка мёртвых."""
+
+import json
+
+import mail_generator as mg
+
+
+def make_accounts(fake, names):
+    accounts = []
+    for name in names:
+        address = f"{name}@{fake.domains[0]}"
+        data = mg.create_account(address, "secret")
+        account = {"id": data["id"], "address": address, "password": "secret"}
+        mg.add_account(account)
+        accounts.append(account)
+    return accounts
+
+
+def stored():
+    return {acc["address"]: acc for acc in mg.load_accounts()}
+
+
+def quarantined():
+    try:
+        with open(mg.QUARANTINE_FILE, encoding="utf-8") as f:
+            return [json.loads(line)["address"] for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def test_dead_accounts_quarantined(api, fake):
+    alive, dead = make_accounts(fake, ["alive", "dead"])
+    fake.delete_account(dead["id"])
+    stats = mg.sweep_accounts(mg.iter_accounts(), workers=2)
+    assert (stats["ok"], stats["dead"], stats["error"]) == (1, 1, 0)
+    assert stats["dead_addresses"] == [dead["address"]]
+
+    accounts = stored()
+    assert list(accounts) == [alive["address"]]
+    assert accounts[alive["address"]]["health"] == "ok"
+    assert accounts[alive["address"]]["verified_at"]
+    assert quarantined() == [dead["address"]]
+    assert mg.metrics.value("mailtm_sweep_accounts_total", result="dead") >= 1
+
+
+def test_prune_and_dry_run(api, fake):
+    (dead,) = make_accounts(fake, ["gone"])
+    fake.delete_account(dead["id"])
+    stats = mg.sweep_accounts(mg.iter_accounts(), dry_run=True)
+    assert stats["dead"] == 1
+    assert "health" not in stored()[dead["address"]]
+
+    mg.sweep_accounts(mg.iter_accounts(), prune=True)
+    assert stored() == {}
+    assert quarantined() == []
+
+
+def test_server_errors_keep_account(api, fake):
+    (account,) = make_accounts(fake, ["flaky"])
+    fake.error_rate = 1.0
+    stats = mg.sweep_accounts(mg.iter_accounts())
+    assert stats["error"] == 1
+    record = stored()[account["address"]]
+    assert record["health"] == "error"
+    assert "verified_at" not in record
+
+
+def test_store_writable_during_sweep(api, fake):
+    make_accounts(fake, [f"sweep{n}" for n in range(6)])
+    added = []
+
+    def on_result(account, health):
+        # Обход хранилища не держит блокировку, пока идёт проверка
+        if not added:
+            added.append({"address": f"late@{fake.domains[0]}", "password": "x", "id": "late"})
+            mg.add_account(added[0])
+
+    stats = mg.sweep_accounts(mg.iter_accounts(), workers=2, on_result=on_result)
+    assert stats["checked"] == 6
+    assert added[0]["address"] in stored()
+
+
+def test_cli_unverified_for(api, fake, capsys):
+    make_accounts(fake, ["a", "b"])
+    assert mg.run_cli(["sweep"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 2
+    assert mg.run_cli(["sweep", "--unverified-for", "1h"]) == 0
+    assert capsys.readouterr().out == ""
+
+
+def test_cli_bad_durations(api, fake, capsys):
+    make_accounts(fake, ["a"])
+    before = fake.requests
+    assert mg.run_cli(["sweep", "--older-than", "week"]) == 2
+    assert "--older-than" in capsys.readouterr().err
+    assert mg.run_cli(["sweep", "--unverified-for", "soon"]) == 2
+    assert "--unverified-for" in capsys.readouterr().err
+    assert fake.requests == before
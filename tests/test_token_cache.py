@@ -0,0 +1,70 @@
+"""Кэш JWT: повторное использование, срок действия, 401 и размер карт."""
+
+import mail_generator as mg
+
+
+def make_account(fake, name="cached"):
+    address = f"{name}@{fake.domains[0]}"
+    assert mg.create_account(address, "secret")
+    return address
+
+
+def test_valid_token_reused(api, fake):
+    address = make_account(fake)
+    token = mg.token_cache.get(address, "secret")
+    before = fake.requests
+    assert mg.token_cache.get(address, "secret") == token
+    assert fake.requests == before
+    assert mg.token_cache.address_of(token) == address
+
+
+def test_token_near_expiry_renewed(api, fake):
+    fake.token_ttl = 30                 # меньше TOKEN_REFRESH_MARGIN
+    address = make_account(fake)
+    mg.token_cache.get(address, "secret")
+    before = fake.requests
+    mg.token_cache.get(address, "secret")
+    assert fake.requests == before + 1
+
+
+def test_tokens_persist_between_runs(api, fake, workdir):
+    address = make_account(fake)
+    cache = mg.TokenCache(path=str(workdir / "tokens.json"), persist=True)
+    token = cache.get(address, "secret")
+    cache.save()
+
+    restored = mg.TokenCache(path=str(workdir / "tokens.json"), persist=True)
+    before = fake.requests
+    assert restored.get(address, "secret") == token
+    assert fake.requests == before
+
+
+def test_rejected_token_refreshed_on_401(api, fake):
+    address = make_account(fake)
+    token = mg.token_cache.get(address, "secret")
+    fake.deliver(address, subject="После 401")
+    fake._tokens.clear()                # сервер отозвал все токены
+    assert [m["subject"] for m in mg.get_messages(token)] == ["После 401"]
+    new_token = mg.token_cache.get(address, "secret")
+    assert new_token != token
+    assert fake._account_for(new_token)
+
+
+def test_credential_maps_do_not_grow(api, fake):
+    address = make_account(fake)
+    token = mg.token_cache.get(address, "secret")
+    tokens = [token]
+    for _ in range(20):
+        token = mg.token_cache.refresh(token)
+        tokens.append(token)
+    assert len(set(tokens)) == len(tokens)
+    # Текущий токен и заменённый им — не больше двух на адрес
+    assert len(mg.token_cache._owners) <= 2
+    assert len(mg.token_cache._passwords) == 1
+    # Поток, получивший 401 с заменённым токеном, получает текущий
+    assert mg.token_cache.refresh(tokens[-2]) == tokens[-1]
+    assert mg.token_cache.refresh(tokens[0]) is None
+
+    mg.token_cache.invalidate(address)
+    assert mg.token_cache._owners == {}
+    assert mg.token_cache._passwords == {}
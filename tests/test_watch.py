@@ -0,0 +1,114 @@
+"""Новые письма через Mercure SSE: доставка, переподключение и остановка."""
+
+import threading
+import time
+
+import mail_generator as mg
+
+
+def create_inbox(fake, name="watched"):
+    address = f"{name}@{fake.domains[0]}"
+    account = mg.create_account(address, "secret")
+    return address, account["id"], mg.get_token(address, "secret")
+
+
+def start_watcher(fake, token, account_id, stop):
+    received = []
+    streaming = threading.Event()
+
+    def status(state):
+        if state == "stream":
+            streaming.set()
+
+    def run():
+        for msg in mg.watch_inbox(token, account_id, set(), mercure_url=fake.mercure_url,
+                                  poll_interval=60, on_status=status, stop=stop):
+            received.append(msg)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert streaming.wait(5)
+    return thread, received
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_watch_inbox_stream_delivery_and_stop(api, fake):
+    address, account_id, token = create_inbox(fake)
+    stop = mg.WatchStop()
+    thread, received = start_watcher(fake, token, account_id, stop)
+
+    fake.deliver(address, subject="Первое")
+    fake.deliver(address, subject="Второе")
+    assert wait_until(lambda: len(received) == 2)
+    assert [m["subject"] for m in received] == ["Первое", "Второе"]
+
+    started = time.monotonic()
+    stop.set()
+    thread.join(2)
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 2
+    assert wait_until(lambda: fake.subscriber_count() == 0)
+
+
+def test_watch_inbox_reconnects_after_stream_closed(api, fake, monkeypatch):
+    monkeypatch.setattr(mg, "SSE_BACKOFF_MIN", 0.05)
+    address, account_id, token = create_inbox(fake, "reconnect")
+    stop = mg.WatchStop()
+    states = []
+    received = []
+
+    def run():
+        for msg in mg.watch_inbox(token, account_id, set(), mercure_url=fake.mercure_url,
+                                  poll_interval=60, on_status=states.append, stop=stop):
+            received.append(msg)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert wait_until(lambda: fake.subscriber_count() == 1)
+
+    # Хаб закрыл поток; письмо приходит, пока подписки нет
+    with fake._lock:
+        for q in fake._subscribers[account_id]:
+            q.put(None)
+    fake.deliver(address, subject="Во время разрыва")
+    assert wait_until(lambda: states.count("stream") == 2)
+    fake.deliver(address, subject="После разрыва")
+    assert wait_until(lambda: len(received) == 2)
+    assert [m["subject"] for m in received] == ["Во время разрыва", "После разрыва"]
+
+    stop.set()
+    thread.join(2)
+    assert not thread.is_alive()
+
+
+def test_watch_inbox_polls_without_stream_and_stops(api, fake, monkeypatch):
+    address, account_id, token = create_inbox(fake, "polled")
+    monkeypatch.setattr(mg, "SSE_BACKOFF_MIN", 30)
+    stop = mg.WatchStop()
+    states = []
+    received = []
+
+    def run():
+        for msg in mg.watch_inbox(token, account_id, set(),
+                                  mercure_url=f"{fake.base_url}/no-hub",
+                                  poll_interval=0.05, on_status=states.append, stop=stop):
+            received.append(msg)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert wait_until(lambda: "polling" in states)
+    fake.deliver(address, subject="Опрос")
+    assert wait_until(lambda: len(received) == 1)
+
+    # Остановка прерывает паузу опроса, не дожидаясь переподключения
+    stop.set()
+    thread.join(2)
+    assert not thread.is_alive()